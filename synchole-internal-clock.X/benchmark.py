@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Benchmark the HEX -> SysEx -> HTML pipeline
+
+Synthetic Intel HEX images, from the 2 KB SYNCHOLE size up to a full
+16 KB and larger sparse multi-segment files, are timed through each
+stage separately: parse (hextosyx.parse_hex), reset vector reformat
+(fix_reset_vec), encode (encode_sysex) and embed (embed-firmwares.py's
+write_page over libraries of 50 to 5,000 variants). Results are saved
+as JSON and can be compared against an earlier run:
+
+    ./benchmark.py -o before.json
+    ./benchmark.py --compare before.json          # exits 1 on a regression
+    ./benchmark.py --quick
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import hextosyx
+from hextosyx import hex_record
+
+RESULTS_VERSION = 1
+
+# (name, image bytes, segments, memory size passed to parse_hex)
+IMAGES = [
+    ('synchole-2k', 2 * 1024, 1, hextosyx.MEMORY_SIZE),
+    ('full-16k', 16 * 1024, 1, hextosyx.MEMORY_SIZE),
+    ('sparse-64k', 16 * 1024, 8, None),
+    ('sparse-256k', 64 * 1024, 32, None),
+]
+LIBRARY_SIZES = [50, 500, 5000]
+QUICK_LIBRARY_SIZES = [50, 500]
+
+REGRESSION_PCT = 10.0
+# Changes smaller than this are timer noise, whatever the percentage
+NOISE_FLOOR_S = 50e-6
+
+
+def synthetic_hex(size, segments=1, seed=0, span=None):
+    """Intel HEX text for a random program image of size bytes
+
+    The image is split into segments spread evenly over span bytes (the
+    size itself when there is one segment), written as 16 byte records
+    with extended linear address records wherever a segment crosses a
+    64 KB boundary. Like an MPLAB X build it starts with the double reset
+    vector and ends with the config words at 0x1000E. Returns (text,
+    number of data records).
+    """
+    rng = random.Random(seed)
+    span = span or (size if segments == 1 else size * 4)
+    seg_bytes = size // segments // 16 * 16
+    stride = span // segments // 16 * 16
+    lines = []
+    records = 0
+    upper = 0
+    for seg in range(segments):
+        start = seg * stride
+        words = [rng.randrange(0x4000) for _ in range(seg_bytes // 2)]
+        data = b''.join(w.to_bytes(2, 'little') for w in words)
+        if seg == 0:
+            data = bytes([0x80, 0x31, 0x02, 0x28]) + data[4:]
+        for offset in range(0, len(data), 16):
+            addr = start + offset
+            if addr >> 16 != upper or not lines:
+                upper = addr >> 16
+                lines.append(hex_record(0, 4, upper.to_bytes(2, 'big')))
+            lines.append(hex_record(addr & 0xFFFF, 0, data[offset:offset + 16]))
+            records += 1
+    lines.append(hex_record(0, 4, b'\x00\x01'))
+    lines.append(hex_record(0x000E, 0, b'\xa4\x39\xff\x3f'))
+    lines.append(hex_record(0, 1))
+    return '\n'.join(lines) + '\n', records
+
+
+def write_library(directory, count, product, seed=0):
+    """Write count unique SYNCHOLE-sized .syx variants, return their total size
+
+    Each variant patches one word of a base image, as a BPM or serial
+    variant would, and is named like a BPM build so the embedder picks
+    it up.
+    """
+    text, _ = synthetic_hex(2 * 1024, seed=seed)
+    memory, max_addr = hextosyx.parse_hex(io.StringIO(text))
+    hextosyx.fix_reset_vec(memory)
+    total = 0
+    for n in range(count):
+        variant = memory.copy()
+        variant[0x3E:0x40] = (n % 0x3FFF).to_bytes(2, 'little')
+        variant[0x40:0x42] = (n // 0x3FFF).to_bytes(2, 'little')
+        data = hextosyx.encode_sysex(variant, max_addr, product['id'], product['block_size'])
+        (Path(directory) / f"synchole-{n + 1}bpm.syx").write_bytes(data)
+        total += len(data)
+    return total
+
+
+def measure(func, repeat):
+    """Time func() repeat times, then once more under tracemalloc
+
+    Returns best and median wall seconds, CPU seconds of the best run and
+    the peak traced memory in bytes.
+    """
+    walls = []
+    cpus = []
+    for _ in range(repeat):
+        cpu = time.process_time()
+        start = time.perf_counter()
+        func()
+        walls.append(time.perf_counter() - start)
+        cpus.append(time.process_time() - cpu)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    best = min(range(repeat), key=walls.__getitem__)
+    return {'best_s': walls[best], 'median_s': statistics.median(walls),
+            'cpu_s': cpus[best], 'peak_bytes': peak}
+
+
+def throughput(result, count=None, nbytes=None, unit='records'):
+    """Add <unit>/s and MB/s (from the best run) to a measure() result"""
+    seconds = max(result['best_s'], 1e-9)
+    if count is not None:
+        result[f'{unit}_per_s'] = count / seconds
+    if nbytes is not None:
+        result['mb_per_s'] = nbytes / seconds / 1e6
+    return result
+
+
+def bench_image(size, segments, memory_size, product, repeat):
+    """Time parse, reformat and encode for one synthetic image"""
+    text, records = synthetic_hex(size, segments)
+    lines = text.splitlines()
+    memory, max_addr = hextosyx.parse_hex(lines, None, memory_size)
+    copies = []
+
+    def parse():
+        hextosyx.parse_hex(lines, None, memory_size)
+
+    def reformat():
+        hextosyx.fix_reset_vec(copies.pop())
+
+    def encode():
+        hextosyx.encode_sysex(memory, max_addr, product['id'], product['block_size'])
+
+    results = {'parse': throughput(measure(parse, repeat), records, len(text))}
+    # Each reformat needs an unfixed image; copying them isn't timed
+    copies.extend(memory.copy() for _ in range(repeat + 1))
+    results['reformat'] = measure(reformat, repeat)
+    hextosyx.fix_reset_vec(memory)
+    results['encode'] = throughput(measure(encode, repeat), max_addr // 2, max_addr, 'words')
+    for stage in results.values():
+        stage['image_bytes'] = max_addr
+    return results
+
+
+def bench_embed(count, product, repeat):
+    """Time writing the page for a library of count variants"""
+    embed = importlib.import_module('embed-firmwares')
+    with tempfile.TemporaryDirectory(prefix="synchole-bench-") as directory:
+        total = write_library(directory, count, product)
+        library = embed.scan_library(Path(directory))
+
+        def run():
+            # A fresh manifest each time, so every payload is encoded
+            out = io.StringIO()
+            with contextlib.redirect_stdout(io.StringIO()):
+                embed.write_page(out, library, embed.PayloadEncoder(),
+                                 embed.EmbedManifest(None))
+            run.page_bytes = out.tell()
+
+        result = throughput(measure(run, repeat), count, total, 'files')
+        result['syx_bytes'] = total
+        result['page_bytes'] = run.page_bytes
+        return result
+
+
+def compare(results, baseline, threshold=REGRESSION_PCT):
+    """Stages whose best time grew by more than threshold percent
+
+    Changes under NOISE_FLOOR_S are ignored. Returns a list of (case,
+    stage, old seconds, new seconds, change %).
+    """
+    regressions = []
+    for case, stages in results['cases'].items():
+        for stage, result in stages.items():
+            old = baseline.get('cases', {}).get(case, {}).get(stage)
+            if not old:
+                continue
+            change = 100.0 * (result['best_s'] - old['best_s']) / max(old['best_s'], 1e-9)
+            if change > threshold and result['best_s'] - old['best_s'] > NOISE_FLOOR_S:
+                regressions.append((case, stage, old['best_s'], result['best_s'], change))
+    return regressions
+
+
+def format_rate(result):
+    parts = [f"{value:,.0f} {key[:-6]}/s" for key, value in result.items()
+             if key.endswith('_per_s') and key != 'mb_per_s']
+    if 'mb_per_s' in result:
+        parts.append(f"{result['mb_per_s']:.1f} MB/s")
+    return ", ".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark HEX parsing, SysEx encoding and page embedding")
+    parser.add_argument('-o', '--output', help="save the results as JSON")
+    parser.add_argument('--compare', metavar='JSON',
+                        help="flag stages slower than in an earlier results file")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_PCT,
+                        help=f"slowdown in %% counted as a regression (default: {REGRESSION_PCT})")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="timed runs per stage, the best is reported (default: 5)")
+    parser.add_argument('--libraries', type=int, nargs='+', metavar='N',
+                        help=f"library sizes to embed (default: {LIBRARY_SIZES})")
+    parser.add_argument('--quick', action='store_true',
+                        help="fewer runs and only the smaller libraries")
+    parser.add_argument('-p', '--product', default='b',
+                        help="product key (default: b, Synchole)")
+    args = parser.parse_args()
+
+    repeat = 2 if args.quick else max(1, args.repeat)
+    sizes = args.libraries or (QUICK_LIBRARY_SIZES if args.quick else LIBRARY_SIZES)
+    try:
+        product = hextosyx.get_product(args.product)
+        baseline = None
+        if args.compare:
+            with open(args.compare, 'r') as f:
+                baseline = json.load(f)
+    except (hextosyx.HexToSyxError, OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+
+    print("=" * 50)
+    print("  SYNCHOLE Pipeline Benchmark")
+    print("=" * 50)
+    print()
+
+    results = {'version': RESULTS_VERSION, 'hextosyx': hextosyx.__version__,
+               'python': platform.python_version(), 'machine': platform.machine(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'repeat': repeat, 'cases': {}}
+    for name, size, segments, memory_size in IMAGES:
+        stages = bench_image(size, segments, memory_size, product, repeat)
+        results['cases'][name] = stages
+        print(f"{name} ({stages['parse']['image_bytes']} bytes):")
+        for stage, r in stages.items():
+            print(f"  {stage:<9} {r['best_s'] * 1000:9.3f} ms  {format_rate(r):<28} "
+                  f"peak {r['peak_bytes'] / 1024:8.1f} KB")
+    print()
+    for count in sizes:
+        r = bench_embed(count, product, repeat)
+        results['cases'][f"library-{count}"] = {'embed': r}
+        print(f"library-{count}: embed {r['best_s'] * 1000:9.1f} ms  {format_rate(r)}  "
+              f"peak {r['peak_bytes'] / 1024:.1f} KB, page {r['page_bytes'] / 1024:.0f} KB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+        print()
+        print(f"✓ Wrote {args.output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        print()
+        if regressions:
+            for case, stage, old, new, change in regressions:
+                print(f"✗ {case} {stage}: {old * 1000:.3f} ms -> {new * 1000:.3f} ms "
+                      f"(+{change:.0f}%)")
+            sys.exit(1)
+        print(f"✓ No stage more than {args.threshold:g}% slower than {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
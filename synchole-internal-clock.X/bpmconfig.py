@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Shared settings for the SYNCHOLE internal clock BPM library
+"""
+
+import hashlib
+import re
+from pathlib import Path
+
+# Paths
+SCRIPT_DIR = Path(__file__).parent
+SOURCE_FILE = "din-sync-hub-xc8-fixed_2.c"
+BPM_BUILDS_DIR = SCRIPT_DIR / "bpm-builds"
+
+# Product key passed to hextosyx (b = Synchole)
+PRODUCT_KEY = 'b'
+
+# Comprehensive BPM library (same list as build-comprehensive-library.sh)
+LIBRARY_BPMS = [
+    # Ambient / Downtempo (60-95)
+    60, 65, 70, 75, 80, 85, 90, 95,
+    # Hip-Hop / Trip-Hop (95-110)
+    100, 105, 110,
+    # House / Disco (115-128)
+    115, 118, 120, 122, 125, 128,
+    # Techno / Tech House (128-145)
+    130, 132, 135, 138, 140, 142, 145,
+    # Trance / Hard House (145-155)
+    148, 150, 152, 155,
+    # Hardcore / Hard Techno (155-165)
+    158, 160, 162, 165,
+    # Drum & Bass / Jungle (165-180)
+    168, 170, 172, 174, 175, 178, 180,
+    # Speedcore / Gabber (180-240)
+    185, 190, 195, 200, 210, 220, 230, 240,
+]
+
+PERIOD_DEFINE = re.compile(r'#define INTERNAL_CLOCK_PERIOD_MS.*')
+RELOAD_DEFINE = re.compile(r'#define TIMER_0_INIT_SCALAR[ \t]+\d+')
+PRESCALER_ENABLE = re.compile(r'OPTION_REGbits\.PSA = [01];')
+PRESCALER_BITS = re.compile(r'OPTION_REGbits\.PS = 0b[01]{3};.*')
+
+
+def clock_period_ms(bpm):
+    """Internal clock period for a BPM (24 PPQN, 1ms timer ticks)"""
+    return int(round(60000 / (bpm * 24)))
+
+
+def syx_name(bpm):
+    """File name of the SysEx image for a BPM"""
+    return f"synchole-{bpm}bpm.syx"
+
+
+def set_clock_period(source, bpm):
+    """Return the firmware source with INTERNAL_CLOCK_PERIOD_MS set for a BPM"""
+    define = f"#define INTERNAL_CLOCK_PERIOD_MS {clock_period_ms(bpm)}  // {bpm} BPM"
+    source, count = PERIOD_DEFINE.subn(define, source, count=1)
+    if count != 1:
+        raise ValueError("INTERNAL_CLOCK_PERIOD_MS define not found in source")
+    return source
+
+
+def set_timer_params(source, bpm, prescale, reload, ticks):
+    """Return the firmware source with its Timer0 settings and tick count set
+
+    prescale is the Timer0 prescale ratio (1 for none, else 2 to 256) and
+    reload the TIMER_0_INIT_SCALAR value, as found by timersearch.py.
+    """
+    if prescale not in (1, 2, 4, 8, 16, 32, 64, 128, 256):
+        raise ValueError(f"Invalid Timer0 prescaler 1:{prescale}")
+    if not 0 <= reload <= 255 or not 1 <= ticks <= 255:
+        raise ValueError(f"Timer0 reload {reload} or tick count {ticks} out of range")
+    replacements = [
+        (PERIOD_DEFINE, f"#define INTERNAL_CLOCK_PERIOD_MS {ticks}  // {bpm} BPM"),
+        (RELOAD_DEFINE, f"#define TIMER_0_INIT_SCALAR\t\t{reload}"),
+        (PRESCALER_ENABLE, f"OPTION_REGbits.PSA = {1 if prescale == 1 else 0};"),
+        (PRESCALER_BITS, f"OPTION_REGbits.PS = 0b{max(prescale.bit_length() - 2, 0):03b}; "
+                         f"// 1/{prescale} prescaler"),
+    ]
+    for pattern, text in replacements:
+        source, count = pattern.subn(text, source, count=1)
+        if count != 1:
+            raise ValueError(f"'{pattern.pattern}' not found in source")
+    return source
+
+
+def parse_bpm_list(text):
+    """Parse a BPM list such as '120,140,170-180'"""
+    bpms = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            bpms.extend(range(int(first), int(last) + 1))
+        else:
+            bpms.append(int(part))
+    return bpms
+
+
+def find_aliases(images):
+    """Group BPMs whose firmware images are byte-identical
+
+    images maps BPM to image bytes. Returns lists of aliasing BPMs, one
+    per shared image, leaving out BPMs with a unique image.
+    """
+    groups = {}
+    for bpm in sorted(images):
+        groups.setdefault(hashlib.sha256(images[bpm]).digest(), []).append(bpm)
+    return [bpms for bpms in groups.values() if len(bpms) > 1]
+
+
+def format_aliases(groups):
+    """Describe alias groups as text lines, e.g. '170 = 175 = 180 BPM'"""
+    return [" = ".join(str(bpm) for bpm in bpms) + " BPM" for bpms in groups]
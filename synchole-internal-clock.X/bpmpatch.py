@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Generate BPM firmware variants by patching one compiled image
+
+Only INTERNAL_CLOCK_PERIOD_MS changes between BPM builds, and XC8 encodes
+it as an instruction literal. Diffing two reference builds with different
+periods finds those literal bytes; every other BPM is then produced by
+patching them in the reference image instead of recompiling.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import hextosyx
+from bpmconfig import (BPM_BUILDS_DIR, LIBRARY_BPMS, PRODUCT_KEY,
+                       clock_period_ms, find_aliases, format_aliases,
+                       parse_bpm_list, syx_name)
+
+
+class PatchError(Exception):
+    """Raised when the reference builds can't be turned into a patch"""
+
+
+def load_image(hex_path, memory_size=None):
+    """Read a HEX file and return its reset-vector-fixed memory image
+
+    memory_size is the flash size of the target product (default: the
+    Synchole's).
+    """
+    if memory_size is None:
+        memory_size = hextosyx.memory_size(hextosyx.PRODUCTS[PRODUCT_KEY])
+    try:
+        with open(hex_path, 'r') as infile:
+            memory, max_addr = hextosyx.parse_hex(infile, None, memory_size)
+    except hextosyx.HexFormatError as e:
+        raise PatchError(f"Can't read {hex_path}: {e}") from None
+    hextosyx.fix_reset_vec(memory)
+    return memory, max_addr
+
+
+def find_period_sites(image_a, period_a, image_b, period_b):
+    """Locate the bytes encoding the clock period
+
+    Returns a list of (address, delta) where the byte holds period + delta
+    in both references. Raises PatchError if the builds differ in any other
+    way.
+    """
+    memory_a, max_addr_a = image_a
+    memory_b, max_addr_b = image_b
+    if period_a == period_b:
+        raise PatchError(f"Both references use a {period_a}ms period")
+    if max_addr_a != max_addr_b:
+        raise PatchError("Reference builds have different code sizes")
+
+    data_a = memory_a[:max_addr_a]
+    data_b = memory_b[:max_addr_b]
+    sites = []
+    for addr in range(max_addr_a):
+        if data_a[addr] == data_b[addr]:
+            continue
+        delta = data_a[addr] - period_a
+        if data_b[addr] - period_b != delta:
+            raise PatchError(f"Byte 0x{addr:x} differs but doesn't track the period")
+        sites.append((addr, delta))
+
+    if not sites:
+        raise PatchError("Reference builds are identical")
+    return sites
+
+
+def patch_image(image, sites, bpm):
+    """Return a copy of a memory image with the clock period set for a BPM"""
+    memory, max_addr = image
+    period = clock_period_ms(bpm)
+    patched = memory.copy()
+    for addr, delta in sites:
+        value = period + delta
+        if not 0 <= value <= 0xFF:
+            raise PatchError(f"{bpm} BPM: period {period}ms doesn't fit the literal")
+        patched[addr] = value
+    return patched, max_addr
+
+
+def encode_variant(image, sites, bpm, product):
+    """Patch the reference image for a BPM and encode it as SysEx"""
+    memory, max_addr = patch_image(image, sites, bpm)
+    return hextosyx.encode_sysex(memory, max_addr, product['id'], product['block_size'])
+
+
+def compile_reference(bpm, workdir):
+    """Compile a real build for a BPM and return its memory image"""
+    from xc8build import compile_variant
+    return load_image(compile_variant(bpm, Path(workdir) / f"{bpm}bpm"))
+
+
+def verify(image, sites, bpms, product):
+    """Compare patched variants against real compiles, return mismatching BPMs"""
+    from xc8build import BuildError
+    failed = []
+    with tempfile.TemporaryDirectory(prefix="synchole-verify-") as workdir:
+        for bpm in bpms:
+            try:
+                memory, max_addr = compile_reference(bpm, workdir)
+            except (BuildError, PatchError) as e:
+                print(f"  ✗ {e}")
+                failed.append(bpm)
+                continue
+            compiled = hextosyx.encode_sysex(memory, max_addr,
+                                             product['id'], product['block_size'])
+            if compiled == encode_variant(image, sites, bpm, product):
+                print(f"  ✓ {bpm} BPM matches compiled build")
+            else:
+                print(f"  ✗ {bpm} BPM differs from compiled build")
+                failed.append(bpm)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build BPM firmware variants by patching a reference image")
+    parser.add_argument('--ref', nargs=2, action='append', metavar=('HEX', 'BPM'),
+                        help="reference build and the BPM it was compiled for "
+                             "(give twice, with different periods)")
+    parser.add_argument('--compile-refs', nargs=2, type=int, metavar=('BPM_A', 'BPM_B'),
+                        help="compile the two reference builds with XC8 instead")
+    parser.add_argument('--bpms', type=parse_bpm_list,
+                        help="BPMs to generate, e.g. 60-240 or 120,140 "
+                             "(default: the library list)")
+    parser.add_argument('--unique-periods', action='store_true',
+                        help="skip BPMs whose clock period is already covered "
+                             "(keeps the one the clock plays closest to)")
+    parser.add_argument('--max-error', type=float, metavar='PCT',
+                        help="skip BPMs whose actual tempo is off by more than PCT%%")
+    parser.add_argument('--output-dir', type=Path, default=BPM_BUILDS_DIR)
+    parser.add_argument('--verify', type=parse_bpm_list, metavar='BPMS',
+                        help="also compile these BPMs and compare against the patched images")
+    args = parser.parse_args()
+
+    from xc8build import BuildError
+    product = hextosyx.PRODUCTS[PRODUCT_KEY]
+    bpms = args.bpms or LIBRARY_BPMS
+    if args.unique_periods or args.max_error is not None:
+        from clocktable import pick_bpms
+        requested = len(bpms)
+        bpms = pick_bpms(bpms, args.max_error, args.unique_periods)
+        print(f"Keeping {len(bpms)} of {requested} BPMs after the clock accuracy check")
+
+    try:
+        if args.compile_refs:
+            with tempfile.TemporaryDirectory(prefix="synchole-ref-") as workdir:
+                refs = [(compile_reference(bpm, workdir), bpm) for bpm in args.compile_refs]
+        elif args.ref and len(args.ref) == 2:
+            refs = [(load_image(hex_path), int(bpm)) for hex_path, bpm in args.ref]
+        else:
+            parser.error("give two --ref HEX BPM pairs or --compile-refs BPM_A BPM_B")
+
+        (image, bpm_a), (image_b, bpm_b) = refs
+        sites = find_period_sites(image, clock_period_ms(bpm_a),
+                                  image_b, clock_period_ms(bpm_b))
+    except (BuildError, PatchError, hextosyx.HexToSyxError, OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    listed = ", ".join(f"0x{addr:04x}" for addr, _ in sites)
+    print(f"Clock period encoded at: {listed}")
+    print()
+
+    start = time.perf_counter()
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    images = {}
+    try:
+        for bpm in bpms:
+            images[bpm] = encode_variant(image, sites, bpm, product)
+            (args.output_dir / syx_name(bpm)).write_bytes(images[bpm])
+    except (PatchError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+    print(f"✓ Generated {len(bpms)} firmware files in {elapsed * 1000:.1f} ms")
+    print(f"  {args.output_dir}")
+
+    aliases = find_aliases(images)
+    if aliases:
+        print()
+        print("Identical firmware (same clock period):")
+        for line in format_aliases(aliases):
+            print(f"  {line}")
+
+    if args.verify:
+        print()
+        print("Verifying against compiled builds:")
+        if verify(image, sites, args.verify, product):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,20 @@ SOURCE_FILE="din-sync-hub-xc8-fixed_2.c"
 PROJECT_DIR="$HOME/repos/synchole/synchole-internal-clock.X"
 OUTPUT_DIR="$PROJECT_DIR/bpm-builds"
 
+# Pass --no-cache to rebuild every BPM even if it's in the build cache
+USE_CACHE=1
+if [ "$1" == "--no-cache" ]; then
+    USE_CACHE=0
+fi
+
+# Set SYNCHOLE_STATS to a file to collect timing reports: one line per
+# compile from here, plus the hextosyx report (see stagestats.py)
+record_compile() {
+    if [ -n "$SYNCHOLE_STATS" ]; then
+        echo "{\"version\":1,\"tool\":\"xc8\",\"bpm\":$1,\"ok\":$2,\"wall_s\":$3,\"stages\":{\"xc8\":{\"calls\":1,\"wall_s\":$3,\"cpu_s\":0,\"peak_bytes\":0}},\"counts\":{\"$4\":1}}" >> "$SYNCHOLE_STATS"
+    fi
+}
+
 # Comprehensive BPM library organized by genre/use case
 BPMS=(
     # Ambient / Downtempo (60-95)
@@ -63,6 +77,8 @@ fi
 # Build counter
 SUCCESS=0
 FAILED=0
+CACHED=0
+BUILT=()
 
 # Build for each BPM
 for BPM in "${BPMS[@]}"; do
@@ -72,6 +88,17 @@ for BPM in "${BPMS[@]}"; do
     PERIOD=$(python3 -c "print(int(round(60000 / ($BPM * 24))))")
     echo "  Period: ${PERIOD}ms"
     
+    # Reuse the cached build if nothing relevant changed
+    if [ "$USE_CACHE" == "1" ] && "$PROJECT_DIR/buildcache.py" fetch --bpm "$BPM" \
+            --source "$PROJECT_DIR/${SOURCE_FILE}.original" \
+            --hex "$OUTPUT_DIR/synchole-${BPM}bpm.hex" \
+            --syx "$OUTPUT_DIR/synchole-${BPM}bpm.syx" > /dev/null 2>&1; then
+        echo -e "  ${GREEN}✓ Cached synchole-${BPM}bpm.syx${NC}"
+        SUCCESS=$((SUCCESS + 1))
+        CACHED=$((CACHED + 1))
+        continue
+    fi
+    
     # Modify source file
     cp "$PROJECT_DIR/${SOURCE_FILE}.original" "$PROJECT_DIR/$SOURCE_FILE"
     
@@ -86,28 +113,57 @@ for BPM in "${BPMS[@]}"; do
     # Build in MPLAB X
     cd "$PROJECT_DIR"
     echo "  Compiling..."
+    COMPILE_START=$(python3 -c "import time; print(time.time())")
     make -f nbproject/Makefile-default.mk clean > /dev/null 2>&1
     
     if make -f nbproject/Makefile-default.mk > /dev/null 2>&1; then
+        record_compile "$BPM" true "$(python3 -c "import time; print(round(time.time() - $COMPILE_START, 3))")" compiled
         echo -e "  ${GREEN}✓ Compile successful${NC}"
         
-        # Convert to SysEx
-        echo "  Converting to .syx..."
+        # Keep the HEX; everything is converted to .syx in one go below
         HEX_FILE=$(ls -t dist/default/production/*.hex 2>/dev/null | head -1)
-        
-        if ./hextosyx.py b "$HEX_FILE" "$OUTPUT_DIR/synchole-${BPM}bpm.syx" > /dev/null 2>&1; then
-            echo -e "  ${GREEN}✓ Created synchole-${BPM}bpm.syx${NC}"
-            ((SUCCESS++))
-        else
-            echo -e "  ${YELLOW}⚠ SysEx conversion failed${NC}"
-            ((FAILED++))
-        fi
+        cp "$HEX_FILE" "$OUTPUT_DIR/synchole-${BPM}bpm.hex"
+        BUILT+=("$BPM")
     else
+        record_compile "$BPM" false "$(python3 -c "import time; print(round(time.time() - $COMPILE_START, 3))")" failed
         echo -e "  ${YELLOW}⚠ Compile failed${NC}"
-        ((FAILED++))
+        FAILED=$((FAILED + 1))
     fi
 done
 
+# Convert every fresh build to SysEx with a single hextosyx process
+if [ ${#BUILT[@]} -gt 0 ]; then
+    echo -e "\n${BLUE}Converting ${#BUILT[@]} builds to .syx...${NC}"
+    HEX_FILES=()
+    for BPM in "${BUILT[@]}"; do
+        HEX_FILES+=("$OUTPUT_DIR/synchole-${BPM}bpm.hex")
+    done
+    # Exit status 3 means some files failed, which the loop below reports
+    # per BPM; anything else means the batch didn't run at all
+    BATCH_STATUS=0
+    "$PROJECT_DIR/hextosyx.py" batch b --quiet "${HEX_FILES[@]}" || BATCH_STATUS=$?
+    if [ "$BATCH_STATUS" -ne 0 ] && [ "$BATCH_STATUS" -ne 3 ]; then
+        echo -e "  ${YELLOW}⚠ hextosyx.py batch failed (exit status ${BATCH_STATUS})${NC}"
+    fi
+    
+    for BPM in "${BUILT[@]}"; do
+        SYX_FILE="$OUTPUT_DIR/synchole-${BPM}bpm.syx"
+        if [ -f "$SYX_FILE" ] && [ "$SYX_FILE" -nt "$OUTPUT_DIR/synchole-${BPM}bpm.hex" ]; then
+            echo -e "  ${GREEN}✓ Created synchole-${BPM}bpm.syx${NC}"
+            if [ "$USE_CACHE" == "1" ]; then
+                "$PROJECT_DIR/buildcache.py" store --bpm "$BPM" \
+                    --source "$PROJECT_DIR/${SOURCE_FILE}.original" \
+                    --hex "$OUTPUT_DIR/synchole-${BPM}bpm.hex" \
+                    --syx "$SYX_FILE" > /dev/null
+            fi
+            SUCCESS=$((SUCCESS + 1))
+        else
+            echo -e "  ${YELLOW}⚠ SysEx conversion failed for ${BPM} BPM${NC}"
+            FAILED=$((FAILED + 1))
+        fi
+    done
+fi
+
 # Restore original
 echo -e "\n${BLUE}Restoring original source...${NC}"
 cp "$PROJECT_DIR/${SOURCE_FILE}.original" "$PROJECT_DIR/$SOURCE_FILE"
@@ -117,7 +173,7 @@ echo -e "${GREEN}   Build complete!${NC}"
 echo -e "${GREEN}═══════════════════════════════════════════${NC}"
 echo
 echo "Results:"
-echo "  ✓ Success: ${SUCCESS}"
+echo "  ✓ Success: ${SUCCESS} (${CACHED} from cache)"
 echo "  ✗ Failed: ${FAILED}"
 echo "  Total: ${#BPMS[@]}"
 echo
@@ -20,7 +20,7 @@ echo
 
 # Get BPM from user
 if [ -z "$1" ]; then
-    echo -e "${YELLOW}Usage: $0 <BPM>${NC}"
+    echo -e "${YELLOW}Usage: $0 <BPM> [--no-cache]${NC}"
     echo "Example: $0 140"
     echo
     echo "Common BPMs: 60, 80, 90, 100, 110, 120, 130, 140, 150, 160, 180, 200, 240"
@@ -28,6 +28,10 @@ if [ -z "$1" ]; then
 fi
 
 BPM=$1
+USE_CACHE=1
+if [ "$2" == "--no-cache" ]; then
+    USE_CACHE=0
+fi
 SOURCE_FILE="din-sync-hub-xc8-fixed_2.c"
 
 echo -e "${GREEN}Building for ${BPM} BPM...${NC}"
@@ -44,6 +48,18 @@ if [ ! -f "${SOURCE_FILE}.original" ]; then
     cp "$SOURCE_FILE" "${SOURCE_FILE}.original"
 fi
 
+# Reuse a previous build if nothing relevant changed
+mkdir -p bpm-builds
+if [ "$USE_CACHE" == "1" ] && ./buildcache.py fetch --bpm "$BPM" --source "${SOURCE_FILE}.original" \
+        --hex "bpm-builds/synchole-${BPM}bpm.hex" --syx "bpm-builds/synchole-${BPM}bpm.syx" > /dev/null 2>&1; then
+    echo -e "${GREEN}✓ Unchanged since last build - reused cached firmware${NC}"
+    ls -lh "bpm-builds/synchole-${BPM}bpm.syx"
+    echo
+    echo "Flash bpm-builds/synchole-${BPM}bpm.syx to your SYNCHOLE!"
+    echo
+    exit 0
+fi
+
 # Modify source
 echo -e "${BLUE}Modifying source code...${NC}"
 cp "${SOURCE_FILE}.original" "$SOURCE_FILE"
@@ -92,6 +108,11 @@ if make -f nbproject/Makefile-default.mk; then
         echo
         echo -e "${GREEN}✓ Successfully created: bpm-builds/synchole-${BPM}bpm.syx${NC}"
         ls -lh "bpm-builds/synchole-${BPM}bpm.syx"
+        cp "$HEX_FILE" "bpm-builds/synchole-${BPM}bpm.hex"
+        if [ "$USE_CACHE" == "1" ]; then
+            ./buildcache.py store --bpm "$BPM" --source "${SOURCE_FILE}.original" \
+                --hex "bpm-builds/synchole-${BPM}bpm.hex" --syx "bpm-builds/synchole-${BPM}bpm.syx" > /dev/null
+        fi
     else
         echo -e "${RED}✗ SysEx conversion failed${NC}"
         exit 1
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache for compiled SYNCHOLE firmware variants
+
+A variant is keyed by a hash of everything that goes into it: the C
+source, the XC8 command lines in nbproject/Makefile-default.mk, the BPM,
+the hextosyx product and the hextosyx version. A hit hands back the
+stored .hex and .syx instead of compiling. The cache is bounded in size
+and evicts least recently used entries.
+
+Used by xc8build.py, and by the bash builders through:
+    ./buildcache.py fetch --bpm 120 --hex out.hex --syx out.syx
+    ./buildcache.py store --bpm 120 --hex out.hex --syx out.syx
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import hextosyx
+from bpmconfig import PRODUCT_KEY, SCRIPT_DIR, SOURCE_FILE
+
+CACHE_DIR = Path(os.environ.get("SYNCHOLE_BUILD_CACHE", SCRIPT_DIR / ".build-cache"))
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+MAKEFILE = "nbproject/Makefile-default.mk"
+LOCAL_MAKEFILE = "nbproject/Makefile-local-default.mk"
+
+HEX_NAME = "firmware.hex"
+SYX_NAME = "firmware.syx"
+
+
+def compiler_settings(project_dir=SCRIPT_DIR):
+    """Return the lines of the generated makefiles that affect the output
+
+    That is the processor option and the XC8 command lines (compile and
+    link flags) plus the compiler location, which pins the XC8 version.
+    """
+    lines = []
+    makefile = Path(project_dir) / MAKEFILE
+    for line in makefile.read_text().splitlines():
+        if "${MP_CC}" in line or "${MP_LD}" in line or line.startswith("MP_PROCESSOR_OPTION"):
+            lines.append(line.strip())
+    local = Path(project_dir) / LOCAL_MAKEFILE
+    if local.exists():
+        for line in local.read_text().splitlines():
+            if line.startswith(("MP_CC=", "MP_LD=", "DFP_DIR=")):
+                lines.append(line.strip())
+    return "\n".join(lines)
+
+
+def cache_key(bpm, product_key=PRODUCT_KEY, source_path=None, project_dir=SCRIPT_DIR,
+              variant=None):
+    """Hash of the inputs that determine a variant's .hex and .syx
+
+    variant describes any other change made to the source for this
+    build, such as non-default timer settings.
+    """
+    source_path = Path(source_path) if source_path else Path(project_dir) / SOURCE_FILE
+    parts = [source_path.read_bytes(),
+             compiler_settings(project_dir).encode(),
+             f"bpm={bpm}".encode(),
+             f"product={product_key}".encode(),
+             f"hextosyx={hextosyx.__version__}".encode()]
+    if variant:
+        parts.append(f"variant={variant}".encode())
+    h = hashlib.sha256()
+    for part in parts:
+        # Length-prefix each part so boundaries can't shift between them
+        h.update(len(part).to_bytes(8, 'little'))
+        h.update(part)
+    return h.hexdigest()
+
+
+class BuildCache:
+    """Size-bounded LRU store of .hex/.syx pairs keyed by cache_key()"""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def _entry(self, key):
+        return self.root / key[:2] / key
+
+    def fetch(self, key, hex_dest, syx_dest):
+        """Copy a cached variant to hex_dest and syx_dest, return True on a hit"""
+        entry = self._entry(key)
+        try:
+            shutil.copyfile(entry / HEX_NAME, hex_dest)
+            shutil.copyfile(entry / SYX_NAME, syx_dest)
+            # The entry's mtime records when it was last used
+            os.utime(entry)
+        except OSError:
+            # Missing, or evicted by another builder while we copied
+            return False
+        return True
+
+    def store(self, key, hex_path, syx_path):
+        """Add a freshly built variant and evict old entries if over budget"""
+        entry = self._entry(key)
+        tmp = entry.with_name(f"{key}.tmp{os.getpid()}")
+        tmp.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(hex_path, tmp / HEX_NAME)
+        shutil.copyfile(syx_path, tmp / SYX_NAME)
+        # Another builder may have stored the same key meanwhile
+        if entry.exists():
+            shutil.rmtree(tmp)
+        else:
+            tmp.rename(entry)
+        self.evict()
+
+    def entries(self):
+        """Return (mtime, size, path) for every entry, oldest first"""
+        found = []
+        if not self.root.exists():
+            return found
+        for entry in self.root.glob("??/*"):
+            if not entry.is_dir() or ".tmp" in entry.name:
+                continue
+            size = sum(f.stat().st_size for f in entry.iterdir())
+            found.append((entry.stat().st_mtime, size, entry))
+        return sorted(found)
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        """Remove every entry"""
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SYNCHOLE firmware build cache")
+    parser.add_argument('command', choices=['fetch', 'store', 'stats', 'clear'])
+    parser.add_argument('--bpm', type=int)
+    parser.add_argument('--product', default=PRODUCT_KEY)
+    parser.add_argument('--source', type=Path,
+                        help=f"unmodified C source (default: {SOURCE_FILE})")
+    parser.add_argument('--hex', type=Path)
+    parser.add_argument('--syx', type=Path)
+    parser.add_argument('--cache-dir', type=Path, default=CACHE_DIR)
+    parser.add_argument('--max-size', type=int, default=CACHE_MAX_BYTES // (1024 * 1024),
+                        help="cache size limit in MB")
+    args = parser.parse_args()
+
+    cache = BuildCache(args.cache_dir, args.max_size * 1024 * 1024)
+
+    if args.command == 'stats':
+        entries = cache.entries()
+        total = sum(size for _, size, _ in entries)
+        print(f"{len(entries)} entries, {total / 1024:.1f} KB in {cache.root}")
+        return
+    if args.command == 'clear':
+        cache.clear()
+        print(f"Cleared {cache.root}")
+        return
+
+    if args.bpm is None or args.hex is None or args.syx is None:
+        parser.error(f"{args.command} needs --bpm, --hex and --syx")
+    key = cache_key(args.bpm, args.product, args.source)
+
+    if args.command == 'fetch':
+        if not cache.fetch(key, args.hex, args.syx):
+            sys.exit(1)
+        print(f"Cache hit for {args.bpm} BPM ({key[:12]})")
+    else:
+        cache.store(key, args.hex, args.syx)
+        print(f"Cached {args.bpm} BPM ({key[:12]})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Internal clock accuracy for SYNCHOLE BPM builds
+
+In internal clock mode the firmware sends a SYNC24 pulse every
+INTERNAL_CLOCK_PERIOD_MS Timer0 ticks. A tick isn't quite 1 ms: Timer0
+counts at 16 MHz / 4 / 16 = 250 kHz from TIMER_0_INIT_SCALAR (5) to its
+overflow, which is 251 counts or 1.004 ms. Together with rounding the
+period to whole ticks, the tempo a build actually plays can be well off
+the BPM it was built for, and BPMs that round to the same period play
+the same tempo.
+
+Everything is computed with NumPy over whole arrays of BPMs:
+
+    ./clocktable.py                         # the library BPMs
+    ./clocktable.py --range 60 240 --step 0.1 --summary
+    ./clocktable.py --bpms 60-240 --json clock.json
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from bpmconfig import LIBRARY_BPMS, parse_bpm_list
+
+XTAL_FREQ = 16000000        # _XTAL_FREQ
+TIMER0_PRESCALE = 16        # OPTION_REGbits.PS = 0b011
+TIMER0_RELOAD = 5           # TIMER_0_INIT_SCALAR
+PPQN = 24
+MAX_PERIOD_TICKS = 255      # bInternalClockCounter is a byte
+
+
+def tick_ms(reload=TIMER0_RELOAD, prescale=TIMER0_PRESCALE, xtal=XTAL_FREQ, reload_cycles=0):
+    """Length of one Timer0 tick in ms
+
+    reload_cycles is the number of instruction cycles between the
+    overflow and the ISR writing TMR0. They are lost on every tick, since
+    the write also clears the prescaler.
+    """
+    cycles = (256 - reload) * prescale + reload_cycles
+    return cycles * 4000.0 / xtal
+
+
+def clock_table(bpms, tick=None):
+    """Model the internal clock for an array of requested BPMs
+
+    Returns a dict of equal length arrays: bpm, period (ticks, rounded as
+    bpmconfig.clock_period_ms does), valid (the period fits the byte
+    counter), actual_bpm, error_bpm, error_pct and alias_of, the first
+    requested BPM that gets the same period.
+    """
+    tick = tick_ms() if tick is None else tick
+    bpm = np.asarray(bpms, dtype=float)
+    # np.rint rounds halves to even, like Python's round()
+    period = np.rint(60000.0 / (bpm * PPQN)).astype(np.int64)
+    valid = (period >= 1) & (period <= MAX_PERIOD_TICKS)
+    actual = np.where(valid, 60000.0 / (PPQN * tick * np.maximum(period, 1)), np.nan)
+    _, first, group = np.unique(period, return_index=True, return_inverse=True)
+    return {
+        'bpm': bpm,
+        'period': period,
+        'valid': valid,
+        'actual_bpm': actual,
+        'error_bpm': actual - bpm,
+        'error_pct': 100.0 * (actual - bpm) / bpm,
+        'alias_of': bpm[first[group.ravel()]],
+    }
+
+
+def _number(bpm):
+    """A BPM as an int when it is whole"""
+    return int(bpm) if bpm == int(bpm) else bpm
+
+
+def alias_groups(table):
+    """Lists of requested BPMs that collapse onto the same period"""
+    groups = {}
+    for bpm, period in zip(table['bpm'].tolist(), table['period'].tolist()):
+        groups.setdefault(period, []).append(_number(bpm))
+    return [bpms for bpms in groups.values() if len(bpms) > 1]
+
+
+def pick_bpms(bpms, max_error_pct=None, unique=True, tick=None):
+    """Choose which requested BPMs are worth building
+
+    With unique, only one BPM per period is kept: the one the clock
+    actually plays closest to. BPMs whose period doesn't fit the
+    counter, or whose error exceeds max_error_pct, are dropped.
+    """
+    table = clock_table(bpms, tick)
+    keep = table['valid'].copy()
+    if max_error_pct is not None:
+        keep &= np.abs(table['error_pct']) <= max_error_pct
+    if unique:
+        error = np.where(keep, np.abs(table['error_bpm']), np.inf)
+        order = np.lexsort((error, table['period']))
+        _, first = np.unique(table['period'][order], return_index=True)
+        best = np.zeros_like(keep)
+        best[order[first]] = True
+        keep &= best
+    return sorted(_number(bpm) for bpm in table['bpm'][keep].tolist())
+
+
+def format_bpm(bpm):
+    """122 for whole BPMs, 122.5 otherwise"""
+    return f"{bpm:g}"
+
+
+def table_rows(table):
+    """The table as a list of plain dicts (for JSON)"""
+    rows = []
+    for i in range(len(table['bpm'])):
+        valid = bool(table['valid'][i])
+        rows.append({
+            'bpm': float(table['bpm'][i]),
+            'period': int(table['period'][i]),
+            'actual_bpm': round(float(table['actual_bpm'][i]), 3) if valid else None,
+            'error_bpm': round(float(table['error_bpm'][i]), 3) if valid else None,
+            'error_pct': round(float(table['error_pct'][i]), 3) if valid else None,
+            'alias_of': float(table['alias_of'][i]),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Show the tempo each BPM build actually plays in internal clock mode")
+    parser.add_argument('--bpms', type=parse_bpm_list,
+                        help="BPMs to model, e.g. 60-240 or 120,140 (default: the library list)")
+    parser.add_argument('--range', nargs=2, type=float, metavar=('FIRST', 'LAST'),
+                        help="model every BPM from FIRST to LAST in --step increments")
+    parser.add_argument('--step', type=float, default=1.0)
+    parser.add_argument('--reload-cycles', type=int, default=0,
+                        help="instruction cycles lost at each Timer0 reload (default: 0)")
+    parser.add_argument('--json', metavar='FILE',
+                        help="also write the table as JSON")
+    parser.add_argument('--summary', action='store_true',
+                        help="only print the summary, not every row")
+    args = parser.parse_args()
+
+    if args.range:
+        first, last = args.range
+        bpms = np.round(np.arange(first, last + args.step / 2, args.step), 6)
+    else:
+        bpms = args.bpms or LIBRARY_BPMS
+    tick = tick_ms(reload_cycles=args.reload_cycles)
+    table = clock_table(bpms, tick)
+
+    if not args.summary:
+        print(f"{'BPM':>8} {'Period':>7} {'Actual':>9} {'Error':>8} {'Error %':>8}  Same as")
+        for row in table_rows(table):
+            alias = "" if row['alias_of'] == row['bpm'] else format_bpm(row['alias_of'])
+            if row['actual_bpm'] is None:
+                print(f"{format_bpm(row['bpm']):>8} {row['period']:>5}ms  (period doesn't fit the counter)")
+                continue
+            print(f"{format_bpm(row['bpm']):>8} {row['period']:>5}ms {row['actual_bpm']:9.2f} "
+                  f"{row['error_bpm']:+8.2f} {row['error_pct']:+7.2f}%  {alias}")
+        print()
+
+    valid = table['valid']
+    errors = np.abs(table['error_pct'][valid])
+    periods = np.unique(table['period'][valid])
+    print(f"Tick: {tick:.4f} ms")
+    print(f"{len(table['bpm'])} BPMs, {len(periods)} distinct periods")
+    if errors.size:
+        worst = np.flatnonzero(valid)[np.argmax(errors)]
+        print(f"Error: mean {errors.mean():.2f}%, worst {errors.max():.2f}% "
+              f"at {format_bpm(table['bpm'][worst])} BPM")
+    if not valid.all():
+        print(f"⚠ {int((~valid).sum())} BPMs have a period that doesn't fit the counter")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'tick_ms': tick, 'rows': table_rows(table)}, f, indent=1)
+        print(f"✓ Wrote {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,64 +1,646 @@
 #!/usr/bin/env python3
 """
 Embed all .syx files into a self-contained HTML file
+
+The page is streamed to disk: the template pieces and each firmware
+payload are written out as they are read and encoded, so memory use
+stays flat however many firmwares are embedded.
 """
 
 import os
+import argparse
 import base64
+import contextlib
+import hashlib
 import json
+import zlib
 from pathlib import Path
 
+import stagestats
+from bpmconfig import format_aliases
+from stagestats import stage
+
+try:
+    from clocktable import clock_table, tick_ms
+except ImportError:
+    # NumPy isn't installed: the page just won't show the true tempo
+    clock_table = None
+
 # Paths
 SCRIPT_DIR = Path(__file__).parent
 BPM_BUILDS_DIR = SCRIPT_DIR / "bpm-builds"
 ORIGINAL_FIRMWARE = SCRIPT_DIR / "synchole-original-v3.0.syx"
 OUTPUT_HTML = SCRIPT_DIR / "synchole-complete.html"
+CHUNK_DIR = SCRIPT_DIR / "synchole-complete-chunks"
+MANIFEST = SCRIPT_DIR / ".embed-manifest.json"
+MANIFEST_VERSION = 2
+
+
+class PayloadEncoder:
+    """Base64 encode firmware payloads, deflating them first if asked to
+
+    Keeps raw and stored byte counts for the summary, and times the
+    deflate and base64 stages in stats, if given.
+    """
+
+    def __init__(self, compress=False, stats=None):
+        self.compress = compress
+        self.stats = stats
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def encode(self, data):
+        stored = data
+        if self.compress:
+            with stage(self.stats, 'deflate'):
+                stored = zlib.compress(data, 9)
+        self.raw_bytes += len(data)
+        self.stored_bytes += len(stored)
+        with stage(self.stats, 'base64'):
+            return base64.b64encode(stored).decode('ascii')
+
+    def encoded_size(self, data):
+        """Length of the JSON string encode() would give data, uncounted"""
+        if self.compress:
+            with stage(self.stats, 'deflate'):
+                data = zlib.compress(data, 9)
+        return 4 * ((len(data) + 2) // 3) + 2
+
+
+def bpm_from_name(syx_file):
+    """Extract the BPM from a synchole-<bpm>bpm.syx file name"""
+    return int(syx_file.stem.replace("synchole-", "").replace("bpm", ""))
+
+
+def scan_library(bpm_builds_dir=BPM_BUILDS_DIR):
+    """Return (bpm, path) for every .syx in the library, by BPM"""
+    return sorted((bpm_from_name(path), path) for path in bpm_builds_dir.glob("*.syx"))
+
+
+def make_patch(base, data, limit=None):
+    """Flat [offset, value, ...] list turning base into data, or None
+    if the images differ in length or the patch's JSON would take limit
+    characters or more"""
+    if len(data) != len(base):
+        return None
+    patch = []
+    for offset, (old, new) in enumerate(zip(base, data)):
+        if old != new:
+            patch += [offset, new]
+    if limit is not None and len(to_json(patch, None)) >= limit:
+        return None
+    return patch
+
+
+def to_json(value, indent):
+    if indent is None:
+        return json.dumps(value, separators=(',', ':'))
+    return json.dumps(value, indent=indent)
+
+
+class JsonListWriter:
+    """Write a JSON array to a file one item at a time"""
+
+    def __init__(self, out, indent):
+        self.out = out
+        self.indent = indent
+        self.count = 0
+        out.write('[')
+
+    def append(self, value):
+        if self.count:
+            self.out.write(',')
+        if self.indent is not None:
+            self.out.write('\n' + ' ' * self.indent)
+        self.out.write(to_json(value, self.indent))
+        self.count += 1
+
+    def close(self):
+        if self.indent is not None and self.count:
+            self.out.write('\n')
+        self.out.write(']')
+
+
+class ChunkWriter:
+    """Write firmware images to script files of size images each
+
+    Used in place of a JsonListWriter when the page loads its images on
+    demand. Each file calls firmwareChunk(index, [...]) in the page.
+    Files are named by a hash of their contents, so an unchanged chunk
+    keeps its name (and its place in the browser cache) and isn't
+    rewritten.
+    """
+
+    def __init__(self, directory, size, indent=None):
+        self.directory = Path(directory)
+        self.size = size
+        self.indent = indent
+        self.count = 0
+        self.files = []
+        self.written = 0
+        self._items = []
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def append(self, value):
+        self._items.append(value)
+        self.count += 1
+        if len(self._items) == self.size:
+            self._flush()
+
+    def _flush(self):
+        index = len(self.files)
+        text = f"firmwareChunk({index}, {to_json(self._items, self.indent)});\n"
+        name = f"chunk-{index:04d}-{hashlib.sha256(text.encode()).hexdigest()[:12]}.js"
+        path = self.directory / name
+        if not path.exists():
+            tmp = path.with_suffix('.tmp')
+            tmp.write_text(text)
+            os.replace(tmp, path)
+            self.written += 1
+        self.files.append(name)
+        self._items = []
+
+    def close(self):
+        if self._items:
+            self._flush()
+
+    def page_data(self):
+        """The FIRMWARE_CHUNKS table for the page script"""
+        return {'dir': self.directory.name, 'size': self.size, 'files': self.files}
+
+
+def remove_stale_chunks(directory, keep=()):
+    """Delete chunk files an earlier page used, once the new page is in place"""
+    keep = set(keep)
+    for path in Path(directory).glob("chunk-*.js"):
+        if path.name not in keep:
+            path.unlink()
+
+
+class EmbedManifest:
+    """Input hashes and encoded payloads remembered between runs
+
+    An input whose size and mtime match the manifest is neither re-read
+    nor re-encoded, and when no input, setting or the page itself has
+    changed the page doesn't need writing at all.
+
+    Payloads aren't held in memory: each one is appended to a payload
+    file next to the manifest as it is produced, and only its key and
+    file position are kept. Without a manifest path nothing is kept.
+    """
+
+    def __init__(self, path=None, state=None):
+        self.path = path
+        self.payload_path = path.with_suffix('.payloads') if path else None
+        old = state or {}
+        if state is None and path and path.exists():
+            try:
+                old = json.loads(path.read_text())
+            except ValueError:
+                old = {}
+        if old.get('version') != MANIFEST_VERSION:
+            old = {}
+        self.old_settings = old.get('settings')
+        self.old_output = old.get('output')
+        self.old_inputs = old.get('inputs', {})
+        self.old_chunks = old.get('chunks', [])
+        self.old_payloads = old.get('payloads', {})   # key -> offset in the payload file
+        self.inputs = {}
+        self.payloads = {}
+        self.encoded = 0
+        self.saved = None
+        self._old_file = None
+        self._new_file = None
+
+    def stat(self, path):
+        """Return the manifest entry (size, mtime_ns, sha256) for an input"""
+        key = str(path)
+        if key not in self.inputs:
+            st = path.stat()
+            entry = self.old_inputs.get(key)
+            if not entry or entry['size'] != st.st_size or entry['mtime_ns'] != st.st_mtime_ns:
+                entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                         'sha256': hashlib.sha256(path.read_bytes()).hexdigest()}
+            self.inputs[key] = entry
+        return self.inputs[key]
+
+    def digest(self, path):
+        return self.stat(path)['sha256']
+
+    def _read(self, f, key, offset):
+        """The entry stored for key at offset, or None if it isn't there"""
+        f.seek(offset)
+        try:
+            entry = json.loads(f.readline())
+        except ValueError:
+            return None
+        # A payload file left by an interrupted save can't be mistaken
+        # for the one the manifest describes
+        return entry if entry.get('key') == key else None
+
+    def _load(self, key):
+        if key in self.payloads:
+            self._new_file.flush()
+            entry = self._read(self._new_file, key, self.payloads[key])
+            self._new_file.seek(0, os.SEEK_END)
+            return entry
+        if key not in self.old_payloads:
+            return None
+        if self._old_file is None:
+            try:
+                self._old_file = open(self.payload_path, 'rb')
+            except OSError:
+                self.old_payloads = {}
+                return None
+        return self._read(self._old_file, key, self.old_payloads[key])
+
+    def _store(self, key, entry):
+        if self._new_file is None:
+            self._new_file = open(self.payload_path.with_suffix('.payloads.tmp'), 'w+b')
+        line = json.dumps(entry, separators=(',', ':')).encode() + b'\n'
+        self.payloads[key] = self._new_file.tell()
+        self._new_file.write(line)
+
+    def payload(self, key, make):
+        """Return the cached payload for key, calling make() on a miss
+
+        make returns the payload entry, a dict with at least 'value'.
+        """
+        entry = self._load(key) if self.path else None
+        if entry is None:
+            entry = make()
+            entry['key'] = key
+            self.encoded += 1
+        if self.path and key not in self.payloads:
+            self._store(key, entry)
+        return entry
+
+    def encode(self, encoder, path, digest=None):
+        """Base64 payload of a file, encoded only if not already cached"""
+        digest = digest or self.digest(path)
+        key = f"{digest}:{'deflate' if encoder.compress else 'raw'}"
+
+        def make():
+            with stage(encoder.stats, 'read'):
+                data = path.read_bytes()
+            before = encoder.stored_bytes
+            value = encoder.encode(data)
+            return {'value': value, 'raw': len(data), 'stored': encoder.stored_bytes - before}
+
+        fresh = self.encoded
+        entry = self.payload(key, make)
+        if self.encoded == fresh:
+            encoder.raw_bytes += entry['raw']
+            encoder.stored_bytes += entry['stored']
+        return entry['value']
+
+    def unchanged(self, settings, output):
+        """True if the last run used these settings and the same inputs
+        (stat() every input first) and output is still as it wrote it"""
+        if self.old_settings != settings or not output.exists():
+            return False
+        if not all((output.parent / chunk).exists() for chunk in self.old_chunks):
+            return False
+        st = output.stat()
+        if self.old_output != {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}:
+            return False
+        digests = {key: entry['sha256'] for key, entry in self.inputs.items()}
+        return digests == {key: entry['sha256'] for key, entry in self.old_inputs.items()}
+
+    def close(self):
+        """Close the payload files; an unsaved run's payloads are discarded"""
+        if self._old_file is not None:
+            self._old_file.close()
+            self._old_file = None
+        if self._new_file is not None:
+            self._new_file.close()
+            self._new_file = None
+            os.unlink(self.payload_path.with_suffix('.payloads.tmp'))
+            self.payloads = {}
+
+    def save(self, settings, output, chunks=()):
+        """Record this run; payloads that weren't used are dropped
+
+        chunks lists the chunk files the page loads, relative to it.
+        """
+        st = output.stat()
+        if self._old_file is not None:
+            self._old_file.close()
+            self._old_file = None
+        payloads = self.old_payloads
+        if self._new_file is not None:
+            self._new_file.close()
+            self._new_file = None
+            os.replace(self.payload_path.with_suffix('.payloads.tmp'), self.payload_path)
+            payloads = self.payloads
+        self.saved = {'version': MANIFEST_VERSION, 'settings': settings,
+                      'output': {'size': st.st_size, 'mtime_ns': st.st_mtime_ns},
+                      'chunks': list(chunks),
+                      'inputs': self.inputs,
+                      'payloads': payloads}
+        if not self.path:
+            return
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.saved, separators=(',', ':')))
+        os.replace(tmp, self.path)
+
+    def next_run(self):
+        """A manifest for the next run in this process, without rereading the file"""
+        self.close()
+        state = self.saved or {'version': MANIFEST_VERSION, 'settings': self.old_settings,
+                               'output': self.old_output, 'chunks': self.old_chunks,
+                               'inputs': self.inputs or self.old_inputs,
+                               'payloads': self.old_payloads}
+        return EmbedManifest(self.path, state)
+
+
+def write_firmware_data(out, library, encoder, manifest, fmt='full', indent=None, stats=None,
+                        chunks=None):
+    """Stream the firmware constants of the page script to out
+
+    Each unique image is written once, as soon as it has been encoded
+    (or found in the manifest), into the page or, given a ChunkWriter,
+    into its chunk files. Returns the BPM -> image index map and the
+    groups of BPMs sharing an image. With stats, each firmware's stage
+    times are recorded against its file.
+    """
+    firmwares = {}     # BPM -> position in FIRMWARE_IMAGES
+    image_index = {}   # sha256 -> position in FIRMWARE_IMAGES
+    aliases = {}       # sha256 -> BPMs sharing that image
+    base_path = None
+    base_digest = None
+
+    if fmt == 'patch':
+        # Use the image most BPMs share as the base; every other image
+        # is stored as a patch against it
+        usage = {}
+        for bpm, path in library:
+            digest = manifest.digest(path)
+            usage[digest] = usage.get(digest, 0) + 1
+        if usage:
+            base_digest = max(usage, key=usage.get)
+            base_path = next(path for _, path in library if manifest.digest(path) == base_digest)
+
+    out.write("        // EMBEDDED FIRMWARES (each unique image stored once, either as\n")
+    out.write("        // base64 or as an [offset, value, ...] patch to FIRMWARE_BASE)\n")
+    out.write("        const FIRMWARE_BASE = "
+              + (to_json(manifest.encode(encoder, base_path), indent) if base_path else 'null')
+              + ";\n")
+    if chunks is None:
+        out.write("        const FIRMWARE_IMAGES = ")
+        images = JsonListWriter(out, indent)
+    else:
+        images = chunks
+    base = None
+    patch_bytes = 0
+    for bpm, path in library:
+        with stats.file(path) if stats else contextlib.nullcontext():
+            digest = manifest.digest(path)
+            if digest not in image_index:
+                image_index[digest] = images.count
+                patch = None
+                if base_path:
+                    # A patch is only used if it is smaller than the full payload
+                    def make():
+                        nonlocal base
+                        with stage(stats, 'patch'):
+                            if base is None:
+                                base = base_path.read_bytes()
+                            data = path.read_bytes()
+                            return {'value': make_patch(base, data, encoder.encoded_size(data))}
+                    mode = 'deflate' if encoder.compress else 'raw'
+                    patch = manifest.payload(f"{digest}:patch:{base_digest}:{mode}", make)['value']
+                if patch is None:
+                    payload = manifest.encode(encoder, path, digest)
+                    with stage(stats, 'html'):
+                        images.append(payload)
+                else:
+                    with stage(stats, 'html'):
+                        images.append(patch)
+                    patch_bytes += len(to_json(patch, None))
+            firmwares[bpm] = image_index[digest]
+            aliases.setdefault(digest, []).append(bpm)
+        print(f"  ✓ {bpm} BPM ({manifest.stat(path)['size']} bytes)")
+    images.close()
+    if chunks is None:
+        out.write(";\n")
+        out.write("        const FIRMWARE_CHUNKS = null;\n        \n")
+    else:
+        out.write("        // Images are loaded on demand from FIRMWARE_CHUNKS.size sized chunk files\n")
+        out.write("        const FIRMWARE_IMAGES = null;\n")
+        out.write("        const FIRMWARE_CHUNKS = " + to_json(chunks.page_data(), indent)
+                  + ";\n        \n")
+    out.write("        // BPM -> index into FIRMWARE_IMAGES\n")
+    out.write("        const FIRMWARES = " + to_json(firmwares, indent) + ";\n        \n")
+
+    if base_path:
+        print()
+        print(f"Patch format: {manifest.stat(base_path)['size']} byte base image "
+              f"+ {patch_bytes} bytes of patches")
+    return firmwares, [bpms for bpms in aliases.values() if len(bpms) > 1]
+
+
+def clock_data(bpms, timers=None):
+    """BPM -> [clock period in ms, tempo actually played] for the page
+
+    timers is the timersearch.py table the library was built with, if
+    any. The BPMs it covers take their tempo from its error and their
+    period from that tempo; the rest follow the stock Timer0 model, their
+    period ticks converted at the real tick length (clocktable.tick_ms).
+    """
+    timers = timers or {}
+    clock = {}
+    for bpm in bpms:
+        if bpm in timers:
+            actual = bpm * (1 + timers[bpm]['error_pct'] / 100)
+            clock[bpm] = [round(60000 / (24 * actual), 2), round(actual, 2)]
+    stock = sorted(bpm for bpm in bpms if bpm not in clock)
+    if clock_table is not None and stock:
+        table = clock_table(stock)
+        tick = tick_ms()
+        clock.update((bpm, [round(int(period) * tick, 2), round(float(actual), 2)])
+                     for bpm, period, actual in zip(stock, table['period'], table['actual_bpm']))
+    return {bpm: clock[bpm] for bpm in sorted(clock)}
+
+
+def write_page(out, library, encoder, manifest, original=None, fmt='full', indent=None,
+               stats=None, chunks=None, timers=None):
+    """Stream the whole page to the open text file out
+
+    original is the path of the v3.0 firmware, or None. With a
+    ChunkWriter the images go to its files instead of the page. timers
+    is the timer table the library was built with (see clock_data).
+    Writing the page is timed as the html stage of stats, apart from the
+    stages nested in it.
+    """
+    with stage(stats, 'html'):
+        return _write_page(out, library, encoder, manifest, original, fmt, indent, stats, chunks,
+                           timers)
+
+
+def _write_page(out, library, encoder, manifest, original, fmt, indent, stats, chunks, timers):
+    original_b64 = manifest.encode(encoder, original) if original else None
+
+    out.write(PAGE_HEAD)
+    if original_b64:
+        out.write(RESTORE_SECTION)
+    out.write(PAGE_BODY)
+    firmwares, aliases = write_firmware_data(out, library, encoder, manifest, fmt, indent, stats,
+                                             chunks)
+    out.write("        // BPM -> [clock period in ms, tempo the internal clock actually plays]\n")
+    with stage(stats, 'clock'):
+        clock = clock_data(firmwares, timers)
+    out.write("        const FIRMWARE_CLOCK = " + to_json(clock, indent) + ";\n")
+    out.write("        \n")
+    out.write("        // Payloads are zlib compressed (use DecompressionStream when available)\n")
+    out.write("        const FIRMWARE_COMPRESSED = " + ('true' if encoder.compress else 'false') + ";\n")
+    out.write("        \n")
+    out.write("        // ORIGINAL FIRMWARE (if available)\n")
+    out.write("        const ORIGINAL_FIRMWARE = "
+              + (f'"{original_b64}"' if original_b64 else 'null') + ";\n")
+    out.write("        \n")
+    out.write(PAGE_SCRIPT)
+    return firmwares, aliases
 
-print("=" * 50)
-print("  SYNCHOLE Firmware Embedder")
-print("=" * 50)
-print()
-
-# Read original firmware (if exists)
-original_firmware_b64 = None
-if ORIGINAL_FIRMWARE.exists():
-    with open(ORIGINAL_FIRMWARE, 'rb') as f:
-        data = f.read()
-        original_firmware_b64 = base64.b64encode(data).decode('ascii')
-        print(f"✓ Original firmware found: v3.0 ({len(data)} bytes)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed the .syx library into a self-contained HTML page")
+    parser.add_argument('--format', choices=['full', 'patch'], default='full',
+                        help="full: every unique image as base64; "
+                             "patch: one base image plus a byte-patch list per BPM")
+    parser.add_argument('--compress', action='store_true',
+                        help="deflate the firmware payloads (decompressed in the browser)")
+    parser.add_argument('--chunk-size', type=int, metavar='N',
+                        help="write the payloads to script files of N images each, next to "
+                             "the page, which loads them on demand (1: a file per image)")
+    parser.add_argument('--timer-table', type=Path, metavar='FILE',
+                        help="the timersearch.py table the library was built with, "
+                             "for the tempos shown on the page")
+    parser.add_argument('--indent', type=int, default=None,
+                        help="pretty-print the embedded JSON (default: compact)")
+    parser.add_argument('--force', action='store_true',
+                        help="rewrite the page even if nothing changed")
+    parser.add_argument('--no-manifest', action='store_true',
+                        help=f"re-encode everything and don't update {MANIFEST.name}")
+    stagestats.add_arguments(parser)
+    args = parser.parse_args()
+    stagestats.run('embed-firmwares', lambda stats: embed(args, stats), args)
+
+
+def embed(args, stats=None, manifest=None):
+    """Build the page as main() was asked to
+
+    A long-running caller can pass the manifest of its previous run
+    (see EmbedManifest.next_run) to skip rereading it.
+    Returns the manifest.
+    """
+    print("=" * 50)
+    print("  SYNCHOLE Firmware Embedder")
+    print("=" * 50)
+    print()
+
+    if manifest is None:
+        manifest = EmbedManifest(None if args.no_manifest else MANIFEST)
+    chunk_size = getattr(args, 'chunk_size', None)
+    timer_table = getattr(args, 'timer_table', None)
+    timers = None
+    if timer_table:
+        from timersearch import load_table
+        try:
+            timers = load_table(timer_table)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            exit(1)
+    settings = {'format': args.format, 'compress': args.compress, 'indent': args.indent,
+                'chunk_size': chunk_size,
+                'template': hashlib.sha256(Path(__file__).read_bytes()).hexdigest(),
+                'clock': hashlib.sha256((SCRIPT_DIR / "clocktable.py").read_bytes()).hexdigest()
+                         if clock_table else None,
+                'timers': hashlib.sha256(timer_table.read_bytes()).hexdigest()
+                          if timer_table else None}
+
+    # Check original firmware (if exists)
+    original = None
+    if ORIGINAL_FIRMWARE.exists():
+        original = ORIGINAL_FIRMWARE
+        print(f"✓ Original firmware found: v3.0 ({manifest.stat(original)['size']} bytes)")
         print()
-else:
-    print("⚠ Original firmware not found (synchole-original-v3.0.syx)")
-    print("  Skipping restore option")
+    else:
+        print("⚠ Original firmware not found (synchole-original-v3.0.syx)")
+        print("  Skipping restore option")
+        print()
+
+    with stage(stats, 'scan'):
+        library = scan_library()
+        for _, path in library:
+            manifest.stat(path)
+    if not library:
+        print("❌ No .syx files found in bpm-builds/")
+        print("   Run ./build-comprehensive-library.sh first!")
+        exit(1)
+
+    if not args.force and manifest.unchanged(settings, OUTPUT_HTML):
+        print(f"✓ {len(library)} BPM firmware files unchanged")
+        print(f"  {OUTPUT_HTML.name} is up to date")
+        print()
+        return manifest
+
+    print(f"Found {len(library)} BPM firmware files:")
+    encoder = PayloadEncoder(args.compress, stats)
+    # Write next to the output and swap it in, so a failed run leaves
+    # the previous page intact
+    tmp_html = OUTPUT_HTML.with_suffix('.html.tmp')
+    chunks = ChunkWriter(CHUNK_DIR, chunk_size, args.indent) if chunk_size else None
+    try:
+        with open(tmp_html, 'w') as f:
+            firmwares, aliases = write_page(f, library, encoder, manifest, original,
+                                            args.format, args.indent, stats, chunks, timers)
+        os.replace(tmp_html, OUTPUT_HTML)
+        chunk_files = chunks.files if chunks else []
+        if CHUNK_DIR.exists():
+            remove_stale_chunks(CHUNK_DIR, chunk_files)
+        with stage(stats, 'manifest'):
+            manifest.save(settings, OUTPUT_HTML,
+                          [f"{CHUNK_DIR.name}/{name}" for name in chunk_files])
+    finally:
+        manifest.close()
+    if stats:
+        stats.count('firmwares', len(firmwares))
+        stats.count('images', len(set(firmwares.values())))
+        stats.count('encoded', manifest.encoded)
+        stats.count('raw_bytes', encoder.raw_bytes)
+        stats.count('stored_bytes', encoder.stored_bytes)
+        stats.count('page_bytes', OUTPUT_HTML.stat().st_size)
+        if chunks:
+            stats.count('chunks', len(chunks.files))
+            stats.count('chunks_written', chunks.written)
+
+    print()
+    unique = len(set(firmwares.values()))
+    print(f"Total BPM firmwares embedded: {len(firmwares)} ({unique} unique images, "
+          f"{manifest.encoded} encoded this run)")
+    if aliases:
+        print("Identical firmware (same clock period):")
+        for line in format_aliases(sorted(aliases)):
+            print(f"  {line}")
     print()
 
-# Read all .syx files
-firmwares = {}
-syx_files = sorted(BPM_BUILDS_DIR.glob("*.syx"))
+    print(f"✓ Created: {OUTPUT_HTML}")
+    print(f"  File size: {OUTPUT_HTML.stat().st_size / 1024:.1f} KB")
+    if chunks:
+        print(f"  Chunks: {len(chunks.files)} files of up to {chunk_size} images in "
+              f"{CHUNK_DIR.name}/ ({chunks.written} written this run)")
+    if args.compress:
+        print(f"  Payloads: {encoder.raw_bytes / 1024:.1f} KB -> {encoder.stored_bytes / 1024:.1f} KB "
+              f"compressed ({encoder.raw_bytes / max(encoder.stored_bytes, 1):.1f}:1)")
+    print()
+    print("Done! Open synchole-complete.html in your browser!")
+    print()
+    return manifest
 
-if not syx_files:
-    print("❌ No .syx files found in bpm-builds/")
-    print("   Run ./build-comprehensive-library.sh first!")
-    exit(1)
 
-print(f"Found {len(syx_files)} BPM firmware files:")
-for syx_file in syx_files:
-    # Extract BPM from filename
-    bpm = syx_file.stem.replace("synchole-", "").replace("bpm", "")
-    
-    # Read and encode
-    with open(syx_file, 'rb') as f:
-        data = f.read()
-        b64 = base64.b64encode(data).decode('ascii')
-        firmwares[int(bpm)] = b64
-        print(f"  ✓ {bpm} BPM ({len(data)} bytes)")
-
-print()
-print(f"Total BPM firmwares embedded: {len(firmwares)}")
-print()
-
-# Create HTML with embedded firmwares
-html_content = '''<!DOCTYPE html>
+# Page template, written around the streamed firmware data
+PAGE_HEAD = '''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -201,7 +783,7 @@ html_content = '''<!DOCTYPE html>
         
         .stats-grid {
             display: grid;
-            grid-template-columns: 1fr 1fr 1fr;
+            grid-template-columns: 1fr 1fr;
             gap: 20px;
             margin: 40px 0;
         }
@@ -484,7 +1066,9 @@ html_content = '''<!DOCTYPE html>
                 <div class="subtitle">Firmware Library v1.0</div>
             </div>
             
-            ''' + ('''<div class="restore-section" id="restoreSection">
+            '''
+
+RESTORE_SECTION = '''<div class="restore-section" id="restoreSection">
                 <div class="restore-icon">⚠️</div>
                 <div class="restore-title">Restore Original Firmware</div>
                 <div class="restore-text">
@@ -495,7 +1079,9 @@ html_content = '''<!DOCTYPE html>
                     DOWNLOAD ORIGINAL v3.0
                 </button>
             </div>
-            ''' if original_firmware_b64 else '') + '''
+            '''
+
+PAGE_BODY = '''
             
             <div class="control-section">
                 <div class="bpm-display" id="bpmDisplay">120</div>
@@ -515,6 +1101,10 @@ html_content = '''<!DOCTYPE html>
                         <div class="stat-label">Clock Rate</div>
                         <div class="stat-value" id="rateDisplay">48 Hz</div>
                     </div>
+                    <div class="stat-box">
+                        <div class="stat-label">True Tempo</div>
+                        <div class="stat-value" id="tempoDisplay">—</div>
+                    </div>
                     <div class="stat-box">
                         <div class="stat-label">Loaded</div>
                         <div class="stat-value" id="loadedCount">0</div>
@@ -550,13 +1140,9 @@ html_content = '''<!DOCTYPE html>
     </div>
     
     <script>
-        // EMBEDDED FIRMWARES (base64 encoded)
-        const FIRMWARES = ''' + json.dumps(firmwares, indent=8) + ''';
-        
-        // ORIGINAL FIRMWARE (if available)
-        const ORIGINAL_FIRMWARE = ''' + (f'"{original_firmware_b64}"' if original_firmware_b64 else 'null') + ''';
-        
-        // State
+'''
+
+PAGE_SCRIPT = '''        // State
         let currentBPM = 120;
         
         // Elements
@@ -564,11 +1150,186 @@ html_content = '''<!DOCTYPE html>
         const bpmDisplay = document.getElementById('bpmDisplay');
         const periodDisplay = document.getElementById('periodDisplay');
         const rateDisplay = document.getElementById('rateDisplay');
+        const tempoDisplay = document.getElementById('tempoDisplay');
         const loadedCount = document.getElementById('loadedCount');
         const downloadBtn = document.getElementById('downloadBtn');
         const availability = document.getElementById('availability');
         const restoreBtn = document.getElementById('restoreBtn');
         
+        // Convert base64 to binary
+        function decodeBase64(b64data) {
+            const binaryString = atob(b64data);
+            const bytes = new Uint8Array(binaryString.length);
+            for (let i = 0; i < binaryString.length; i++) {
+                bytes[i] = binaryString.charCodeAt(i);
+            }
+            return bytes;
+        }
+        
+        // Minimal zlib inflate (RFC 1950/1951) for browsers
+        // without DecompressionStream
+        function inflateFallback(data) {
+            const LBASE = [3,4,5,6,7,8,9,10,11,13,15,17,19,23,27,31,35,43,51,59,67,83,99,115,131,163,195,227,258];
+            const LEXT = [0,0,0,0,0,0,0,0,1,1,1,1,2,2,2,2,3,3,3,3,4,4,4,4,5,5,5,5,0];
+            const DBASE = [1,2,3,4,5,7,9,13,17,25,33,49,65,97,129,193,257,385,513,769,1025,1537,2049,3073,4097,6145,8193,12289,16385,24577];
+            const DEXT = [0,0,0,0,1,1,2,2,3,3,4,4,5,5,6,6,7,7,8,8,9,9,10,10,11,11,12,12,13,13];
+            const ORDER = [16,17,18,0,8,7,9,6,10,5,11,4,12,3,13,2,14,1,15];
+            const out = [];
+            let pos = 2;  // skip the zlib header
+            let bitBuf = 0, bitCount = 0;
+            
+            function bits(n) {
+                while (bitCount < n) {
+                    bitBuf |= data[pos++] << bitCount;
+                    bitCount += 8;
+                }
+                const value = bitBuf & ((1 << n) - 1);
+                bitBuf >>>= n;
+                bitCount -= n;
+                return value;
+            }
+            
+            // Canonical Huffman table: code counts per length + sorted symbols
+            function huffman(lengths) {
+                const counts = new Array(16).fill(0);
+                const offsets = new Array(16).fill(0);
+                for (const len of lengths) counts[len]++;
+                counts[0] = 0;
+                for (let len = 1; len < 16; len++) offsets[len] = offsets[len - 1] + counts[len - 1];
+                const symbols = [];
+                lengths.forEach((len, sym) => { if (len) symbols[offsets[len]++] = sym; });
+                return { counts, symbols };
+            }
+            
+            function decode(table) {
+                let code = 0, first = 0, index = 0;
+                for (let len = 1; len < 16; len++) {
+                    code |= bits(1);
+                    const count = table.counts[len];
+                    if (code - count < first) return table.symbols[index + code - first];
+                    index += count;
+                    first = (first + count) << 1;
+                    code <<= 1;
+                }
+                throw new Error('Corrupt firmware payload');
+            }
+            
+            let last;
+            do {
+                last = bits(1);
+                const type = bits(2);
+                if (type === 0) {
+                    // Stored block
+                    bitBuf = bitCount = 0;
+                    const len = data[pos] | (data[pos + 1] << 8);
+                    pos += 4;
+                    for (let i = 0; i < len; i++) out.push(data[pos++]);
+                    continue;
+                }
+                let lit, dist;
+                if (type === 1) {
+                    // Fixed Huffman codes
+                    const lengths = [];
+                    for (let i = 0; i < 288; i++) lengths.push(i < 144 ? 8 : i < 256 ? 9 : i < 280 ? 7 : 8);
+                    lit = huffman(lengths);
+                    dist = huffman(new Array(30).fill(5));
+                } else {
+                    // Dynamic Huffman codes
+                    const nlit = bits(5) + 257, ndist = bits(5) + 1, ncode = bits(4) + 4;
+                    const codeLengths = new Array(19).fill(0);
+                    for (let i = 0; i < ncode; i++) codeLengths[ORDER[i]] = bits(3);
+                    const codeTable = huffman(codeLengths);
+                    const lengths = [];
+                    while (lengths.length < nlit + ndist) {
+                        const sym = decode(codeTable);
+                        if (sym < 16) {
+                            lengths.push(sym);
+                        } else {
+                            const [value, repeat] = sym === 16 ? [lengths[lengths.length - 1], 3 + bits(2)]
+                                                  : sym === 17 ? [0, 3 + bits(3)] : [0, 11 + bits(7)];
+                            for (let i = 0; i < repeat; i++) lengths.push(value);
+                        }
+                    }
+                    lit = huffman(lengths.slice(0, nlit));
+                    dist = huffman(lengths.slice(nlit));
+                }
+                for (;;) {
+                    const sym = decode(lit);
+                    if (sym < 256) {
+                        out.push(sym);
+                    } else if (sym === 256) {
+                        break;
+                    } else {
+                        const len = LBASE[sym - 257] + bits(LEXT[sym - 257]);
+                        const d = decode(dist);
+                        const distance = DBASE[d] + bits(DEXT[d]);
+                        for (let i = 0; i < len; i++) out.push(out[out.length - distance]);
+                    }
+                }
+            } while (!last);
+            return new Uint8Array(out);
+        }
+        
+        // Decode an embedded payload to bytes
+        async function decodePayload(b64data) {
+            const bytes = decodeBase64(b64data);
+            if (!FIRMWARE_COMPRESSED) {
+                return bytes;
+            }
+            if (typeof DecompressionStream === 'undefined') {
+                return inflateFallback(bytes);
+            }
+            const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+            return new Uint8Array(await new Response(stream).arrayBuffer());
+        }
+        
+        // Chunk files (when the images aren't embedded) are loaded with a
+        // script tag, which also works when the page is opened from disk
+        const loadedChunks = {};
+        const chunkLoads = {};
+        function firmwareChunk(index, images) {
+            loadedChunks[index] = images;
+        }
+        function loadChunk(index) {
+            if (!chunkLoads[index]) {
+                chunkLoads[index] = new Promise((resolve, reject) => {
+                    const script = document.createElement('script');
+                    script.src = `${FIRMWARE_CHUNKS.dir}/${FIRMWARE_CHUNKS.files[index]}`;
+                    script.onload = () => resolve(loadedChunks[index]);
+                    script.onerror = () => {
+                        delete chunkLoads[index];
+                        reject(new Error(`Can't load ${script.src}`));
+                    };
+                    document.head.appendChild(script);
+                });
+            }
+            return chunkLoads[index];
+        }
+        async function getImage(index) {
+            if (!FIRMWARE_CHUNKS) {
+                return FIRMWARE_IMAGES[index];
+            }
+            const images = await loadChunk(Math.floor(index / FIRMWARE_CHUNKS.size));
+            return images[index % FIRMWARE_CHUNKS.size];
+        }
+        
+        // Rebuild the .syx for a BPM (only done on download)
+        let baseImage = null;
+        async function getFirmware(bpm) {
+            const image = await getImage(FIRMWARES[bpm]);
+            if (typeof image === 'string') {
+                return decodePayload(image);
+            }
+            if (!baseImage) {
+                baseImage = await decodePayload(FIRMWARE_BASE);
+            }
+            const bytes = baseImage.slice();
+            for (let i = 0; i < image.length; i += 2) {
+                bytes[image[i]] = image[i + 1];
+            }
+            return bytes;
+        }
+        
         // Calculate timings
         function calculateTimings(bpm) {
             const period = Math.round(60000 / (bpm * 24));
@@ -587,9 +1348,11 @@ html_content = '''<!DOCTYPE html>
         // Update display
         function updateDisplay() {
             const { period, rate } = calculateTimings(currentBPM);
+            const clock = FIRMWARE_CLOCK[currentBPM];
             bpmDisplay.textContent = currentBPM;
-            periodDisplay.textContent = `${period}ms`;
+            periodDisplay.textContent = `${clock ? clock[0] : period}ms`;
             rateDisplay.textContent = `${rate} Hz`;
+            tempoDisplay.textContent = clock ? clock[1].toFixed(2) : '—';
             
             const available = FIRMWARES.hasOwnProperty(currentBPM);
             
@@ -615,21 +1378,29 @@ html_content = '''<!DOCTYPE html>
         bpmSlider.addEventListener('input', (e) => {
             currentBPM = parseInt(e.target.value);
             updateDisplay();
+            // Start fetching the firmware's chunk before it's downloaded
+            if (FIRMWARE_CHUNKS && FIRMWARES.hasOwnProperty(currentBPM)) {
+                getImage(FIRMWARES[currentBPM]).catch(() => {});
+            }
         });
         
         // Download handler
-        downloadBtn.addEventListener('click', () => {
-            const b64data = FIRMWARES[currentBPM];
-            if (!b64data) return;
+        downloadBtn.addEventListener('click', async () => {
+            if (!FIRMWARES.hasOwnProperty(currentBPM)) return;
             
             downloadBtn.textContent = 'DOWNLOADING...';
             downloadBtn.classList.add('downloading');
             
-            // Convert base64 to binary
-            const binaryString = atob(b64data);
-            const bytes = new Uint8Array(binaryString.length);
-            for (let i = 0; i < binaryString.length; i++) {
-                bytes[i] = binaryString.charCodeAt(i);
+            let bytes;
+            try {
+                bytes = await getFirmware(currentBPM);
+            } catch (err) {
+                downloadBtn.textContent = '✗ DOWNLOAD FAILED';
+                setTimeout(() => {
+                    downloadBtn.textContent = 'DOWNLOAD FIRMWARE';
+                    downloadBtn.classList.remove('downloading');
+                }, 2000);
+                return;
             }
             
             // Create download
@@ -651,16 +1422,11 @@ html_content = '''<!DOCTYPE html>
         
         // Restore button handler
         if (restoreBtn && ORIGINAL_FIRMWARE) {
-            restoreBtn.addEventListener('click', () => {
+            restoreBtn.addEventListener('click', async () => {
                 restoreBtn.textContent = 'DOWNLOADING...';
                 restoreBtn.classList.add('downloading');
                 
-                // Convert base64 to binary
-                const binaryString = atob(ORIGINAL_FIRMWARE);
-                const bytes = new Uint8Array(binaryString.length);
-                for (let i = 0; i < binaryString.length; i++) {
-                    bytes[i] = binaryString.charCodeAt(i);
-                }
+                const bytes = await decodePayload(ORIGINAL_FIRMWARE);
                 
                 // Create download
                 const blob = new Blob([bytes], { type: 'application/octet-stream' });
@@ -685,14 +1451,9 @@ html_content = '''<!DOCTYPE html>
         updateDisplay();
     </script>
 </body>
-</html>'''
+</html>
+'''
 
-# Write HTML file
-with open(OUTPUT_HTML, 'w') as f:
-    f.write(html_content)
 
-print(f"✓ Created: {OUTPUT_HTML}")
-print(f"  File size: {OUTPUT_HTML.stat().st_size / 1024:.1f} KB")
-print()
-print("Done! Open synchole-complete.html in your browser!")
-print()
+if __name__ == '__main__':
+    main()
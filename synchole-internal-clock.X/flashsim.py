@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Simulate the MIDI bootloader receiving a SysEx firmware stream
+
+Models the PIC12F1822 side of a flash: bytes arrive over MIDI at 31250
+baud into the EUSART's two byte receive FIFO, and every complete block
+is written to flash. The CPU stalls during a flash write, so bytes that
+arrive while the FIFO is full are lost (an overrun). The sender pauses
+for a gap after each message to avoid that; this works out the smallest
+safe gap and how long the whole flash then takes.
+
+    ./flashsim.py bpm-builds/synchole-120bpm.syx
+    ./flashsim.py firmware.syx --gap 4 --product b
+"""
+
+import argparse
+import sys
+
+import hextosyx
+
+MIDI_BAUD = 31250
+BITS_PER_BYTE = 10          # start + 8 data + stop
+UART_FIFO_DEPTH = 2         # EUSART receive FIFO
+
+# PIC12F1822 self-write timing, worst case (datasheet TPEW max)
+FLASH_WRITE_MS = 2.5
+FLASH_ERASE_MS = 2.5
+ERASE_ROW_WORDS = 32        # erase granularity; writes go 16 word latches at a time
+
+# Timing slack so a byte landing exactly as a write ends isn't an overrun
+EPSILON_MS = 1e-6
+
+
+def byte_time_ms(baud=MIDI_BAUD):
+    """Time to receive one byte on the wire"""
+    return 1000.0 * BITS_PER_BYTE / baud
+
+
+def block_flash_ms(block, block_size, write_ms=FLASH_WRITE_MS,
+                   erase_ms=FLASH_ERASE_MS, row_words=ERASE_ROW_WORDS):
+    """Time the bootloader stalls writing data block number block
+
+    A block starting on an erase row boundary erases the row first.
+    """
+    start = block * block_size
+    erase = erase_ms if start % row_words == 0 else 0.0
+    return erase + write_ms * max(1, block_size // 16)
+
+
+def min_safe_gap_ms(blocks, block_size, write_ms=FLASH_WRITE_MS, erase_ms=FLASH_ERASE_MS,
+                    fifo_depth=UART_FIFO_DEPTH, baud=MIDI_BAUD):
+    """Smallest pause after each message that avoids a receive overrun
+
+    After a block's F7 the bootloader is busy for its flash time. The
+    next bytes queue in the FIFO, so the byte after the FIFO fills must
+    not complete before the write does.
+    """
+    slowest = max((block_flash_ms(b, block_size, write_ms, erase_ms)
+                   for b in range(blocks)), default=0.0)
+    return max(0.0, slowest - (fifo_depth + 1) * byte_time_ms(baud))
+
+
+def simulate(data, product_key='b', gap_ms=0.0, write_ms=FLASH_WRITE_MS,
+             erase_ms=FLASH_ERASE_MS, fifo_depth=UART_FIFO_DEPTH, baud=MIDI_BAUD):
+    """Play a SysEx stream into the modelled bootloader
+
+    The sender transmits each message back to back and waits gap_ms after
+    every F7. Returns a result dict with the blocks written, the total
+    time until the last write finishes, and lists of overruns and
+    protocol errors (wrong sequence, bad framing, missing end marker).
+    """
+    product = hextosyx.get_product(product_key)
+    block_size = product['block_size']
+    msg_len = 5 + 2 * block_size + 1
+    header = bytes([hextosyx.SYSEX_START, hextosyx.SYSEX_ID0, hextosyx.SYSEX_ID1])
+    bt = byte_time_ms(baud)
+
+    result = {'blocks': 0, 'bytes': len(data), 'overruns': [], 'errors': [],
+              'skipped': 0, 'complete': False, 'gap_ms': gap_ms, 'total_ms': 0.0}
+    state = {'busy_until': 0.0, 'msg': None, 'msg_num': 0, 'sequence': 1, 'done': False}
+    fifo = []
+
+    def finish_message(msg, now):
+        num = state['msg_num']
+        state['msg_num'] += 1
+        if state['done']:
+            result['errors'].append(f"message {num}: data after the end marker")
+            return
+        if len(msg) != msg_len or msg[:3] != header:
+            result['errors'].append(f"message {num}: bad framing ({len(msg)} bytes)")
+            return
+        if msg[3] != product['id']:
+            # Meant for a different product: the bootloader ignores it
+            result['skipped'] += 1
+            return
+        payload = msg[5:-1]
+        if max(payload) > 0x7F:
+            result['errors'].append(f"message {num}: payload byte has bit 7 set")
+            return
+        sequence = msg[4]
+        if sequence == 0:
+            if any(payload):
+                result['errors'].append(f"message {num}: end marker payload isn't zero")
+            state['done'] = True
+            return
+        if sequence != state['sequence']:
+            result['errors'].append(f"message {num}: sequence {sequence}, "
+                                    f"expected {state['sequence']}")
+            return
+        state['busy_until'] = now + block_flash_ms(result['blocks'], block_size,
+                                                   write_ms, erase_ms)
+        result['blocks'] += 1
+        state['sequence'] = state['sequence'] % 0x7F + 1
+
+    def receive(byte, now):
+        if byte == hextosyx.SYSEX_START:
+            if state['msg'] is not None:
+                result['errors'].append(f"message {state['msg_num']}: F0 before F7")
+                state['msg_num'] += 1
+            state['msg'] = bytearray([byte])
+        elif state['msg'] is not None:
+            state['msg'].append(byte)
+            if byte == hextosyx.SYSEX_END:
+                msg, state['msg'] = state['msg'], None
+                finish_message(msg, now)
+
+    def drain(now):
+        # Bytes leave the FIFO as soon as the CPU is running again
+        while fifo and state['busy_until'] <= now + EPSILON_MS:
+            arrived, byte = fifo.pop(0)
+            receive(byte, max(arrived, state['busy_until']))
+
+    now = 0.0
+    for byte in data:
+        now += bt
+        drain(now)
+        if len(fifo) >= fifo_depth:
+            result['overruns'].append((state['msg_num'], now))
+        else:
+            fifo.append((now, byte))
+            drain(now)
+        if byte == hextosyx.SYSEX_END:
+            now += gap_ms
+    drain(float('inf'))
+
+    result['complete'] = state['done']
+    if not state['done']:
+        result['errors'].append("no end marker received")
+    result['total_ms'] = max(now, state['busy_until'])
+    result['ok'] = result['complete'] and not result['overruns'] and not result['errors']
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Simulate flashing a .syx file into the MIDI bootloader")
+    parser.add_argument('syx', help="SysEx firmware file")
+    parser.add_argument('-p', '--product', default='b',
+                        help="product key (default: b, Synchole)")
+    parser.add_argument('--gap', type=float,
+                        help="pause after each message in ms (default: the minimum safe gap)")
+    parser.add_argument('--write-ms', type=float, default=FLASH_WRITE_MS,
+                        help=f"flash write time per 16 words (default: {FLASH_WRITE_MS})")
+    parser.add_argument('--erase-ms', type=float, default=FLASH_ERASE_MS,
+                        help=f"flash row erase time (default: {FLASH_ERASE_MS})")
+    parser.add_argument('--fifo', type=int, default=UART_FIFO_DEPTH,
+                        help=f"UART receive FIFO depth (default: {UART_FIFO_DEPTH})")
+    parser.add_argument('--baud', type=int, default=MIDI_BAUD)
+    args = parser.parse_args()
+
+    try:
+        product = hextosyx.get_product(args.product)
+        with open(args.syx, 'rb') as infile:
+            data = infile.read()
+    except (hextosyx.HexToSyxError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+
+    msg_len = 5 + 2 * product['block_size'] + 1
+    blocks = max(0, len(data) // msg_len - 1)
+    safe_gap = min_safe_gap_ms(blocks, product['block_size'], args.write_ms,
+                               args.erase_ms, args.fifo, args.baud)
+    gap = safe_gap if args.gap is None else args.gap
+    result = simulate(data, args.product, gap, args.write_ms, args.erase_ms,
+                      args.fifo, args.baud)
+
+    print("=" * 50)
+    print(f"  Flash Simulation: {product['name']}")
+    print("=" * 50)
+    print()
+    print(f"Stream: {len(data)} bytes, {blocks} blocks of {product['block_size']} words")
+    print(f"Wire time: {len(data) * byte_time_ms(args.baud):.1f} ms at {args.baud} baud")
+    print(f"Gap after each message: {gap:.2f} ms")
+    print()
+    print(f"Blocks written: {result['blocks']}")
+    print(f"Total flash time: {result['total_ms'] / 1000:.3f} s")
+    if result['skipped']:
+        print(f"⚠ {result['skipped']} messages for another product ignored")
+    if result['overruns']:
+        first_msg, first_time = result['overruns'][0]
+        print(f"✗ {len(result['overruns'])} bytes lost to overruns "
+              f"(first in message {first_msg} at {first_time:.1f} ms)")
+    for error in result['errors'][:5]:
+        print(f"✗ {error}")
+    if len(result['errors']) > 5:
+        print(f"  ... {len(result['errors']) - 5} more errors")
+    print()
+    safe = simulate(data, args.product, safe_gap, args.write_ms, args.erase_ms,
+                    args.fifo, args.baud) if gap != safe_gap else result
+    print(f"Minimum safe gap: {safe_gap:.2f} ms per message "
+          f"(total {safe['total_ms'] / 1000:.3f} s)")
+
+    if result['ok']:
+        print("✓ Flash completed without errors")
+    else:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
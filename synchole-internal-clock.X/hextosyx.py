@@ -5,8 +5,21 @@ Python port for Mac/Linux compatibility
 Based on original C++ version by hotchk155/Jason
 """
 
+import argparse
+import bisect
+import contextlib
+import glob
+import io
+import os
 import sys
 import struct
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import stagestats
+except ImportError:
+    # Copied on its own, without the library build tools: no --stats
+    stagestats = None
 
 # SysEx protocol constants
 SYSEX_START = 0xF0
@@ -14,12 +27,16 @@ SYSEX_ID0 = 0x00
 SYSEX_ID1 = 0x7F
 SYSEX_END = 0xF7
 
+# Bumped whenever the generated SysEx could change (see buildcache.py)
+__version__ = '1.2'
+
+# Default program memory size in bytes, for products without a memory_size
 MEMORY_SIZE = 8 * 2 * 1024
 
-# Product configurations
+# Product configurations (memory_size: program memory in bytes, optional)
 PRODUCTS = {
     'a': {'name': 'CV.OCD', 'id': 0x12, 'block_size': 32},
-    'b': {'name': 'Synchole', 'id': 0x14, 'block_size': 16},
+    'b': {'name': 'Synchole', 'id': 0x14, 'block_size': 16, 'memory_size': 2 * 2048},
     'c': {'name': 'Orange Squeeze', 'id': 0x13, 'block_size': 32},
     'd': {'name': 'MIDI Switcher (Original)', 'id': 0x16, 'block_size': 32},
     'e': {'name': 'MIDI Hub', 'id': 0x17, 'block_size': 32},
@@ -40,8 +57,213 @@ def from_hex(c):
     return 0
 
 
-def read_hex(infile):
-    """Read Intel HEX file and return memory array and max address"""
+def _stage(stats, name):
+    """Time a stage when instrumentation is on (see stagestats.py)"""
+    return stats.stage(name) if stats is not None else contextlib.nullcontext()
+
+
+class HexToSyxError(Exception):
+    """Base class for conversion errors raised by the library functions"""
+
+
+class HexFormatError(HexToSyxError):
+    """Raised when a HEX file can't be parsed"""
+
+
+class SysExFormatError(HexToSyxError):
+    """Raised when a SysEx stream isn't valid bootloader data"""
+
+
+class SparseMemory:
+    """Program memory image holding only the address ranges that were written
+
+    Reads outside them return erased flash (0xFF). Indexing and slicing
+    work like the bytearray image this replaces, so memory[addr],
+    memory[:length] and memory[0:4] = memory[4:8] behave the same; slices
+    come back as bytearrays. size is the memory size in bytes, or None
+    for no limit.
+    """
+
+    def __init__(self, size=MEMORY_SIZE, fill=0xFF):
+        self.size = size
+        self.fill = fill
+        self.starts = []        # segment start addresses, ascending
+        self.segments = []      # bytearray per segment
+
+    @property
+    def end(self):
+        """One past the highest address written (0 when empty)"""
+        return self.starts[-1] + len(self.segments[-1]) if self.starts else 0
+
+    def ranges(self):
+        """(start, end) of every populated range, in address order"""
+        return [(start, start + len(seg)) for start, seg in zip(self.starts, self.segments)]
+
+    def write(self, addr, data):
+        """Store data at addr, merging with the ranges it touches"""
+        end = addr + len(data)
+        if not data:
+            return
+        if self.starts and self.end == addr:
+            # HEX records are usually in address order
+            self.segments[-1] += data
+            return
+        first = bisect.bisect_right(self.starts, addr) - 1
+        if first < 0 or self.starts[first] + len(self.segments[first]) < addr:
+            first += 1
+        last = bisect.bisect_right(self.starts, end)
+        if first == last:
+            self.starts.insert(first, addr)
+            self.segments.insert(first, bytearray(data))
+            return
+        start = min(addr, self.starts[first])
+        merged = self.read(start, max(end, self.starts[last - 1] + len(self.segments[last - 1])))
+        merged[addr - start:end - start] = data
+        self.starts[first:last] = [start]
+        self.segments[first:last] = [merged]
+
+    def read(self, start, end):
+        """Bytes from start to end as a bytearray, gaps filled with 0xFF"""
+        out = bytearray([self.fill]) * max(0, end - start)
+        i = max(0, bisect.bisect_right(self.starts, start) - 1)
+        while i < len(self.starts) and self.starts[i] < end:
+            seg_start = self.starts[i]
+            seg = self.segments[i]
+            lo = max(start, seg_start)
+            hi = min(end, seg_start + len(seg))
+            if lo < hi:
+                out[lo - start:hi - start] = seg[lo - seg_start:hi - seg_start]
+            i += 1
+        return out
+
+    def copy(self):
+        """An independent copy of the image"""
+        other = SparseMemory(self.size, self.fill)
+        other.starts = list(self.starts)
+        other.segments = [bytearray(seg) for seg in self.segments]
+        return other
+
+    def __len__(self):
+        return self.end if self.size is None else self.size
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            data = self.read(start, max(start, stop))
+            return data if step == 1 else data[::step]
+        return self.read(key, key + 1)[0]
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1 or len(value) != max(0, stop - start):
+                raise ValueError("only same-length contiguous slices can be assigned")
+            self.write(start, bytes(value))
+        else:
+            self.write(key, bytes([value]))
+
+
+def parse_hex(infile, notes=None, memory_size=MEMORY_SIZE, stats=None, overflow=None):
+    """Parse Intel HEX and return the memory image and max address
+
+    Each record payload is decoded in one go with bytes.fromhex() and
+    stored in a SparseMemory, so only the ranges present take space.
+    Records past memory_size (e.g. the config words) are skipped, or
+    stored in the SparseMemory overflow if given; None keeps everything.
+    Raises HexFormatError on a malformed record.
+    Informational messages and warnings (address offsets, skipped
+    records) are appended to the notes list, if given. The number of
+    records read is counted in stats, if given.
+    """
+    memory = SparseMemory(memory_size)
+    max_addr = 0
+    offset = 0
+    line_num = 0
+    records = 0
+    
+    for line in infile:
+        line_num += 1
+        line = line.strip()
+        
+        if not line or not line.startswith(':'):
+            continue
+        
+        if len(line) < 11:
+            raise HexFormatError(f"Line {line_num} too short")
+        
+        try:
+            header = bytes.fromhex(line[1:9])
+        except ValueError:
+            raise HexFormatError(f"Invalid hex digit at line {line_num}") from None
+        data_len = header[0]
+        rec_type = header[3]
+        
+        if 2 * data_len + 11 != len(line):
+            raise HexFormatError(f"Line {line_num} length mismatch")
+        
+        records += 1
+        if rec_type == 1:  # END OF FILE
+            break
+        elif rec_type == 4:  # EXTENDED LINEAR ADDRESS
+            if len(line) != 15:
+                raise HexFormatError(f"Invalid extended address at line {line_num}")
+            try:
+                offset = int(line[9:13], 16) << 16
+            except ValueError:
+                raise HexFormatError(f"Invalid hex digit at line {line_num}") from None
+            if notes is not None:
+                notes.append(f"Linear address offset 0x{offset:x} from line {line_num}")
+        elif rec_type == 0:  # DATA
+            addr = (header[1] << 8 | header[2]) + offset
+            
+            if memory_size is not None and addr + data_len > memory_size and overflow is None:
+                if notes is not None:
+                    notes.append(f"Warning: Address 0x{addr:x} out of range at line {line_num}")
+                continue
+            
+            try:
+                data = bytes.fromhex(line[9:9 + 2 * data_len])
+            except ValueError:
+                raise HexFormatError(f"Invalid hex digit at line {line_num}") from None
+            end = addr + data_len
+            if memory_size is not None and end > memory_size:
+                overflow.write(addr, data)
+                continue
+            memory.write(addr, data)
+            if data_len and max_addr < end:
+                max_addr = end
+        elif notes is not None:
+            notes.append(f"Warning: Unsupported record type {rec_type} at line {line_num}")
+    
+    if stats is not None:
+        stats.count('records', records)
+    return memory, max_addr
+
+
+def read_hex(infile, memory_size=MEMORY_SIZE):
+    """Read Intel HEX file and return memory array and max address
+
+    Command line wrapper around parse_hex(): prints its messages and
+    returns (None, 0) instead of raising.
+    """
+    notes = []
+    try:
+        memory, max_addr = parse_hex(infile, notes, memory_size)
+    except HexFormatError as e:
+        for note in notes:
+            print(note)
+        print(f"Error: {e}")
+        return None, 0
+    for note in notes:
+        print(note)
+    return memory, max_addr
+
+
+def read_hex_reference(infile):
+    """Reference line-by-line HEX reader (one nibble at a time).
+
+    Kept to cross-check read_hex(); both must build identical images.
+    """
     memory = bytearray([0xFF] * MEMORY_SIZE)
     max_addr = 0
     offset = 0
@@ -108,19 +330,140 @@ def read_hex(infile):
     return memory, max_addr
 
 
-def reformat_reset_vec(memory):
-    """Handle MPLABX double reset vector"""
+def fix_reset_vec(memory):
+    """Handle MPLABX double reset vector, return True if it was reformatted"""
     if (memory[0] == 0x80 and memory[1] == 0x31 and
         memory[2] == 0x02 and memory[3] == 0x28):
-        memory[0] = memory[4]
-        memory[1] = memory[5]
-        memory[2] = memory[6]
-        memory[3] = memory[7]
+        memory[0:4] = memory[4:8]
+        return True
+    return False
+
+
+def reformat_reset_vec(memory):
+    """Handle MPLABX double reset vector"""
+    if fix_reset_vec(memory):
         print("*** REFORMATTED 4 WORD RESET VECTOR ***")
 
 
+# Lookup tables splitting a little endian word (lo, hi) into the two
+# 7-bit SysEx bytes (word >> 7, word & 0x7F) of its 14-bit value
+_HI_TO_MSB = bytes((b & 0x3F) << 1 for b in range(256))
+_LO_TO_MSB = bytes(b >> 7 for b in range(256))
+_LO_TO_LSB = bytes(b & 0x7F for b in range(256))
+# High byte of a word masked to the 14 bits of program memory
+_HI_MASK = bytes(b & 0x3F for b in range(256))
+
+
+def pack_words(data):
+    """Pack little endian words into 7-bit SysEx byte pairs"""
+    lo = data[0::2]
+    hi = data[1::2]
+    count = len(lo)
+    # The two MSB contributions never share a bit, so OR them in one go
+    msb = (int.from_bytes(hi.translate(_HI_TO_MSB), 'little') |
+           int.from_bytes(lo.translate(_LO_TO_MSB), 'little')).to_bytes(count, 'little')
+    packed = bytearray(2 * count)
+    packed[0::2] = msb
+    packed[1::2] = lo.translate(_LO_TO_LSB)
+    return packed
+
+
+def encode_sysex(memory, max_addr, product_id, block_size):
+    """Encode memory as a SysEx stream and return it as bytes"""
+    block_bytes = 2 * block_size
+    num_blocks = (max_addr + block_bytes - 1) // block_bytes
+    
+    # Whole blocks are sent, so pad the image out with erased flash
+    image = bytes(memory[:num_blocks * block_bytes])
+    if len(image) < num_blocks * block_bytes:
+        image += b'\xff' * (num_blocks * block_bytes - len(image))
+    return frame_sysex(pack_words(image), num_blocks, product_id, block_size)
+
+
+def frame_sysex(packed, num_blocks, product_id, block_size):
+    """Wrap num_blocks blocks of pack_words() output in SysEx messages,
+    followed by the end marker"""
+    block_bytes = 2 * block_size
+    msg_len = 5 + block_bytes + 1
+    out = bytearray((num_blocks + 1) * msg_len)
+    msg_sequence = 1
+    pos = 0
+    for block in range(num_blocks):
+        out[pos:pos + 5] = bytes([SYSEX_START, SYSEX_ID0, SYSEX_ID1, product_id, msg_sequence])
+        out[pos + 5:pos + 5 + block_bytes] = packed[block * block_bytes:(block + 1) * block_bytes]
+        out[pos + msg_len - 1] = SYSEX_END
+        pos += msg_len
+        
+        # Increment sequence number (1-127)
+        msg_sequence += 1
+        if msg_sequence > 0x7F:
+            msg_sequence = 1
+    
+    # End marker (sequence 0), payload is already zero
+    out[pos:pos + 5] = bytes([SYSEX_START, SYSEX_ID0, SYSEX_ID1, product_id, 0x00])
+    out[pos + msg_len - 1] = SYSEX_END
+    return bytes(out)
+
+
+def iter_sysex(memory, max_addr, product_id, block_size):
+    """Yield the SysEx stream of encode_sysex() one message at a time
+
+    Each block is packed as it is requested, so a sender can stream the
+    image without building the whole stream first.
+    """
+    block_bytes = 2 * block_size
+    msg_sequence = 1
+    for addr in range(0, max_addr, block_bytes):
+        block = bytes(memory[addr:addr + block_bytes])
+        block += b'\xff' * (block_bytes - len(block))
+        yield (bytes([SYSEX_START, SYSEX_ID0, SYSEX_ID1, product_id, msg_sequence]) +
+               pack_words(block) + bytes([SYSEX_END]))
+        msg_sequence = msg_sequence % 0x7F + 1
+    yield (bytes([SYSEX_START, SYSEX_ID0, SYSEX_ID1, product_id, 0x00]) +
+           bytes(block_bytes) + bytes([SYSEX_END]))
+
+
+def iter_messages(infile, chunk_size=4096):
+    """Yield the F0 ... F7 messages of a binary SysEx file one at a time
+
+    Each message is checked to start with F0 and to be long enough for
+    the F0 00 7F <product> <seq> header and the F7, so callers can index
+    the header. Raises SysExFormatError otherwise.
+    """
+    pending = b''
+    msg = 0
+    while True:
+        chunk = infile.read(chunk_size)
+        if not chunk:
+            break
+        pending += chunk
+        start = 0
+        while True:
+            end = pending.find(SYSEX_END, start)
+            if end < 0:
+                break
+            if pending[start] != SYSEX_START:
+                raise SysExFormatError(f"Message {msg} doesn't start with F0")
+            if end - start < 5:
+                raise SysExFormatError(f"Message {msg} is too short for the header")
+            yield pending[start:end + 1]
+            start = end + 1
+            msg += 1
+        pending = pending[start:]
+    if pending:
+        raise SysExFormatError("Stream ends in the middle of a message")
+
+
 def write_sysex(outfile, memory, max_addr, product_id, block_size):
     """Write memory to SysEx file"""
+    outfile.write(encode_sysex(memory, max_addr, product_id, block_size))
+
+
+def write_sysex_reference(outfile, memory, max_addr, product_id, block_size):
+    """Reference word-by-word SysEx writer.
+
+    Kept to cross-check encode_sysex(); both must produce identical output.
+    """
     msg_sequence = 1
     addr = 0
     
@@ -149,10 +492,731 @@ def write_sysex(outfile, memory, max_addr, product_id, block_size):
     outfile.write(bytes([SYSEX_END]))
 
 
+# Inverse tables: rebuild the little endian word bytes from the two
+# 7-bit SysEx bytes
+_MSB_TO_LO = bytes((b & 1) << 7 for b in range(256))
+_MSB_TO_HI = bytes(b >> 1 for b in range(256))
+
+
+def unpack_words(packed):
+    """Unpack 7-bit SysEx byte pairs into little endian 14-bit words"""
+    msb = packed[0::2]
+    lsb = packed[1::2]
+    count = len(msb)
+    lo = (int.from_bytes(msb.translate(_MSB_TO_LO), 'little') |
+          int.from_bytes(lsb, 'little')).to_bytes(count, 'little')
+    data = bytearray(2 * count)
+    data[0::2] = lo
+    data[1::2] = msb.translate(_MSB_TO_HI)
+    return data
+
+
+def decode_sysex(data, product_key=None):
+    """Decode a bootloader SysEx stream back into its flash image
+
+    The inverse of encode_sysex(): checks the F0 00 7F <product> <seq>
+    framing, the 1-127 sequence numbers, the 7-bit payload and the
+    all-zero end marker block. Returns (image, product_id, block_size)
+    where image holds the 14-bit words little endian, padded to whole
+    blocks. Raises SysExFormatError on the first problem found.
+    """
+    data = bytes(data)
+    if not data or data[0] != SYSEX_START:
+        raise SysExFormatError("Stream doesn't start with F0")
+    end = data.find(SYSEX_END)
+    if end < 5:
+        raise SysExFormatError("First message is truncated")
+    msg_len = end + 1
+    block_bytes = msg_len - 6
+    if block_bytes <= 0 or block_bytes % 2:
+        raise SysExFormatError(f"Bad message length {msg_len}")
+    if len(data) % msg_len:
+        raise SysExFormatError(f"Stream length {len(data)} isn't a multiple "
+                               f"of the {msg_len} byte message length")
+    
+    product_id = data[3]
+    if product_key is not None:
+        product = get_product(product_key)
+        if product_id != product['id']:
+            raise SysExFormatError(f"Product ID 0x{product_id:02x}, "
+                                   f"expected 0x{product['id']:02x}")
+    for product in PRODUCTS.values():
+        if product['id'] == product_id and product['block_size'] * 2 != block_bytes:
+            raise SysExFormatError(f"{product['name']} uses {product['block_size']} "
+                                   f"word blocks, stream has {block_bytes // 2}")
+    
+    num_msgs = len(data) // msg_len
+    header = bytes([SYSEX_START, SYSEX_ID0, SYSEX_ID1, product_id])
+    payload = bytearray()
+    msg_sequence = 1
+    for msg in range(num_msgs):
+        pos = msg * msg_len
+        last = msg == num_msgs - 1
+        if data[pos:pos + 4] != header:
+            raise SysExFormatError(f"Message {msg} has a bad header")
+        if data[pos + msg_len - 1] != SYSEX_END:
+            raise SysExFormatError(f"Message {msg} doesn't end with F7")
+        expected = 0 if last else msg_sequence
+        if data[pos + 4] != expected:
+            raise SysExFormatError(f"Message {msg} has sequence {data[pos + 4]}, "
+                                   f"expected {expected}")
+        block = data[pos + 5:pos + msg_len - 1]
+        if last:
+            if any(block):
+                raise SysExFormatError("End marker payload isn't zero")
+        else:
+            payload += block
+        msg_sequence += 1
+        if msg_sequence > 0x7F:
+            msg_sequence = 1
+    
+    if max(payload, default=0) > 0x7F:
+        addr = next(i for i, b in enumerate(payload) if b > 0x7F)
+        raise SysExFormatError(f"Payload byte 0x{payload[addr]:02x} at word "
+                               f"0x{addr // 2:04x} has bit 7 set")
+    return unpack_words(payload), product_id, block_bytes // 2
+
+
+def expected_image(memory, max_addr, block_size):
+    """The image decode_sysex() should return for a parsed HEX file"""
+    block_bytes = 2 * block_size
+    length = (max_addr + block_bytes - 1) // block_bytes * block_bytes
+    image = bytearray(memory[:length])
+    image += b'\xff' * (length - len(image))
+    # Only 14 bits of each word are sent
+    image[1::2] = image[1::2].translate(_HI_MASK)
+    return image
+
+
+def compare_images(expected, actual):
+    """Return None if two word images match, else the first difference"""
+    if expected == actual:
+        return None
+    for addr in range(0, min(len(expected), len(actual)), 2):
+        if expected[addr:addr + 2] != actual[addr:addr + 2]:
+            want = expected[addr] | expected[addr + 1] << 8
+            got = actual[addr] | actual[addr + 1] << 8
+            return f"word 0x{addr // 2:04x} is 0x{got:04x}, expected 0x{want:04x}"
+    return f"{len(actual) // 2} words, expected {len(expected) // 2}"
+
+
+def get_product(product_key):
+    """Look up a product by its key, raising HexToSyxError if unknown"""
+    try:
+        return PRODUCTS[product_key.lower()]
+    except KeyError:
+        raise HexToSyxError(f"Invalid product ID '{product_key}'") from None
+
+
+def memory_size(product):
+    """Program memory size of a product in bytes"""
+    return product.get('memory_size', MEMORY_SIZE)
+
+
+def hex_to_sysex(infile, product_key='b', notes=None, stats=None):
+    """Convert an open HEX file to SysEx and return it as bytes
+
+    Raises HexToSyxError on an unknown product or malformed HEX. Messages
+    are appended to notes, as with parse_hex(). With stats (a
+    stagestats.StageStats) the parse, reformat and encode stages are
+    timed and the blocks counted.
+    """
+    product = get_product(product_key)
+    with _stage(stats, 'parse'):
+        memory, max_addr = parse_hex(infile, notes, memory_size(product), stats)
+    with _stage(stats, 'reformat'):
+        reformatted = fix_reset_vec(memory)
+    if reformatted and notes is not None:
+        notes.append("*** REFORMATTED 4 WORD RESET VECTOR ***")
+    with _stage(stats, 'encode'):
+        sysex = encode_sysex(memory, max_addr, product['id'], product['block_size'])
+    if stats is not None:
+        stats.count('blocks', len(sysex) // (2 * product['block_size'] + 6) - 1)
+        stats.count('syx_bytes', len(sysex))
+    return sysex
+
+
+def convert_file(hex_path, syx_path, product_key='b', stats=None):
+    """Convert a HEX file to a SysEx file and return the SysEx bytes"""
+    with stats.file(hex_path) if stats is not None else contextlib.nullcontext():
+        with open(hex_path, 'r') as infile:
+            sysex = hex_to_sysex(infile, product_key, None, stats)
+        with _stage(stats, 'write'):
+            with open(syx_path, 'wb') as outfile:
+                outfile.write(sysex)
+    if stats is not None:
+        stats.count('files')
+    return sysex
+
+
+class FirmwareImage:
+    """A parsed HEX image, decoded once for every output format
+
+    memory and max_addr come from parse_hex() with the reset vector
+    fixed; overflow holds the records past program memory (the config
+    words). The program words (14-bit, gaps erased) and their packed
+    SysEx pairs are each built once, at the longest length any output
+    asks for, and shared: every format slices the same buffers.
+    """
+
+    def __init__(self, memory, max_addr, overflow=None):
+        self.memory = memory
+        self.max_addr = max_addr
+        self.overflow = overflow
+        self._words = bytearray()
+        self._packed = None
+
+    def words(self, length):
+        """The first length bytes of the word image"""
+        if length > len(self._words):
+            data = self.memory[:length]
+            data += b'\xff' * (length - len(data))
+            data[1::2] = data[1::2].translate(_HI_MASK)
+            self._words = data
+            self._packed = None
+        return memoryview(self._words)[:length]
+
+    def packed(self, length):
+        """The first length bytes of the words packed as 7-bit SysEx pairs"""
+        if self._packed is None or len(self._packed) < length:
+            self.words(length)
+            self._packed = pack_words(bytes(self._words))
+        return memoryview(self._packed)[:length]
+
+
+def hex_record(addr, rec_type, data=b''):
+    """One Intel HEX record line with its checksum"""
+    body = bytes([len(data), (addr >> 8) & 0xFF, addr & 0xFF, rec_type]) + bytes(data)
+    return f":{body.hex().upper()}{(-sum(body)) & 0xFF:02X}"
+
+
+def format_hex(segments, record_size=16):
+    """Intel HEX text for (address, data) segments in address order
+
+    Records are aligned to record_size and never cross a 64 KB boundary;
+    an extended linear address record starts the file, as MPLAB X does,
+    and precedes every change of the upper address.
+    """
+    lines = []
+    upper = None
+    for addr, data in segments:
+        pos = 0
+        while pos < len(data):
+            at = addr + pos
+            if at >> 16 != upper:
+                upper = at >> 16
+                lines.append(hex_record(0, 4, upper.to_bytes(2, 'big')))
+            count = min(record_size - at % record_size, len(data) - pos)
+            lines.append(hex_record(at & 0xFFFF, 0, data[pos:pos + count]))
+            pos += count
+    lines.append(hex_record(0, 1))
+    return '\n'.join(lines) + '\n'
+
+
+def program_size(image, product):
+    """The product's program memory size, checking the image fits in it"""
+    size = memory_size(product)
+    if image.max_addr > size:
+        raise HexToSyxError(f"Image ends at 0x{image.max_addr:x}, past the "
+                            f"{size} bytes of {product['name']} program memory")
+    return size
+
+
+def emit_sysex(image, product):
+    """SysEx stream for a product, from the shared packed words"""
+    block_bytes = 2 * product['block_size']
+    program_size(image, product)
+    num_blocks = (image.max_addr + block_bytes - 1) // block_bytes
+    return frame_sysex(image.packed(num_blocks * block_bytes), num_blocks,
+                       product['id'], product['block_size'])
+
+
+def emit_bin(image, product):
+    """Raw program memory: little endian 14-bit words from address 0
+
+    The whole of the product's program memory, with the unused words
+    erased (0x3FFF), as a programmer reads it back.
+    """
+    return bytes(image.words(program_size(image, product)))
+
+
+def emit_hex(image, product=None):
+    """Normalized Intel HEX: the program words plus the config words
+
+    The words are the ones the SysEx carries, reset vector included,
+    which runs the same when programmed directly.
+    """
+    words = image.words(image.max_addr)
+    segments = [(start, words[start:end])
+                for start, end in image.memory.ranges() if start < image.max_addr]
+    if image.overflow is not None:
+        segments += [(start, image.overflow.read(start, end))
+                     for start, end in image.overflow.ranges()]
+    return format_hex(segments).encode('ascii')
+
+
+# Output format -> (file suffix, emitter(image, product) -> bytes)
+EMITTERS = {
+    'syx': ('.syx', emit_sysex),
+    'bin': ('.bin', emit_bin),
+    'hex': ('.norm.hex', emit_hex),
+}
+
+
+def parse_targets(spec, product_key='b'):
+    """'syx,bin,hex' or 'syx:a,syx:b' as a list of (format, product key)
+
+    A SysEx target without a product is for product_key.
+    """
+    targets = []
+    for item in spec.split(','):
+        fmt, _, key = item.strip().partition(':')
+        if fmt not in EMITTERS:
+            raise HexToSyxError(f"Unknown output format '{fmt}' "
+                                f"(use {', '.join(EMITTERS)})")
+        if key and fmt != 'syx':
+            raise HexToSyxError(f"Only SysEx output takes a product: '{item}'")
+        if fmt == 'syx':
+            get_product(key or product_key)
+        targets.append((fmt, key.lower() or (product_key.lower() if fmt == 'syx' else None)))
+    return targets
+
+
+def target_path(hex_path, fmt, key, output_dir=None, product_key='b'):
+    """Output file for one target: <stem>.syx, <stem>-<key>.syx for other
+    products, <stem>.bin, <stem>.norm.hex"""
+    stem = os.path.splitext(os.path.basename(hex_path))[0]
+    if fmt == 'syx' and key != product_key.lower():
+        stem += f"-{key}"
+    return os.path.join(output_dir or os.path.dirname(hex_path), stem + EMITTERS[fmt][0])
+
+
+def emit_file(hex_path, targets, output_dir=None, product_key='b', stats=None):
+    """Parse a HEX file once and write every target, return the paths written"""
+    sizes = [memory_size(PRODUCTS[key or product_key.lower()])
+             for fmt, key in targets if fmt != 'hex']
+    written = []
+    with stats.file(hex_path) if stats is not None else contextlib.nullcontext():
+        with _stage(stats, 'parse'):
+            overflow = SparseMemory(None)
+            with open(hex_path, 'r') as infile:
+                memory, max_addr = parse_hex(infile, None, max(sizes, default=MEMORY_SIZE),
+                                             stats, overflow)
+        with _stage(stats, 'reformat'):
+            fix_reset_vec(memory)
+        image = FirmwareImage(memory, max_addr, overflow)
+        for fmt, key in targets:
+            path = target_path(hex_path, fmt, key, output_dir, product_key)
+            if os.path.abspath(path) == os.path.abspath(hex_path):
+                raise HexToSyxError(f"{path} would overwrite the input")
+            with _stage(stats, fmt):
+                data = EMITTERS[fmt][1](image, PRODUCTS[key or product_key.lower()])
+            with _stage(stats, 'write'):
+                with open(path, 'wb') as outfile:
+                    outfile.write(data)
+            written.append(path)
+    if stats is not None:
+        stats.count('files')
+        stats.count('outputs', len(written))
+    return written
+
+
+def _emit_job(job):
+    """Emit one (hex_path, targets, output_dir, product_key, with_stats) job
+
+    Returns (paths written, error), paired with a stats report if with_stats.
+    """
+    hex_path, targets, output_dir, product_key, with_stats = job
+    stats = stagestats.StageStats('hextosyx') if with_stats else None
+    try:
+        result = (emit_file(hex_path, targets, output_dir, product_key, stats), None)
+    except (HexToSyxError, OSError) as e:
+        result = ([], str(e))
+    return _job_result(result, stats)
+
+
+def emit_batch(hex_paths, targets, output_dir=None, product_key='b', workers=1, stats=None):
+    """Emit targets for many HEX files, like convert_batch()
+
+    Returns (hex_path, paths written, error) for every file.
+    """
+    work = [(hex_path, targets, output_dir, product_key, stats is not None)
+            for hex_path in hex_paths]
+    results = _run_jobs(_emit_job, work, workers)
+    if stats is not None:
+        for _, report in results:
+            stats.merge(report)
+        results = [result for result, _ in results]
+    return [(hex_path, paths, error) for hex_path, (paths, error) in zip(hex_paths, results)]
+
+
+def batch_jobs(patterns=(), manifest=None, output_dir=None):
+    """Build the (hex_path, syx_path) list for a batch conversion
+
+    patterns are HEX paths or glob patterns; a pattern matching nothing is
+    kept as-is so the conversion reports it missing. Each manifest line
+    holds an input HEX and optionally its output .syx, relative to the
+    manifest; '#' starts a comment. Outputs default to the input name
+    with a .syx suffix, in output_dir if given.
+    """
+    pairs = []
+    for pattern in patterns:
+        for hex_path in sorted(glob.glob(pattern)) or [pattern]:
+            pairs.append((hex_path, None))
+    if manifest:
+        base = os.path.dirname(manifest)
+        with open(manifest, 'r') as infile:
+            for line in infile:
+                fields = line.split('#', 1)[0].split()
+                if not fields:
+                    continue
+                if len(fields) > 2:
+                    raise HexToSyxError(f"Bad manifest line: {line.strip()}")
+                paths = [os.path.join(base, f) for f in fields]
+                pairs.append((paths[0], paths[1] if len(paths) > 1 else None))
+
+    jobs = []
+    for hex_path, syx_path in pairs:
+        if syx_path is None:
+            syx_path = os.path.splitext(hex_path)[0] + '.syx'
+            if output_dir:
+                syx_path = os.path.join(output_dir, os.path.basename(syx_path))
+        jobs.append((hex_path, syx_path))
+    return jobs
+
+
+def _job_result(result, stats):
+    """A job's result, paired with its stats report when it has one"""
+    if stats is None:
+        return result
+    report = stats.report()
+    stats.close()
+    return result, report
+
+
+def _batch_job(job):
+    """Convert one (hex_path, syx_path, product_key, with_stats) job
+
+    Returns the error or None, paired with a stats report if with_stats.
+    """
+    hex_path, syx_path, product_key, with_stats = job
+    stats = stagestats.StageStats('hextosyx') if with_stats else None
+    try:
+        convert_file(hex_path, syx_path, product_key, stats)
+        error = None
+    except (HexToSyxError, OSError) as e:
+        error = str(e)
+    return _job_result(error, stats)
+
+
+def verify_file(hex_path, syx_path, product_key='b', stats=None):
+    """Check a .syx decodes to the image of its source HEX
+
+    Returns None if it does, else a description of the first difference.
+    With hex_path None only the SysEx framing is checked.
+    """
+    product = get_product(product_key)
+    with stats.file(syx_path) if stats is not None else contextlib.nullcontext():
+        with _stage(stats, 'decode'):
+            with open(syx_path, 'rb') as infile:
+                image, _, _ = decode_sysex(infile.read(), product_key)
+        if hex_path is None:
+            return None
+        with _stage(stats, 'parse'):
+            with open(hex_path, 'r') as infile:
+                memory, max_addr = parse_hex(infile, None, memory_size(product), stats)
+        with _stage(stats, 'reformat'):
+            fix_reset_vec(memory)
+        with _stage(stats, 'compare'):
+            return compare_images(expected_image(memory, max_addr, product['block_size']),
+                                  image)
+
+
+def _verify_job(job):
+    """Verify one (hex_path, syx_path, product_key, with_stats) job, like _batch_job()"""
+    hex_path, syx_path, product_key, with_stats = job
+    stats = stagestats.StageStats('hextosyx') if with_stats else None
+    try:
+        problem = verify_file(hex_path, syx_path, product_key, stats)
+    except (HexToSyxError, OSError) as e:
+        problem = str(e)
+    return _job_result(problem, stats)
+
+
+def _run_jobs(func, work, workers):
+    """Map func over work, across a process pool if workers > 1"""
+    if workers and workers > 1 and len(work) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(work) // (workers * 4))
+            return list(pool.map(func, work, chunksize=chunksize))
+    return [func(job) for job in work]
+
+
+def _run_batch(func, jobs, product_key, workers, stats):
+    """Run (hex_path, syx_path) jobs, merging worker reports into stats"""
+    get_product(product_key)
+    work = [(hex_path, syx_path, product_key, stats is not None)
+            for hex_path, syx_path in jobs]
+    results = _run_jobs(func, work, workers)
+    if stats is not None:
+        for _, report in results:
+            stats.merge(report)
+        results = [result for result, _ in results]
+    return [(hex_path, syx_path, result)
+            for (hex_path, syx_path), result in zip(jobs, results)]
+
+
+def verify_batch(jobs, product_key='b', workers=1, stats=None):
+    """Verify (hex_path, syx_path) pairs, like convert_batch()
+
+    Returns (hex_path, syx_path, problem) for every job, problem being
+    None when the .syx matches.
+    """
+    return _run_batch(_verify_job, jobs, product_key, workers, stats)
+
+
+def convert_batch(jobs, product_key='b', workers=1, stats=None):
+    """Convert (hex_path, syx_path) pairs, optionally across a process pool
+
+    Returns (hex_path, syx_path, error) for every job in order, error
+    being None on success. One bad file doesn't stop the rest. Each
+    job's stage times are added to stats, if given.
+    """
+    return _run_batch(_batch_job, jobs, product_key, workers, stats)
+
+
+def reference_records(lines):
+    """The HEX lines without the data records read_hex_reference() drops
+
+    The reference reader skips any record with addr + 2 * len reaching
+    MEMORY_SIZE, a stricter bound than parse_hex()'s, so a full image
+    loses its top records there only. Malformed lines are kept for both
+    readers to reject.
+    """
+    offset = 0
+    for line in lines:
+        record = line.strip()
+        try:
+            data_len = int(record[1:3], 16)
+            rec_type = int(record[7:9], 16)
+            if record.startswith(':') and rec_type == 4:
+                offset = int(record[9:13], 16) << 16
+            elif record.startswith(':') and rec_type == 0:
+                addr = int(record[3:7], 16) + offset
+                if addr + 2 * data_len >= MEMORY_SIZE:
+                    continue
+        except ValueError:
+            pass
+        yield line
+
+
+def check_readers(input_file, product_key='b'):
+    """Cross-check the fast paths against the reference implementations.
+
+    The HEX file is parsed with both readers, leaving out the records
+    only the reference drops (see reference_records), and the whole
+    image is encoded with both SysEx writers, then decoded again.
+    Returns None when they agree, otherwise a description of the first
+    difference found.
+    """
+    with open(input_file, 'r') as infile:
+        lines = list(reference_records(infile))
+    memory, max_addr = read_hex(lines)
+    ref_memory, ref_max_addr = read_hex_reference(lines)
+    
+    if max_addr != ref_max_addr:
+        return f"max_addr 0x{max_addr:x} != reference 0x{ref_max_addr:x}"
+    if memory is None or ref_memory is None:
+        if memory is ref_memory:
+            return None
+        return "only one reader rejected the file"
+    if memory[:MEMORY_SIZE] != ref_memory:
+        addr = next(i for i in range(MEMORY_SIZE) if memory[i] != ref_memory[i])
+        return (f"byte 0x{addr:x} is 0x{memory[addr]:02x}, "
+                f"reference has 0x{ref_memory[addr]:02x}")
+    
+    with open(input_file, 'r') as infile:
+        memory, max_addr = read_hex(infile)
+    if memory is None:
+        return "only the reader without the reference's bound rejected the file"
+    product = PRODUCTS[product_key]
+    ref_out = io.BytesIO()
+    write_sysex_reference(ref_out, memory, max_addr, product['id'], product['block_size'])
+    sysex = encode_sysex(memory, max_addr, product['id'], product['block_size'])
+    if sysex != ref_out.getvalue():
+        return "SysEx output differs from reference writer"
+    image, _, _ = decode_sysex(sysex, product_key)
+    problem = compare_images(expected_image(memory, max_addr, product['block_size']), image)
+    if problem:
+        return f"SysEx doesn't decode back to the image: {problem}"
+    return None
+
+
+def batch_main(argv):
+    """Command line for 'hextosyx.py batch', returns the exit status"""
+    parser = argparse.ArgumentParser(
+        prog=f"{os.path.basename(sys.argv[0])} batch",
+        description="Convert many HEX files to SysEx in one process")
+    parser.add_argument('product', help="product key, e.g. b for Synchole")
+    parser.add_argument('inputs', nargs='*', metavar='HEX',
+                        help="HEX files or glob patterns")
+    parser.add_argument('-m', '--manifest',
+                        help="file listing 'input.hex [output.syx]' per line")
+    parser.add_argument('-o', '--output-dir',
+                        help="where to write .syx files (default: next to each input)")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of worker processes (default: 1)")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="only report failures")
+    if stagestats:
+        stagestats.add_arguments(parser)
+    args = parser.parse_intermixed_args(argv)
+
+    if not args.inputs and not args.manifest:
+        parser.error("give HEX files, glob patterns or --manifest")
+    try:
+        get_product(args.product)
+        jobs = batch_jobs(args.inputs, args.manifest, args.output_dir)
+    except (HexToSyxError, OSError) as e:
+        print(f"Error: {e}")
+        return 2
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    def convert(stats):
+        return convert_batch(jobs, args.product, args.jobs, stats)
+
+    results = stagestats.run('hextosyx batch', convert, args) if stagestats else convert(None)
+    failed = 0
+    for hex_path, syx_path, error in results:
+        if error:
+            failed += 1
+            print(f"✗ {hex_path}: {error}")
+        elif not args.quiet:
+            print(f"✓ {hex_path} -> {syx_path}")
+    if not args.quiet or failed:
+        print(f"Converted {len(results) - failed} of {len(results)} files")
+    return 3 if failed else 0
+
+
+def verify_main(argv):
+    """Command line for 'hextosyx.py verify', returns the exit status"""
+    parser = argparse.ArgumentParser(
+        prog=f"{os.path.basename(sys.argv[0])} verify",
+        description="Check .syx files decode back to their source HEX images")
+    parser.add_argument('product', help="product key, e.g. b for Synchole")
+    parser.add_argument('inputs', nargs='*', metavar='FILE',
+                        help="HEX files or glob patterns; .syx files given "
+                             "directly only have their framing checked")
+    parser.add_argument('-m', '--manifest',
+                        help="file listing 'input.hex [output.syx]' per line")
+    parser.add_argument('-s', '--syx-dir',
+                        help="where the .syx files are (default: next to each input)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="only report failures")
+    if stagestats:
+        stagestats.add_arguments(parser)
+    args = parser.parse_intermixed_args(argv)
+
+    if not args.inputs and not args.manifest:
+        parser.error("give HEX or .syx files, glob patterns or --manifest")
+    try:
+        get_product(args.product)
+        jobs = batch_jobs(args.inputs, args.manifest, args.syx_dir)
+    except (HexToSyxError, OSError) as e:
+        print(f"Error: {e}")
+        return 2
+    jobs = [(None, hex_path) if hex_path.lower().endswith('.syx') else (hex_path, syx_path)
+            for hex_path, syx_path in jobs]
+
+    def verify(stats):
+        return verify_batch(jobs, args.product, args.jobs, stats)
+
+    results = stagestats.run('hextosyx verify', verify, args) if stagestats else verify(None)
+    failed = 0
+    for hex_path, syx_path, problem in results:
+        if problem:
+            failed += 1
+            print(f"✗ {syx_path}: {problem}")
+        elif not args.quiet:
+            print(f"✓ {syx_path}" + (f" matches {hex_path}" if hex_path else " is well formed"))
+    if not args.quiet or failed:
+        print(f"Verified {len(results) - failed} of {len(results)} files")
+    return 6 if failed else 0
+
+
+def emit_main(argv):
+    """Command line for 'hextosyx.py emit', returns the exit status"""
+    parser = argparse.ArgumentParser(
+        prog=f"{os.path.basename(sys.argv[0])} emit",
+        description="Write SysEx, raw binary and normalized HEX from one parse of each file")
+    parser.add_argument('product', help="product key, e.g. b for Synchole")
+    parser.add_argument('inputs', nargs='+', metavar='HEX', help="HEX files or glob patterns")
+    parser.add_argument('-t', '--targets', default='syx,bin,hex',
+                        help="output formats, e.g. syx,bin,hex or syx:a,syx:g "
+                             "(default: syx,bin,hex)")
+    parser.add_argument('-o', '--output-dir',
+                        help="where to write the outputs (default: next to each input)")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of worker processes (default: 1)")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="only report failures")
+    if stagestats:
+        stagestats.add_arguments(parser)
+    args = parser.parse_intermixed_args(argv)
+
+    try:
+        get_product(args.product)
+        targets = parse_targets(args.targets, args.product)
+    except HexToSyxError as e:
+        print(f"Error: {e}")
+        return 2
+    hex_paths = [hex_path for pattern in args.inputs
+                 for hex_path in sorted(glob.glob(pattern)) or [pattern]]
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    def emit(stats):
+        return emit_batch(hex_paths, targets, args.output_dir, args.product, args.jobs, stats)
+
+    results = stagestats.run('hextosyx emit', emit, args) if stagestats else emit(None)
+    failed = 0
+    for hex_path, paths, error in results:
+        if error:
+            failed += 1
+            print(f"✗ {hex_path}: {error}")
+        elif not args.quiet:
+            print(f"✓ {hex_path} -> {', '.join(paths)}")
+    if not args.quiet or failed:
+        print(f"Emitted {len(results) - failed} of {len(results)} files")
+    return 3 if failed else 0
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        sys.exit(batch_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'emit':
+        sys.exit(emit_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'verify':
+        sys.exit(verify_main(sys.argv[2:]))
+    
+    if len(sys.argv) == 3 and sys.argv[1] == '--check':
+        problem = check_readers(sys.argv[2])
+        if problem:
+            print(f"Mismatch: {problem}")
+            sys.exit(5)
+        print("Fast and reference paths agree: output is byte-identical")
+        sys.exit(0)
+    
     if len(sys.argv) != 4:
         print("HEX2SYX - Convert Intel HEX to SysEx for MIDI bootloader")
         print(f"Usage: {sys.argv[0]} <product_id> <input.hex> <output.syx>")
+        print(f"       {sys.argv[0]} --check <input.hex>")
+        print(f"       {sys.argv[0]} batch <product_id> [-j N] [-o DIR] [-m MANIFEST] [HEX ...]")
+        print(f"       {sys.argv[0]} verify <product_id> [-j N] [-s SYX_DIR] [-m MANIFEST] [HEX|SYX ...]")
+        print(f"       {sys.argv[0]} emit <product_id> [-t syx,bin,hex] [-j N] [-o DIR] HEX ...")
         print("\nAvailable products:")
         for key, prod in sorted(PRODUCTS.items()):
             print(f"  [{key}] {prod['name']}")
@@ -168,13 +1232,26 @@ def main():
     
     product = PRODUCTS[product_key]
     print(f"Converting for {product['name']}")
+    if stagestats:
+        # $SYNCHOLE_STATS / $SYNCHOLE_PROFILE turn on instrumentation
+        stagestats.run('hextosyx', lambda stats: convert_main(
+            input_file, output_file, product, stats))
+    else:
+        convert_main(input_file, output_file, product)
     
+    print(f"Successfully converted {input_file} to {output_file}")
+    print("Done!")
+
+
+def convert_main(input_file, output_file, product, stats=None):
+    """The single file conversion of main(), exits on an error"""
     try:
-        with open(input_file, 'r') as infile:
-            memory, max_addr = read_hex(infile)
-            if memory is None:
-                print("Error reading HEX file")
-                sys.exit(3)
+        with _stage(stats, 'parse'):
+            with open(input_file, 'r') as infile:
+                memory, max_addr = read_hex(infile, memory_size(product))
+        if memory is None:
+            print("Error reading HEX file")
+            sys.exit(3)
     except FileNotFoundError:
         print(f"Error: Input file '{input_file}' not found")
         sys.exit(3)
@@ -182,17 +1259,18 @@ def main():
         print(f"Error reading input file: {e}")
         sys.exit(3)
     
-    reformat_reset_vec(memory)
+    with _stage(stats, 'reformat'):
+        reformat_reset_vec(memory)
     
     try:
-        with open(output_file, 'wb') as outfile:
-            write_sysex(outfile, memory, max_addr, product['id'], product['block_size'])
+        with _stage(stats, 'encode'):
+            sysex = encode_sysex(memory, max_addr, product['id'], product['block_size'])
+        with _stage(stats, 'write'):
+            with open(output_file, 'wb') as outfile:
+                outfile.write(sysex)
     except Exception as e:
         print(f"Error writing output file: {e}")
         sys.exit(4)
-    
-    print(f"Successfully converted {input_file} to {output_file}")
-    print("Done!")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Flash many SYNCHOLE units at once over separate MIDI outputs
+
+Every output gets its own asyncio task with its own pacing, so N units
+take about as long as one. A port that fails or stalls is reported and
+dropped without holding up the others.
+
+    ./multiflash.py bpm-builds/synchole-120bpm.syx /dev/snd/midiC1D0 /dev/snd/midiC2D0
+    ./multiflash.py --unit /dev/midi1 synchole-120bpm.syx --unit /dev/midi2 synchole-174bpm.syx
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import hextosyx
+from flashsim import FLASH_ERASE_MS, FLASH_WRITE_MS, MIDI_BAUD
+from syxsend import Pacer, load_messages, open_output
+
+# Give up on a port that hasn't accepted any bytes for this long
+STALL_TIMEOUT = 5.0
+
+
+async def wait_writable(fd, timeout):
+    """Wait until fd can take more bytes, raising TimeoutError after timeout"""
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    loop.add_writer(fd, lambda: ready.done() or ready.set_result(None))
+    try:
+        await asyncio.wait_for(ready, timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"stalled for {timeout:.1f} s") from None
+    finally:
+        loop.remove_writer(fd)
+
+
+async def write_all(fd, data, timeout=STALL_TIMEOUT):
+    """Write data to a non-blocking fd without blocking the event loop"""
+    view = memoryview(data)
+    while view:
+        try:
+            view = view[os.write(fd, view):]
+        except BlockingIOError:
+            await wait_writable(fd, timeout)
+
+
+async def flash_port(port, messages, pacer, progress, timeout=STALL_TIMEOUT):
+    """Stream messages to one output, paced like syxsend.send_stream()
+
+    progress[port] is kept up to date with the bytes sent so far. Returns
+    a result dict; port errors (OS errors, stalls, bad SysEx) are caught
+    and reported in it so one port's failure never reaches the others.
+    """
+    total = sum(len(msg) for msg in messages)
+    result = {'port': port, 'ok': False, 'error': None, 'bytes': 0,
+              'total': total, 'seconds': 0.0}
+    progress[port] = result
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    fd = None
+    try:
+        fd = open_output(port, nonblocking=True)
+        due = start
+        for block, msg in enumerate(messages):
+            if loop.time() < due:
+                await asyncio.sleep(due - loop.time())
+            sent = loop.time()
+            await write_all(fd, msg, timeout)
+            result['bytes'] += len(msg)
+            on_wire = max(sent + pacer.wire_ms(len(msg)) / 1000, loop.time())
+            due = on_wire + pacer.gap_ms(None if msg[4] == 0 else block) / 1000
+        result['ok'] = True
+    except (OSError, asyncio.TimeoutError, hextosyx.HexToSyxError) as e:
+        result['error'] = str(e) or type(e).__name__
+    finally:
+        if fd is not None:
+            os.close(fd)
+    result['seconds'] = loop.time() - start
+    return result
+
+
+async def report_progress(progress, interval=1.0):
+    """Print a one line progress summary every interval until cancelled"""
+    start = time.perf_counter()
+    while True:
+        await asyncio.sleep(interval)
+        results = list(progress.values())
+        done = sum(1 for r in results if r['ok'])
+        failed = sum(1 for r in results if r['error'])
+        sending = [r for r in results if not r['ok'] and not r['error']]
+        if not sending:
+            continue
+        percent = sum(100 * r['bytes'] / max(r['total'], 1) for r in sending) / len(sending)
+        print(f"  [{time.perf_counter() - start:4.1f}s] {done} done, {failed} failed, "
+              f"{len(sending)} sending ({percent:.0f}%)")
+
+
+async def flash_all(units, pacer, timeout=STALL_TIMEOUT, show_progress=True):
+    """Flash (port, messages) pairs concurrently and return their results"""
+    progress = {}
+    reporter = asyncio.create_task(report_progress(progress)) if show_progress else None
+    try:
+        results = await asyncio.gather(
+            *(flash_port(port, messages, pacer, progress, timeout) for port, messages in units))
+    finally:
+        if reporter:
+            reporter.cancel()
+    return list(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Flash firmware to many MIDI outputs concurrently")
+    parser.add_argument('input', nargs='?',
+                        help=".syx or .hex file sent to every PORT")
+    parser.add_argument('ports', nargs='*', metavar='PORT',
+                        help="MIDI device nodes, ptys, FIFOs or files")
+    parser.add_argument('--unit', nargs=2, action='append', default=[],
+                        metavar=('PORT', 'FILE'),
+                        help="flash FILE to PORT (repeat for per-unit firmware)")
+    parser.add_argument('-p', '--product', default='b',
+                        help="product key (default: b, Synchole)")
+    parser.add_argument('--gap', type=float,
+                        help="fixed pause after each block in ms "
+                             "(default: adapt to each block's flash time)")
+    parser.add_argument('--baud', type=int, default=MIDI_BAUD)
+    parser.add_argument('--write-ms', type=float, default=FLASH_WRITE_MS)
+    parser.add_argument('--erase-ms', type=float, default=FLASH_ERASE_MS)
+    parser.add_argument('--timeout', type=float, default=STALL_TIMEOUT,
+                        help=f"seconds before a stalled port is failed (default: {STALL_TIMEOUT})")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="no progress lines")
+    args = parser.parse_args()
+
+    pairs = [(port, args.input) for port in args.ports] + [tuple(u) for u in args.unit]
+    if args.input and not args.ports and not args.unit:
+        parser.error("give at least one PORT")
+    if not pairs:
+        parser.error("give FILE PORT... or --unit PORT FILE")
+
+    # Each firmware is encoded once, however many units it goes to
+    payloads = {}
+    try:
+        pacer = Pacer(args.product, args.gap, args.baud, args.write_ms, args.erase_ms)
+        for _, path in pairs:
+            if path not in payloads:
+                payloads[path] = list(load_messages(path, args.product))
+    except (hextosyx.HexToSyxError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+
+    print("=" * 50)
+    print("  SYNCHOLE Multi-Unit Flasher")
+    print("=" * 50)
+    print()
+    print(f"Flashing {len(pairs)} units...")
+    print()
+
+    start = time.perf_counter()
+    results = asyncio.run(flash_all([(port, payloads[path]) for port, path in pairs],
+                                    pacer, args.timeout, not args.quiet))
+    elapsed = time.perf_counter() - start
+
+    print()
+    for (port, path), r in zip(pairs, results):
+        if r['ok']:
+            print(f"  ✓ {port}: {os.path.basename(path)} in {r['seconds']:.2f}s")
+        else:
+            print(f"  ✗ {port}: {r['error']} after {r['bytes']} of {r['total']} bytes")
+    failed = [r for r in results if not r['ok']]
+    print()
+    print("Results:")
+    print(f"  ✓ Flashed: {len(results) - len(failed)}")
+    print(f"  ✗ Failed: {len(failed)}")
+    print(f"  Total: {len(results)} in {elapsed:.2f}s")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Stamp a serial number or build ID into per-unit firmware images
+
+The reference HEX is parsed and its reset vector fixed once. Each serial
+only changes a few reserved program words, so the reference is encoded
+once and, for every unit, only the SysEx blocks holding those words are
+re-packed; the rest of the stream is reused as is.
+
+The serial is stored big endian across the reserved words, either as a
+RETLW table (0x34kk, one byte per word, readable with a computed goto or
+BRW) or as raw 14-bit words for reading through the flash registers:
+
+    ./serialstamp.py build.hex --addr 0x7f0 --serials 1000-10999
+    ./serialstamp.py build.hex --addr 0x7f0 --words 2 --encoding raw --serial-file ids.txt
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import hextosyx
+from bpmconfig import PRODUCT_KEY
+from bpmpatch import PatchError, load_image
+
+RETLW = 0x3400
+ERASED_WORD = 0x3FFF
+ENCODINGS = ('retlw', 'raw')
+
+
+class StampError(Exception):
+    """Raised when a serial can't be stamped into the image"""
+
+
+def serial_words(serial, words, encoding='retlw'):
+    """The program words holding a serial, most significant first"""
+    bits = 8 if encoding == 'retlw' else 14
+    if not 0 <= serial < 1 << (bits * words):
+        raise StampError(f"Serial {serial} doesn't fit in {words} {encoding} words")
+    values = [(serial >> (bits * i)) & ((1 << bits) - 1) for i in reversed(range(words))]
+    return [RETLW | v for v in values] if encoding == 'retlw' else values
+
+
+def check_reserved(memory, max_addr, word_addr, words):
+    """Make sure the reserved words are free to stamp
+
+    They must be erased, past the end of the image, or already hold a
+    RETLW (a placeholder table compiled into the firmware). Anything
+    else is code or data the stamp would overwrite.
+    """
+    for addr in range(2 * word_addr, 2 * (word_addr + words), 2):
+        if addr >= max_addr:
+            continue
+        word = memory[addr] | memory[addr + 1] << 8
+        if word & ERASED_WORD != ERASED_WORD and word & 0x3F00 != RETLW:
+            raise StampError(f"Word 0x{addr // 2:x} holds 0x{word:04x}, not a free "
+                             "or RETLW word")
+
+
+class Stamper:
+    """Produces the SysEx stream of the reference image for any serial
+
+    The reference stream is built once; stamp() copies it and re-packs
+    only the blocks the reserved words fall in.
+    """
+
+    def __init__(self, image, word_addr, words, product, encoding='retlw'):
+        memory, max_addr = image
+        if encoding not in ENCODINGS:
+            raise StampError(f"Unknown encoding {encoding}")
+        check_reserved(memory, max_addr, word_addr, words)
+        self.memory = memory.copy()
+        self.start = 2 * word_addr
+        self.end = 2 * (word_addr + words)
+        if self.memory.size is not None and self.end > self.memory.size:
+            raise StampError(f"Reserved words end past program memory (0x{self.end // 2:x})")
+        # Stamps past the end of the code still need their blocks sent
+        self.max_addr = max(max_addr, self.end)
+        self.words = words
+        self.encoding = encoding
+        self.product_id = product['id']
+        self.block_bytes = 2 * product['block_size']
+        self.msg_len = self.block_bytes + 6
+        self.reference = hextosyx.encode_sysex(self.memory, self.max_addr, self.product_id,
+                                               product['block_size'])
+        self.blocks = range(self.start // self.block_bytes,
+                            (self.end - 1) // self.block_bytes + 1)
+
+    def stamp(self, serial):
+        """SysEx stream for the reference image carrying serial"""
+        patch = bytearray(2 * self.words)
+        for i, word in enumerate(serial_words(serial, self.words, self.encoding)):
+            patch[2 * i] = word & 0xFF
+            patch[2 * i + 1] = word >> 8
+        first = self.blocks[0] * self.block_bytes
+        region = bytearray(self.memory[first:(self.blocks[-1] + 1) * self.block_bytes])
+        region[self.start - first:self.end - first] = patch
+
+        out = bytearray(self.reference)
+        for i, block in enumerate(self.blocks):
+            data = bytes(region[i * self.block_bytes:(i + 1) * self.block_bytes])
+            data += b'\xff' * (self.block_bytes - len(data))
+            pos = block * self.msg_len + 5
+            out[pos:pos + self.block_bytes] = hextosyx.pack_words(data)
+        return bytes(out)
+
+    def full_image(self, serial):
+        """Memory image with serial stamped in (for checking stamp())"""
+        memory = self.memory.copy()
+        for i, word in enumerate(serial_words(serial, self.words, self.encoding)):
+            memory[self.start + 2 * i] = word & 0xFF
+            memory[self.start + 2 * i + 1] = word >> 8
+        return memory, self.max_addr
+
+
+def parse_serials(spec):
+    """'1000-1999' or '5,7,0x1f' as a list of serials"""
+    serials = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = (int(s, 0) for s in part.split('-', 1))
+            serials.extend(range(first, last + 1))
+        else:
+            serials.append(int(part, 0))
+    return serials
+
+
+def read_serial_file(path):
+    """One serial per line (decimal or 0x hex), '#' starts a comment"""
+    serials = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                serials.append(int(line, 0))
+    return serials
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stamp per-unit serial numbers into a firmware image")
+    parser.add_argument('hex', help="reference build (Intel HEX)")
+    parser.add_argument('--addr', type=lambda s: int(s, 0), required=True,
+                        help="word address of the reserved words, e.g. 0x7f0")
+    parser.add_argument('--words', type=int, default=4,
+                        help="number of reserved words (default: 4)")
+    parser.add_argument('--encoding', choices=ENCODINGS, default='retlw',
+                        help="RETLW table (8 bits per word) or raw 14-bit words")
+    serials = parser.add_mutually_exclusive_group(required=True)
+    serials.add_argument('--serials', type=parse_serials,
+                         help="serials to stamp, e.g. 1000-10999 or 5,7,0x1f")
+    serials.add_argument('--serial-file', help="file with one serial per line")
+    parser.add_argument('--name', default='synchole-{serial:06d}.syx',
+                        help="output file name template (default: synchole-{serial:06d}.syx)")
+    parser.add_argument('-p', '--product', default=PRODUCT_KEY,
+                        help=f"product key (default: {PRODUCT_KEY}, Synchole)")
+    parser.add_argument('-o', '--output-dir', type=Path, default=Path('stamped'))
+    args = parser.parse_args()
+    try:
+        args.name.format(serial=0)
+    except (KeyError, IndexError, AttributeError, ValueError) as e:
+        parser.error(f"bad --name template {args.name!r}: {e!r}")
+
+    try:
+        serial_list = args.serials or read_serial_file(args.serial_file)
+        product = hextosyx.get_product(args.product)
+        image = load_image(args.hex, hextosyx.memory_size(product))
+        stamper = Stamper(image, args.addr, args.words, product, args.encoding)
+        # The incremental stream must match a full encode of the stamped image
+        if serial_list:
+            memory, max_addr = stamper.full_image(serial_list[0])
+            full = hextosyx.encode_sysex(memory, max_addr, product['id'], product['block_size'])
+            if stamper.stamp(serial_list[0]) != full:
+                raise StampError("Stamped stream differs from a full encode")
+    except (StampError, PatchError, hextosyx.HexToSyxError, ValueError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    blocks = ", ".join(str(b) for b in stamper.blocks)
+    total = len(stamper.reference) // stamper.msg_len
+    print(f"Reserved words 0x{args.addr:x}-0x{args.addr + args.words - 1:x} "
+          f"({args.encoding}), re-encoding block {blocks} of {total}")
+
+    start = time.perf_counter()
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    names = set()
+    try:
+        for serial in serial_list:
+            name = args.name.format(serial=serial)
+            if name in names:
+                raise StampError(f"Duplicate output {name} (serial {serial})")
+            names.add(name)
+            (args.output_dir / name).write_bytes(stamper.stamp(serial))
+    except (StampError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+    print(f"✓ Stamped {len(serial_list)} images in {elapsed * 1000:.1f} ms")
+    print(f"  {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
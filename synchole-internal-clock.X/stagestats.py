@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Stage timing and memory reports for the library build tools
+
+hextosyx.py, embed-firmwares.py and xc8build.py take --stats [FILE] and
+--profile FILE. Setting SYNCHOLE_STATS to a file does the same as
+--stats FILE for every tool run, so a whole build collects one report
+per run, one JSON object per line:
+
+    SYNCHOLE_STATS=build-stats.jsonl ./build-comprehensive-library.sh
+    ./stagestats.py build-stats.jsonl
+
+Each report has wall and CPU time, call counts and tracemalloc peak per
+stage, per-file stage times and counters (records, blocks, bytes).
+Stage times are exclusive: a stage nested in another isn't counted in
+the outer one. SYNCHOLE_PROFILE names a file for cProfile output, like
+--profile.
+"""
+
+import argparse
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+STATS_ENV = 'SYNCHOLE_STATS'
+PROFILE_ENV = 'SYNCHOLE_PROFILE'
+REPORT_VERSION = 1
+
+
+def stage(stats, name):
+    """stats.stage(name), or a no-op context when stats is None"""
+    return stats.stage(name) if stats is not None else contextlib.nullcontext()
+
+
+class StageStats:
+    """Collects time, memory and counts per stage for one tool run"""
+
+    def __init__(self, tool, memory=True):
+        self.tool = tool
+        self.stages = {}        # name -> calls, wall_s, cpu_s, peak_bytes
+        self.counts = {}
+        self.files = []
+        self.memory = memory
+        self._stack = []
+        self._file = None
+        self._start = time.perf_counter()
+        self._cpu = time.process_time()
+        self._tracing = memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the body as stage name (exclusive of nested stages)"""
+        if self._stack and self.memory:
+            parent = self._stack[-1]
+            parent['peak'] = max(parent['peak'], tracemalloc.get_traced_memory()[1])
+        if self.memory:
+            tracemalloc.reset_peak()
+        frame = {'wall': time.perf_counter(), 'cpu': time.process_time(),
+                 'child_wall': 0.0, 'child_cpu': 0.0, 'peak': 0}
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            wall = time.perf_counter() - frame['wall']
+            cpu = time.process_time() - frame['cpu']
+            if self._stack:
+                self._stack[-1]['child_wall'] += wall
+                self._stack[-1]['child_cpu'] += cpu
+            entry = self.stages.setdefault(name, {'calls': 0, 'wall_s': 0.0,
+                                                  'cpu_s': 0.0, 'peak_bytes': 0})
+            entry['calls'] += 1
+            entry['wall_s'] += wall - frame['child_wall']
+            entry['cpu_s'] += cpu - frame['child_cpu']
+            if self.memory:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                entry['peak_bytes'] = max(entry['peak_bytes'], peak)
+            if self._file is not None:
+                self._file[name] = self._file.get(name, 0.0) + wall - frame['child_wall']
+
+    @contextlib.contextmanager
+    def file(self, path):
+        """Record the stage times of the body against one input file"""
+        self._file = {'file': str(path)}
+        try:
+            yield self._file
+        finally:
+            self.files.append(self._file)
+            self._file = None
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def merge(self, report):
+        """Add a report() from another process (e.g. a pool worker)"""
+        for name, other in report['stages'].items():
+            entry = self.stages.setdefault(name, {'calls': 0, 'wall_s': 0.0,
+                                                  'cpu_s': 0.0, 'peak_bytes': 0})
+            entry['calls'] += other['calls']
+            entry['wall_s'] += other['wall_s']
+            entry['cpu_s'] += other['cpu_s']
+            entry['peak_bytes'] = max(entry['peak_bytes'], other['peak_bytes'])
+        for name, n in report['counts'].items():
+            self.count(name, n)
+        self.files.extend(report['files'])
+
+    def report(self):
+        """The run as a JSON-ready dict"""
+        report = {'version': REPORT_VERSION, 'tool': self.tool, 'pid': os.getpid(),
+                  'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'argv': sys.argv[1:],
+                  'wall_s': time.perf_counter() - self._start,
+                  'cpu_s': time.process_time() - self._cpu,
+                  'stages': self.stages, 'counts': self.counts, 'files': self.files}
+        if self.memory and tracemalloc.is_tracing():
+            report['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        return report
+
+    def close(self):
+        """Stop tracemalloc if this object started it"""
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def write(self, path):
+        """Append the report to path as one JSON line ('-' for stdout)"""
+        line = json.dumps(self.report(), separators=(',', ':'))
+        self.close()
+        if path == '-':
+            print(line)
+        else:
+            with open(path, 'a') as f:
+                f.write(line + '\n')
+
+
+def add_arguments(parser):
+    """Add the --stats and --profile options to a tool's parser"""
+    parser.add_argument('--stats', nargs='?', const='-', metavar='FILE',
+                        help="append a JSON timing report to FILE (default: stdout); "
+                             f"also enabled by ${STATS_ENV}")
+    parser.add_argument('--profile', metavar='FILE',
+                        help=f"write cProfile data to FILE (or set ${PROFILE_ENV})")
+
+
+def stats_path(args=None):
+    """Where the report should go: --stats, else $SYNCHOLE_STATS, else None"""
+    return getattr(args, 'stats', None) or os.environ.get(STATS_ENV) or None
+
+
+def profile_path(args=None):
+    return getattr(args, 'profile', None) or os.environ.get(PROFILE_ENV) or None
+
+
+def run(tool, func, args=None):
+    """Call func(stats) with instrumentation set up from args and the environment
+
+    stats is a StageStats, or None when no report was asked for. The
+    report is written and the profile saved even if func exits early.
+    Returns what func returns.
+    """
+    path = stats_path(args)
+    profile = profile_path(args)
+    stats = StageStats(tool) if path else None
+    profiler = cProfile.Profile() if profile else None
+    try:
+        if profiler:
+            return profiler.runcall(func, stats)
+        return func(stats)
+    finally:
+        if profiler:
+            profiler.dump_stats(profile)
+        if stats:
+            stats.write(path)
+
+
+def load_reports(path):
+    """Every report in a JSON lines file"""
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(reports):
+    """Total stage times, counts and the largest peak per tool"""
+    tools = {}
+    for report in reports:
+        tool = tools.setdefault(report['tool'], {'runs': 0, 'wall_s': 0.0, 'stages': {},
+                                                 'counts': {}, 'peak_bytes': 0})
+        tool['runs'] += 1
+        tool['wall_s'] += report.get('wall_s', 0.0)
+        tool['peak_bytes'] = max(tool['peak_bytes'], report.get('peak_bytes', 0))
+        for name, other in report.get('stages', {}).items():
+            entry = tool['stages'].setdefault(name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+            entry['calls'] += other['calls']
+            entry['wall_s'] += other['wall_s']
+            entry['cpu_s'] += other['cpu_s']
+        for name, n in report.get('counts', {}).items():
+            tool['counts'][name] = tool['counts'].get(name, 0) + n
+    return tools
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize the timing reports collected during a build")
+    parser.add_argument('reports', nargs='+', help="JSON lines report files")
+    parser.add_argument('--json', action='store_true', help="print the summary as JSON")
+    args = parser.parse_args()
+
+    reports = []
+    try:
+        for path in args.reports:
+            reports.extend(load_reports(path))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    tools = summarize(reports)
+
+    if args.json:
+        print(json.dumps(tools, indent=1))
+        return
+    total = sum(stage['wall_s'] for tool in tools.values() for stage in tool['stages'].values())
+    for name, tool in sorted(tools.items()):
+        print(f"{name}: {tool['runs']} runs, {tool['wall_s']:.3f} s, "
+              f"peak {tool['peak_bytes'] / 1024:.0f} KB")
+        for stage_name, entry in sorted(tool['stages'].items(), key=lambda s: -s[1]['wall_s']):
+            share = 100 * entry['wall_s'] / total if total else 0.0
+            print(f"  {stage_name:<12} {entry['wall_s']:9.3f} s wall {entry['cpu_s']:9.3f} s cpu "
+                  f"{entry['calls']:7d} calls  {share:5.1f}%")
+        if tool['counts']:
+            print("  " + ", ".join(f"{k} {v}" for k, v in sorted(tool['counts'].items())))
+
+
+if __name__ == '__main__':
+    main()
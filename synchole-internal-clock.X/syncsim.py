@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Simulate the SYNC24 output driven by external MIDI clock
+
+Models the 0xF8 branch of isr() in din-sync-hub-xc8-fixed_2.c: each MIDI
+clock raises the clock line and schedules its fall through the CCP1
+compare after half the time since the previous clock, as measured by
+TMR1 (1 MHz). If TMR1 overflowed (65.536 ms without a clock) the
+default 5000 us pulse is used instead. The ISR checks Timer0 first, so
+a clock byte arriving while the 1 ms tick is being serviced waits for
+it; the CCP interrupt ending the previous pulse delays it the same way.
+A clock arriving before the previous pulse has ended resets TMR1, so
+that falling edge never happens and two pulses merge.
+
+All of it works on whole arrays of timestamps, so hours of clock are
+simulated in well under a second:
+
+    ./syncsim.py --smf song.mid
+    ./syncsim.py --capture clock.txt --pulses pulses.csv
+    ./syncsim.py --bpm 174 --duration 3600 --jitter 300
+"""
+
+import argparse
+import struct
+import sys
+
+import numpy as np
+
+from clocktable import PPQN, XTAL_FREQ, tick_ms
+
+CYCLE_US = 4e6 / XTAL_FREQ          # one instruction cycle (Fosc/4)
+TMR1_OVERFLOW_US = 65536            # TMR1 counts at 1 MHz
+DEFAULT_CLOCK_LENGTH_USECS = 5000
+
+MIDI_CLOCK = 0xF8
+
+# ISR timing in instruction cycles (estimates for the XC8 build)
+INT_LATENCY_CYCLES = 5      # interrupt entry, context save
+T0_SERVICE_CYCLES = 40      # Timer0 branch, run every tick
+CCP_SERVICE_CYCLES = 6      # flag checks up to P_CLK = 0
+RC_SERVICE_CYCLES = 24      # flag checks, RCREG read and switch up to P_CLK = 1
+
+
+class MidiFileError(Exception):
+    """Raised when a Standard MIDI File can't be read"""
+
+
+def _read_varlen(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def smf_clock_times(path):
+    """MIDI clock timestamps (us) a sequencer would send while playing an SMF
+
+    The tempo map is read from every track and a clock is placed every
+    1/24 quarter note from the start to the last event.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != b'MThd':
+        raise MidiFileError(f"{path} isn't a Standard MIDI File")
+    header_len = struct.unpack('>I', data[4:8])[0]
+    _, ntracks, division = struct.unpack('>HHH', data[8:14])
+    if division & 0x8000:
+        # SMPTE timing: ticks are a fixed length, tempo doesn't apply
+        fps = 256 - (division >> 8)
+        tick_us = 1e6 / (fps * (division & 0xFF))
+        division = None
+    pos = 8 + header_len
+
+    tempos = {0: 500000}    # tick -> us per quarter note
+    end_tick = 0
+    for _ in range(ntracks):
+        if data[pos:pos + 4] != b'MTrk':
+            raise MidiFileError(f"Bad track header at byte {pos}")
+        length = struct.unpack('>I', data[pos + 4:pos + 8])[0]
+        pos += 8
+        end = pos + length
+        tick = 0
+        status = 0
+        try:
+            while pos < end:
+                delta, pos = _read_varlen(data, pos)
+                tick += delta
+                if data[pos] & 0x80:
+                    status = data[pos]
+                    pos += 1
+                if status == 0xFF:
+                    kind = data[pos]
+                    size, pos = _read_varlen(data, pos + 1)
+                    if kind == 0x51 and size == 3:
+                        tempos[tick] = int.from_bytes(data[pos:pos + 3], 'big')
+                    pos += size
+                elif status in (0xF0, 0xF7):
+                    size, pos = _read_varlen(data, pos)
+                    pos += size
+                else:
+                    pos += 1 if status & 0xF0 in (0xC0, 0xD0) else 2
+        except IndexError:
+            raise MidiFileError("Track ends in the middle of an event") from None
+        end_tick = max(end_tick, tick)
+        pos = end
+
+    if division is None:
+        # No tempo map to follow: clock at the SMF default of 120 BPM
+        return np.arange(0, end_tick * tick_us, 60e6 / (120 * PPQN))
+    # Clock positions in ticks, then through the piecewise-linear tempo map
+    clocks = np.arange(0, end_tick + 1e-9, division / PPQN)
+    change_ticks = np.array(sorted(tempos), dtype=float)
+    change_tempo = np.array([tempos[t] for t in sorted(tempos)], dtype=float)
+    us_per_tick = change_tempo / division
+    change_us = np.concatenate(([0.0], np.cumsum(np.diff(change_ticks) * us_per_tick[:-1])))
+    seg = np.searchsorted(change_ticks, clocks, side='right') - 1
+    return change_us[seg] + (clocks - change_ticks[seg]) * us_per_tick[seg]
+
+
+def capture_clock_times(path):
+    """MIDI clock timestamps (us) from a capture file
+
+    Each line holds a time in seconds followed by the received bytes in
+    hex, separated by spaces or commas, e.g. '12.034567 F8'. Only clock
+    bytes are used; '#' starts a comment.
+    """
+    times = []
+    with open(path, 'r') as f:
+        for line_num, line in enumerate(f, 1):
+            fields = line.split('#', 1)[0].replace(',', ' ').split()
+            if not fields:
+                continue
+            try:
+                stamp = float(fields[0])
+                values = [int(b, 16) for b in fields[1:]]
+            except ValueError:
+                raise ValueError(f"Bad capture line {line_num}: {line.strip()}") from None
+            if MIDI_CLOCK in values:
+                times.append(stamp * 1e6)
+    return np.sort(np.array(times, dtype=float))
+
+
+def synthetic_clock_times(bpm, duration_s, jitter_us=0.0, seed=0):
+    """Clock timestamps (us) at a steady BPM with optional random jitter"""
+    interval = 60e6 / (bpm * PPQN)
+    times = np.arange(0, duration_s * 1e6, interval)
+    if jitter_us:
+        rng = np.random.default_rng(seed)
+        times = times + rng.uniform(-jitter_us, jitter_us, len(times))
+    return np.sort(times)
+
+
+def service_time(flag_us, action_cycles, tick_us, tick_phase_us=0.0):
+    """When the ISR acts on interrupt flags raised at flag_us
+
+    The Timer0 branch runs first in every ISR pass, so a flag raised
+    while it is being serviced, or just before it, waits for it.
+    action_cycles counts from ISR entry to the action.
+    """
+    entry = INT_LATENCY_CYCLES * CYCLE_US
+    t0_busy = (INT_LATENCY_CYCLES + T0_SERVICE_CYCLES) * CYCLE_US
+    since_tick = np.mod(flag_us - tick_phase_us, tick_us)
+    to_tick = tick_us - since_tick
+    action = action_cycles * CYCLE_US
+    return np.where(since_tick < t0_busy,
+                    flag_us - since_tick + t0_busy + action,
+                    np.where(to_tick < entry,
+                             flag_us + entry + T0_SERVICE_CYCLES * CYCLE_US + action,
+                             flag_us + entry + action))
+
+
+def simulate(clock_us, tick_phase_us=0.0, tick=None):
+    """Run MIDI clock timestamps (us) through the modelled ISR
+
+    Returns a dict of arrays, one entry per clock: rise and fall (us,
+    fall is NaN where the pulse merged into the next), latency (us from
+    clock byte to rising edge), width (us as scheduled) and default
+    (the 5000 us pulse was used because TMR1 had overflowed).
+    """
+    clock_us = np.asarray(clock_us, dtype=float)
+    tick_us = (tick_ms() if tick is None else tick) * 1000.0
+    rise = service_time(clock_us, RC_SERVICE_CYCLES, tick_us, tick_phase_us)
+
+    def pulse_ends(rise):
+        since_last = np.diff(rise, prepend=-np.inf)
+        default = since_last >= TMR1_OVERFLOW_US
+        width = np.where(default, DEFAULT_CLOCK_LENGTH_USECS,
+                         np.floor(np.minimum(since_last, TMR1_OVERFLOW_US - 1)) // 2)
+        match = rise + width
+        return width, default, match
+
+    width, default, match = pulse_ends(rise)
+    # A clock landing while the previous pulse's CCP interrupt is being
+    # serviced waits for it
+    ccp_busy = (INT_LATENCY_CYCLES + CCP_SERVICE_CYCLES) * CYCLE_US
+    prev_match = np.concatenate(([-np.inf], match[:-1]))
+    blocked = (clock_us >= prev_match) & (clock_us < prev_match + ccp_busy)
+    if blocked.any():
+        rise = np.where(blocked, np.maximum(rise, prev_match + ccp_busy
+                                            + RC_SERVICE_CYCLES * CYCLE_US), rise)
+        width, default, match = pulse_ends(rise)
+
+    fall = service_time(match, CCP_SERVICE_CYCLES, tick_us, tick_phase_us)
+    next_rise = np.concatenate((rise[1:], [np.inf]))
+    merged = next_rise <= match
+    fall = np.where(merged, np.nan, fall)
+    return {'clock': clock_us, 'rise': rise, 'fall': fall, 'latency': rise - clock_us,
+            'width': width, 'default': default, 'merged': merged}
+
+
+def summarize(result):
+    """Latency and jitter statistics for a simulate() result"""
+    latency = result['latency']
+    added = np.diff(result['rise']) - np.diff(result['clock'])
+    high = (result['fall'] - result['rise'])[~result['merged']]
+    interval = np.diff(result['rise'])
+    duty = (high[:-1] / interval[:len(high) - 1]) if len(high) > 1 else np.array([])
+    return {
+        'clocks': len(latency),
+        'duration_s': float(result['clock'][-1] - result['clock'][0]) / 1e6 if len(latency) else 0.0,
+        'latency_mean_us': float(latency.mean()) if len(latency) else 0.0,
+        'latency_min_us': float(latency.min()) if len(latency) else 0.0,
+        'latency_max_us': float(latency.max()) if len(latency) else 0.0,
+        'latency_p99_us': float(np.percentile(latency, 99)) if len(latency) else 0.0,
+        'jitter_rms_us': float(np.sqrt(np.mean(added ** 2))) if len(added) else 0.0,
+        'jitter_max_us': float(np.abs(added).max()) if len(added) else 0.0,
+        'width_mean_us': float(high.mean()) if len(high) else 0.0,
+        'width_std_us': float(high.std()) if len(high) else 0.0,
+        'duty_min': float(duty.min()) if len(duty) else 0.0,
+        'duty_max': float(duty.max()) if len(duty) else 0.0,
+        'default_pulses': int(result['default'].sum()),
+        'merged_pulses': int(result['merged'].sum()),
+    }
+
+
+def write_pulses(path, result):
+    """Write the pulse train as CSV: clock, rise, fall, latency, width (us)"""
+    table = np.column_stack((result['clock'], result['rise'], result['fall'],
+                             result['latency'], result['width']))
+    np.savetxt(path, table, delimiter=',', fmt='%.3f',
+               header='clock_us,rise_us,fall_us,latency_us,width_us', comments='')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Predict the SYNC24 pulse train for a MIDI clock stream")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--smf', metavar='FILE', help="Standard MIDI File to play")
+    source.add_argument('--capture', metavar='FILE',
+                        help="timestamped capture, one '<seconds> <hex bytes>' per line")
+    source.add_argument('--bpm', type=float, help="synthetic clock at this BPM")
+    parser.add_argument('--duration', type=float, default=60.0,
+                        help="synthetic clock length in seconds (default: 60)")
+    parser.add_argument('--jitter', type=float, default=0.0, metavar='US',
+                        help="random jitter on the synthetic clock in us")
+    parser.add_argument('--tick-phase', type=float, default=0.0, metavar='US',
+                        help="Timer0 tick phase relative to the first clock")
+    parser.add_argument('--pulses', metavar='FILE', help="write the pulse train as CSV")
+    args = parser.parse_args()
+
+    try:
+        if args.smf:
+            clock = smf_clock_times(args.smf)
+        elif args.capture:
+            clock = capture_clock_times(args.capture)
+        else:
+            clock = synthetic_clock_times(args.bpm, args.duration, args.jitter)
+    except (MidiFileError, ValueError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+    if len(clock) < 2:
+        print("Error: need at least two MIDI clocks")
+        sys.exit(2)
+
+    result = simulate(clock, args.tick_phase)
+    stats = summarize(result)
+
+    print("=" * 50)
+    print("  SYNC24 Output Simulation")
+    print("=" * 50)
+    print()
+    print(f"{stats['clocks']} clocks over {stats['duration_s']:.1f} s")
+    print(f"Latency: mean {stats['latency_mean_us']:.1f} us, "
+          f"{stats['latency_min_us']:.1f}-{stats['latency_max_us']:.1f} us, "
+          f"p99 {stats['latency_p99_us']:.1f} us")
+    print(f"Added jitter: {stats['jitter_rms_us']:.2f} us RMS, {stats['jitter_max_us']:.1f} us max")
+    print(f"Pulse width: {stats['width_mean_us']:.0f} us mean, {stats['width_std_us']:.1f} us std, "
+          f"duty {stats['duty_min'] * 100:.1f}-{stats['duty_max'] * 100:.1f}%")
+    if stats['default_pulses']:
+        print(f"⚠ {stats['default_pulses']} pulses used the default "
+              f"{DEFAULT_CLOCK_LENGTH_USECS} us width (TMR1 overflow)")
+    if stats['merged_pulses']:
+        print(f"✗ {stats['merged_pulses']} pulses merged into the next one (edge lost)")
+    else:
+        print("✓ Every clock produced a separate pulse")
+
+    if args.pulses:
+        write_pulses(args.pulses, result)
+        print(f"✓ Wrote {args.pulses}")
+
+    if stats['merged_pulses']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
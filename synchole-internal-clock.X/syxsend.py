@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Stream a SysEx firmware image to a MIDI output, paced for the bootloader
+
+Messages are sent one block at a time and the sender holds back after
+each one for the bootloader's flash write, instead of pushing the whole
+file out at once. The output is anything that can be opened for
+writing: a raw MIDI device node (/dev/midi1, /dev/snd/midiC1D0), a pty
+or FIFO, or a plain file as a stand-in.
+
+    ./syxsend.py bpm-builds/synchole-120bpm.syx /dev/midi1
+    ./syxsend.py build.hex /dev/snd/midiC1D0 --gap 5 -v
+"""
+
+import argparse
+import os
+import sys
+import termios
+import time
+
+import hextosyx
+from flashsim import (FLASH_ERASE_MS, FLASH_WRITE_MS, MIDI_BAUD, UART_FIFO_DEPTH,
+                      block_flash_ms, byte_time_ms)
+
+
+def load_messages(path, product_key='b'):
+    """Yield the messages to send for a .syx or .hex file
+
+    A .syx file is read message by message; a .hex file is parsed and
+    encoded block by block with hextosyx.iter_sysex().
+    """
+    product = hextosyx.get_product(product_key)
+    if path.lower().endswith('.hex'):
+        with open(path, 'r') as infile:
+            memory, max_addr = hextosyx.parse_hex(infile, None, hextosyx.memory_size(product))
+        hextosyx.fix_reset_vec(memory)
+        yield from hextosyx.iter_sysex(memory, max_addr, product['id'], product['block_size'])
+    else:
+        with open(path, 'rb') as infile:
+            yield from hextosyx.iter_messages(infile)
+
+
+def open_output(path, nonblocking=False):
+    """Open a MIDI device node, pty, FIFO or file for writing, return the fd"""
+    flags = os.O_WRONLY | os.O_NOCTTY
+    if nonblocking:
+        flags |= os.O_NONBLOCK
+    if not os.path.exists(path):
+        flags |= os.O_CREAT | os.O_TRUNC
+    elif os.path.isfile(path):
+        flags |= os.O_TRUNC
+    fd = os.open(path, flags, 0o644)
+    if os.isatty(fd):
+        # A serial MIDI interface or pty: pass bytes through untouched
+        attrs = termios.tcgetattr(fd)
+        attrs[1] &= ~termios.OPOST
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    return fd
+
+
+def write_all(fd, data):
+    """os.write() until every byte is accepted (blocks on a full device)"""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+class Pacer:
+    """Works out how long to hold back after each message
+
+    With a fixed gap every data block is followed by the same pause. In
+    adaptive mode (gap_ms None) the pause is the flash time of the block
+    just sent, less what the bootloader's UART FIFO absorbs, so only
+    blocks that start an erase row get the longer wait.
+    """
+
+    def __init__(self, product_key='b', gap_ms=None, baud=MIDI_BAUD,
+                 write_ms=FLASH_WRITE_MS, erase_ms=FLASH_ERASE_MS,
+                 fifo_depth=UART_FIFO_DEPTH):
+        self.block_size = hextosyx.get_product(product_key)['block_size']
+        self.fixed_gap_ms = gap_ms
+        self.byte_ms = byte_time_ms(baud)
+        self.write_ms = write_ms
+        self.erase_ms = erase_ms
+        self.fifo_depth = fifo_depth
+
+    def wire_ms(self, length):
+        """Time for length bytes to go out on the MIDI wire"""
+        return length * self.byte_ms
+
+    def gap_ms(self, block):
+        """Pause after data block number block (None for the end marker)"""
+        if block is None:
+            return 0.0
+        if self.fixed_gap_ms is not None:
+            return self.fixed_gap_ms
+        flash = block_flash_ms(block, self.block_size, self.write_ms, self.erase_ms)
+        return max(0.0, flash - (self.fifo_depth + 1) * self.byte_ms)
+
+
+def send_stream(messages, fd, pacer, log=None):
+    """Write messages to fd, holding back between them as pacer says
+
+    The wait after each message runs from when its last byte is off the
+    wire: the later of its estimated wire time and, for a tty, the
+    device draining its output queue.
+    log(block, length, latency_ms), if given, is called after each
+    message, latency being how long after its due time the message was
+    fully written. Returns a stats dict.
+    """
+    drain = os.isatty(fd)
+    start = time.perf_counter()
+    due = start
+    latencies = []
+    total = 0
+    block = 0
+    for msg in messages:
+        now = time.perf_counter()
+        if now < due:
+            time.sleep(due - now)
+        sent = time.perf_counter()
+        write_all(fd, msg)
+        if drain:
+            termios.tcdrain(fd)
+        done = time.perf_counter()
+        latency = (done - due) * 1000
+        latencies.append(latency)
+        total += len(msg)
+
+        # The bootloader starts writing once the F7 is off the wire
+        on_wire = max(sent + pacer.wire_ms(len(msg)) / 1000, done)
+        due = on_wire + pacer.gap_ms(None if msg[4] == 0 else block) / 1000
+        if log:
+            log(block, len(msg), latency)
+        block += 1
+
+    seconds = time.perf_counter() - start
+    return {'messages': len(latencies), 'bytes': total, 'seconds': seconds,
+            'bytes_per_sec': total / seconds if seconds else 0.0,
+            'latency_mean_ms': sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_max_ms': max(latencies, default=0.0)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Send a firmware image to the MIDI bootloader, paced per block")
+    parser.add_argument('input', help=".syx file, or .hex to encode on the fly")
+    parser.add_argument('output', help="MIDI device node, pty, FIFO or file")
+    parser.add_argument('-p', '--product', default='b',
+                        help="product key (default: b, Synchole)")
+    parser.add_argument('--gap', type=float,
+                        help="fixed pause after each block in ms "
+                             "(default: adapt to each block's flash time)")
+    parser.add_argument('--baud', type=int, default=MIDI_BAUD)
+    parser.add_argument('--write-ms', type=float, default=FLASH_WRITE_MS,
+                        help=f"flash write time per 16 words (default: {FLASH_WRITE_MS})")
+    parser.add_argument('--erase-ms', type=float, default=FLASH_ERASE_MS,
+                        help=f"flash row erase time (default: {FLASH_ERASE_MS})")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="log every block")
+    args = parser.parse_args()
+
+    try:
+        pacer = Pacer(args.product, args.gap, args.baud, args.write_ms, args.erase_ms)
+        fd = open_output(args.output)
+    except (hextosyx.HexToSyxError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+
+    def log(block, length, latency):
+        print(f"  block {block}: {length} bytes, {latency:.2f} ms after due")
+
+    mode = "adaptive" if args.gap is None else f"{args.gap} ms"
+    print(f"Sending {args.input} to {args.output} (gap: {mode})")
+    try:
+        stats = send_stream(load_messages(args.input, args.product), fd, pacer,
+                            log if args.verbose else None)
+    except (hextosyx.HexToSyxError, OSError) as e:
+        print(f"✗ Send failed: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("✗ Aborted, the unit needs reflashing")
+        sys.exit(130)
+    finally:
+        os.close(fd)
+
+    print(f"✓ Sent {stats['messages']} messages ({stats['bytes']} bytes) "
+          f"in {stats['seconds']:.3f} s")
+    print(f"  {stats['bytes_per_sec']:.0f} bytes/sec, block latency "
+          f"mean {stats['latency_mean_ms']:.2f} ms, max {stats['latency_max_ms']:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import base64
+import importlib
+import json
+import random
+import shutil
+import subprocess
+import zlib
+
+import pytest
+
+import hextosyx
+
+embed_firmwares = importlib.import_module('embed-firmwares')
+
+NODE = shutil.which('node')
+
+
+def _inflate_fallback(payloads):
+    """Run the page's inflateFallback under Node over base64 payloads"""
+    script = embed_firmwares.PAGE_SCRIPT
+    start = script.index("function inflateFallback")
+    end = script.index("// Decode an embedded payload")
+    program = script[start:end] + """
+        const payloads = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+        console.log(JSON.stringify(payloads.map(b64 =>
+            Buffer.from(inflateFallback(Buffer.from(b64, 'base64'))).toString('base64'))));
+    """
+    result = subprocess.run([NODE, '-e', program], input=json.dumps(payloads),
+                            capture_output=True, text=True, check=True)
+    return [base64.b64decode(b64) for b64 in json.loads(result.stdout)]
+
+
+def _images():
+    rng = random.Random(0)
+    memory = hextosyx.SparseMemory(4096)
+    memory.write(0, bytes(rng.randrange(0x40) for _ in range(2048)))
+    return {
+        'original': embed_firmwares.ORIGINAL_FIRMWARE.read_bytes(),
+        'sysex': hextosyx.encode_sysex(memory, memory.end, 0x14, 16),
+        'random': bytes(rng.randrange(256) for _ in range(5000)),     # stored blocks
+        'short': b'\xf0\x00\x7f\x14\x00\xf7',                         # fixed codes
+        'zeros': bytes(70000),                                         # long matches
+        'empty': b'',
+    }
+
+
+@pytest.mark.skipif(NODE is None, reason="needs Node.js")
+def test_inflate_fallback_decodes_embedded_payloads():
+    images = _images()
+    encoder = embed_firmwares.PayloadEncoder(compress=True)
+    payloads = [encoder.encode(data) for data in images.values()]
+    assert _inflate_fallback(payloads) == list(images.values())
+
+
+@pytest.mark.skipif(NODE is None, reason="needs Node.js")
+def test_inflate_fallback_fixed_and_stored_blocks():
+    images = _images()
+    payloads = []
+    for data in images.values():
+        for strategy in (zlib.Z_FIXED, zlib.Z_DEFAULT_STRATEGY):
+            compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+            payloads.append(compressor.compress(data) + compressor.flush())
+        payloads.append(zlib.compress(data, 0))
+    decoded = _inflate_fallback([base64.b64encode(p).decode() for p in payloads])
+    assert decoded == [data for data in images.values() for _ in range(3)]
+
+
+@pytest.mark.skipif(embed_firmwares.clock_table is None, reason="needs NumPy")
+def test_clock_data_periods_in_ms():
+    from clocktable import tick_ms
+    timers = {61: {'prescale': 32, 'reload': 96, 'ticks': 32, 'error_pct': 0.0576}}
+    clock = embed_firmwares.clock_data([120, 61], timers)
+    assert list(clock) == [61, 120]
+    assert clock[120] == [round(21 * tick_ms(), 2), 118.57]
+    assert clock[61] == [40.96, 61.04]
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_encoded_size_matches_payload(compress):
+    data = embed_firmwares.ORIGINAL_FIRMWARE.read_bytes()
+    for length in (0, 1, 2, 3, len(data)):
+        encoder = embed_firmwares.PayloadEncoder(compress)
+        size = encoder.encoded_size(data[:length])
+        assert size == len(embed_firmwares.to_json(encoder.encode(data[:length]), None))
+
+
+def test_make_patch_falls_back_when_not_smaller():
+    base = embed_firmwares.ORIGINAL_FIRMWARE.read_bytes()
+    close = bytearray(base)
+    close[10] ^= 0x01
+    scattered = bytes(b ^ 0x01 for b in base)
+    limit = embed_firmwares.PayloadEncoder().encoded_size(base)
+    assert embed_firmwares.make_patch(base, bytes(close), limit) == [10, close[10]]
+    assert embed_firmwares.make_patch(base, scattered) is not None
+    assert embed_firmwares.make_patch(base, scattered, limit) is None
+    assert embed_firmwares.make_patch(base, base[:-1], limit) is None
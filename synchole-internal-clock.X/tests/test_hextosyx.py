@@ -0,0 +1,204 @@
+import io
+from pathlib import Path
+
+import pytest
+
+import hextosyx
+
+FIRMWARE_DIR = Path(__file__).resolve().parents[2] / "firmware"
+HEX_FILES = sorted(FIRMWARE_DIR.glob("*/*.hex"))
+
+
+def test_firmware_hex_files_found():
+    assert HEX_FILES, f"no HEX files under {FIRMWARE_DIR}"
+
+
+@pytest.mark.parametrize('hex_path', HEX_FILES, ids=lambda p: f"{p.parent.name}/{p.name}")
+def test_fast_reader_matches_reference(hex_path):
+    with open(hex_path, 'r') as infile:
+        memory, max_addr = hextosyx.parse_hex(infile)
+    with open(hex_path, 'r') as infile:
+        ref_memory, ref_max_addr = hextosyx.read_hex_reference(infile)
+
+    assert ref_memory is not None
+    assert max_addr == ref_max_addr
+    assert memory[:hextosyx.MEMORY_SIZE] == ref_memory
+
+
+@pytest.mark.parametrize('hex_path', HEX_FILES, ids=lambda p: f"{p.parent.name}/{p.name}")
+@pytest.mark.parametrize('product_key', sorted(hextosyx.PRODUCTS))
+def test_check_readers(hex_path, product_key):
+    assert hextosyx.check_readers(str(hex_path), product_key) is None
+
+
+def _hex_file(*records):
+    return io.StringIO("\n".join([*records, hextosyx.hex_record(0, 1)]) + "\n")
+
+
+@pytest.mark.parametrize('memory_size', [4096, hextosyx.MEMORY_SIZE])
+def test_parse_hex_keeps_record_ending_at_memory_size(memory_size):
+    data = bytes(range(16))
+    infile = _hex_file(hextosyx.hex_record(memory_size - 16, 0, data))
+    memory, max_addr = hextosyx.parse_hex(infile, None, memory_size)
+    assert max_addr == memory_size
+    assert memory[memory_size - 16:memory_size] == data
+
+
+@pytest.mark.parametrize('memory_size', [4096, hextosyx.MEMORY_SIZE])
+def test_parse_hex_skips_record_crossing_memory_size(memory_size):
+    notes = []
+    infile = _hex_file(hextosyx.hex_record(0, 0, b'\x01\x02'),
+                       hextosyx.hex_record(memory_size - 8, 0, bytes(16)))
+    memory, max_addr = hextosyx.parse_hex(infile, notes, memory_size)
+    assert max_addr == 2
+    assert memory[memory_size - 8:memory_size] == b'\xff' * 8
+    assert any("out of range" in note for note in notes)
+
+
+def test_parse_hex_overflow_keeps_record_crossing_memory_size():
+    overflow = hextosyx.SparseMemory(None)
+    infile = _hex_file(hextosyx.hex_record(4096 - 8, 0, bytes(16)))
+    memory, max_addr = hextosyx.parse_hex(infile, None, 4096, overflow=overflow)
+    assert max_addr == 0
+    assert list(overflow.ranges()) == [(4096 - 8, 4096 + 8)]
+
+
+def test_iter_messages_splits_stream():
+    data = bytes.fromhex("f0007f0a0101020304f7" "f0007f0a000000f7")
+    messages = list(hextosyx.iter_messages(io.BytesIO(data), chunk_size=3))
+    assert messages == [data[:10], data[10:]]
+
+
+@pytest.mark.parametrize('data', [
+    bytes.fromhex("f7"),                    # stray F7
+    bytes.fromhex("f0007ff7"),              # header cut short
+    bytes.fromhex("f0007f0a0101f7" "00f7"), # second message without F0
+    bytes.fromhex("f0007f0a0101"),          # no closing F7
+], ids=['stray-f7', 'short-header', 'missing-f0', 'unterminated'])
+def test_iter_messages_rejects_malformed(data):
+    with pytest.raises(hextosyx.SysExFormatError):
+        list(hextosyx.iter_messages(io.BytesIO(data)))
+
+
+def test_check_readers_full_size_image(tmp_path):
+    from benchmark import synthetic_hex
+    hex_path = tmp_path / "full.hex"
+    hex_path.write_text(synthetic_hex(hextosyx.MEMORY_SIZE)[0])
+    assert hextosyx.check_readers(str(hex_path)) is None
+
+
+@pytest.mark.parametrize('fill', [0xFF, 0x00])
+def test_sparse_memory_adjacent_writes_merge(fill):
+    memory = hextosyx.SparseMemory(16, fill)
+    memory.write(4, b'\x01\x02')
+    memory.write(6, b'\x03\x04')
+    assert memory.ranges() == [(4, 8)]
+    assert memory[:] == bytes([fill] * 4) + b'\x01\x02\x03\x04' + bytes([fill] * 8)
+
+
+@pytest.mark.parametrize('fill', [0xFF, 0x00])
+def test_sparse_memory_overlapping_write_wins(fill):
+    memory = hextosyx.SparseMemory(16, fill)
+    memory.write(2, b'\x01\x02\x03\x04')
+    memory.write(8, b'\x09')
+    memory.write(4, b'\xaa\xbb\xcc\xdd\xee')
+    assert memory.ranges() == [(2, 9)]
+    assert memory[:] == (bytes([fill] * 2) + b'\x01\x02\xaa\xbb\xcc\xdd\xee'
+                         + bytes([fill] * 7))
+
+
+@pytest.mark.parametrize('fill', [0xFF, 0x00])
+def test_sparse_memory_out_of_order_writes(fill):
+    memory = hextosyx.SparseMemory(16, fill)
+    memory.write(12, b'\x0c\x0d')
+    memory.write(0, b'\x00\x01')
+    memory.write(2, b'\x02\x03')
+    memory.write(10, b'\x0a\x0b')
+    assert memory.ranges() == [(0, 4), (10, 14)]
+    assert memory.end == 14
+    assert memory[:] == (b'\x00\x01\x02\x03' + bytes([fill] * 6) + b'\x0a\x0b\x0c\x0d'
+                         + bytes([fill] * 2))
+
+
+@pytest.mark.parametrize('fill', [0xFF, 0x00])
+def test_sparse_memory_hole_between_segments(fill):
+    memory = hextosyx.SparseMemory(None, fill)
+    memory.write(0, b'\x01\x02')
+    memory.write(6, b'\x03')
+    assert memory.ranges() == [(0, 2), (6, 7)]
+    assert len(memory) == 7
+    assert memory[:] == b'\x01\x02' + bytes([fill] * 4) + b'\x03'
+    assert memory.read(1, 9) == b'\x02' + bytes([fill] * 4) + b'\x03' + bytes([fill] * 2)
+    memory.write(2, bytes(4))
+    assert memory.ranges() == [(0, 7)]
+    assert memory[:] == b'\x01\x02' + bytes(4) + b'\x03'
+
+
+def _synchole_sysex():
+    memory = hextosyx.SparseMemory(4096)
+    memory.write(0, bytes([0x80, 0x31, 0x02, 0x28]) + bytes(range(0x40)) * 2)
+    return bytearray(hextosyx.encode_sysex(memory, memory.end, 0x14, 16))
+
+
+def test_decode_sysex_round_trip():
+    image, product_id, block_size = hextosyx.decode_sysex(_synchole_sysex(), 'b')
+    assert (product_id, block_size) == (0x14, 16)
+    assert image[4:0x44] == bytes(range(0x40))
+
+
+def _corrupt(data, pos, value):
+    data[pos] = value
+    return data
+
+
+@pytest.mark.parametrize('data, product_key, message', [
+    (_corrupt(_synchole_sysex(), 4, 5), 'b', "sequence 5, expected 1"),
+    (_corrupt(_synchole_sysex(), 2 * 38 - 1, 0x00), 'b', "doesn't end with F7"),
+    (_corrupt(_synchole_sysex(), 38 + 7, 0x80), 'b', "has bit 7 set"),
+    (_synchole_sysex(), 'a', "Product ID 0x14"),
+    (_synchole_sysex()[:-3], 'b', "isn't a multiple"),
+], ids=['sequence', 'missing-f7', 'bit-7', 'product-id', 'truncated'])
+def test_decode_sysex_rejects(data, product_key, message):
+    with pytest.raises(hextosyx.SysExFormatError, match=message):
+        hextosyx.decode_sysex(data, product_key)
+
+
+def test_verify_main_reports_corrupted_syx(tmp_path):
+    hex_path = tmp_path / "build.hex"
+    hex_path.write_text("\n".join([hextosyx.hex_record(0, 0, bytes([0x80, 0x31, 0x02, 0x28])),
+                                   hextosyx.hex_record(4, 0, bytes(range(16))),
+                                   hextosyx.hex_record(0, 1)]) + "\n")
+    syx_path = tmp_path / "build.syx"
+    hextosyx.convert_file(str(hex_path), str(syx_path), 'b')
+    assert hextosyx.verify_main(['b', '-j', '1', '-q', str(hex_path)]) == 0
+
+    data = bytearray(syx_path.read_bytes())
+    data[10] ^= 0x01
+    syx_path.write_bytes(data)
+    assert hextosyx.verify_main(['b', '-j', '1', '-q', str(hex_path)]) == 6
+
+    data[4] = 9
+    syx_path.write_bytes(data)
+    assert hextosyx.verify_main(['b', '-j', '1', '-q', str(syx_path)]) == 6
+
+
+@pytest.mark.parametrize('hex_path', HEX_FILES, ids=lambda p: f"{p.parent.name}/{p.name}")
+def test_emit_file_outputs(hex_path, tmp_path):
+    targets = hextosyx.parse_targets('syx,bin,hex')
+    syx_path, bin_path, norm_path = map(
+        Path, hextosyx.emit_file(str(hex_path), targets, str(tmp_path)))
+    product = hextosyx.PRODUCTS['b']
+
+    # The normalized HEX converts to the same SysEx as its source
+    assert hextosyx.convert_file(str(norm_path), str(tmp_path / "norm.syx")) == \
+        syx_path.read_bytes()
+    assert hextosyx.verify_file(str(hex_path), str(syx_path)) is None
+
+    for line in norm_path.read_text().splitlines():
+        assert sum(bytes.fromhex(line[1:])) & 0xFF == 0, line
+
+    with open(hex_path, 'r') as infile:
+        memory, max_addr = hextosyx.parse_hex(infile, None, hextosyx.memory_size(product))
+    data = bin_path.read_bytes()
+    assert len(data) == hextosyx.memory_size(product)
+    assert data[max_addr + max_addr % 2:] == b'\xff\x3f' * ((len(data) - max_addr) // 2)
@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+import hextosyx
+import syxsend
+
+
+def test_send_stream_rejects_malformed_syx(tmp_path):
+    syx = tmp_path / "bad.syx"
+    syx.write_bytes(bytes.fromhex("f0007f0a0101020304f7" "f7"))
+    fd = os.open(tmp_path / "out.bin", os.O_WRONLY | os.O_CREAT)
+    try:
+        with pytest.raises(hextosyx.SysExFormatError):
+            syxsend.send_stream(syxsend.load_messages(str(syx)), fd, syxsend.Pacer(gap_ms=0))
+    finally:
+        os.close(fd)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Search Timer0 settings for precise internal clock tempos
+
+The stock firmware always uses a 1/16 prescaler and a reload of 5 (a
+1.004 ms tick) and only varies INTERNAL_CLOCK_PERIOD_MS, so few tempos
+come out exact. This searches the prescaler, the TIMER_0_INIT_SCALAR
+reload value and the tick count together for each target BPM and writes
+a lookup table the builder can use:
+
+    ./timersearch.py --range 60 240 --step 0.1 --output timer-table.json
+    ./xc8build.py --timer-table timer-table.json
+
+Every candidate tick length is scored against every target at once with
+NumPy, so a full 0.1 BPM sweep takes well under a second. The tick also
+drives the firmware's millisecond timers (LEDs, debounce, long press),
+so it is kept within --tick-range of 1 ms.
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from bpmconfig import LIBRARY_BPMS, parse_bpm_list
+from clocktable import MAX_PERIOD_TICKS, PPQN, XTAL_FREQ, clock_table, tick_ms
+
+# Timer0 prescale ratio -> OPTION_REG PS bits (None: PSA = 1, no prescaler)
+PRESCALERS = {1: None, 2: 0b000, 4: 0b001, 8: 0b010, 16: 0b011,
+              32: 0b100, 64: 0b101, 128: 0b110, 256: 0b111}
+
+# Instruction cycles from Timer0 overflow to the TMR0 reload in the ISR
+# (interrupt latency plus the instructions before the write)
+RELOAD_LATENCY_CYCLES = (0, 10)
+
+TICK_RANGE_MS = (0.5, 2.0)
+TABLE_VERSION = 1
+
+
+def candidate_ticks(prescalers=PRESCALERS, tick_range=TICK_RANGE_MS, xtal=XTAL_FREQ):
+    """All (prescale, reload) pairs whose tick length is within tick_range
+
+    Returns arrays prescale, reload and cycles (instruction cycles per
+    tick, before reload latency). The stock 1/16 prescaler comes first so
+    it wins ties.
+    """
+    ratios = sorted(prescalers, key=lambda p: (p != 16, p))
+    prescale = np.repeat(np.array(ratios), 256)
+    reload = np.tile(np.arange(256), len(ratios))
+    cycles = (256 - reload) * prescale
+    tick = cycles * 4000.0 / xtal
+    keep = (tick >= tick_range[0]) & (tick <= tick_range[1])
+    return prescale[keep], reload[keep], cycles[keep]
+
+
+def search(bpms, prescalers=PRESCALERS, tick_range=TICK_RANGE_MS,
+           latency=RELOAD_LATENCY_CYCLES, xtal=XTAL_FREQ, chunk=2048):
+    """Best Timer0 settings for each target BPM
+
+    For every candidate tick the best tick count is the rounded ratio of
+    the target pulse period to the tick, so each (target, tick) pair is
+    scored directly. The score is the worst error over the reload
+    latency range, which is also reported as the error bound. Returns a
+    dict of arrays: bpm, prescale, ps_bits, reload, ticks, actual_bpm,
+    error_pct (at the low latency) and bound_pct.
+    """
+    bpm = np.asarray(bpms, dtype=float)
+    prescale, reload, cycles = candidate_ticks(prescalers, tick_range, xtal)
+    if not len(cycles):
+        raise ValueError("No Timer0 setting gives a tick in the requested range")
+    fcy_ms = xtal / 4000.0                          # instruction cycles per ms
+    low = (cycles + latency[0]) / fcy_ms            # tick length in ms
+    high = (cycles + latency[1]) / fcy_ms
+    target = 60000.0 / (bpm * PPQN)                 # pulse period in ms
+
+    best = np.empty(len(bpm), dtype=np.int64)
+    ticks = np.empty(len(bpm), dtype=np.int64)
+    for start in range(0, len(bpm), chunk):
+        t = target[start:start + chunk, None]
+        # The best count is one of the two either side of the target
+        # over the middle of the latency range
+        below = np.clip(np.floor(2 * t / (low + high)), 1, MAX_PERIOD_TICKS)
+        above = np.minimum(below + 1, MAX_PERIOD_TICKS)
+        bound_below = np.maximum(np.abs(below * low - t), np.abs(below * high - t))
+        bound_above = np.maximum(np.abs(above * low - t), np.abs(above * high - t))
+        n = np.where(bound_above < bound_below, above, below)
+        pick = np.argmin(np.minimum(bound_below, bound_above), axis=1)
+        best[start:start + chunk] = pick
+        ticks[start:start + chunk] = n[np.arange(len(pick)), pick]
+
+    actual_low = 60000.0 / (PPQN * ticks * low[best])
+    actual_high = 60000.0 / (PPQN * ticks * high[best])
+    error_low = 100.0 * (actual_low - bpm) / bpm
+    error_high = 100.0 * (actual_high - bpm) / bpm
+    return {
+        'bpm': bpm,
+        'prescale': prescale[best],
+        'ps_bits': np.array([-1 if PRESCALERS[p] is None else PRESCALERS[p]
+                             for p in prescale[best].tolist()], dtype=np.int64),
+        'reload': reload[best],
+        'ticks': ticks,
+        'actual_bpm': actual_low,
+        'error_pct': error_low,
+        'bound_pct': np.maximum(np.abs(error_low), np.abs(error_high)),
+    }
+
+
+def table_json(result, latency=RELOAD_LATENCY_CYCLES, xtal=XTAL_FREQ):
+    """Compact lookup table: one [bpm, prescale, reload, ticks, error %, bound %] row per BPM"""
+    rows = [[round(b, 3), int(p), int(r), int(n), round(e, 4), round(m, 4)]
+            for b, p, r, n, e, m in zip(result['bpm'].tolist(), result['prescale'].tolist(),
+                                        result['reload'].tolist(), result['ticks'].tolist(),
+                                        result['error_pct'].tolist(), result['bound_pct'].tolist())]
+    return {'version': TABLE_VERSION, 'xtal': xtal, 'latency_cycles': list(latency),
+            'columns': ['bpm', 'prescale', 'reload', 'ticks', 'error_pct', 'bound_pct'],
+            'rows': rows}
+
+
+def load_table(path):
+    """Read a lookup table into {bpm: {'prescale', 'reload', 'ticks', ...}}"""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if data.get('version') != TABLE_VERSION:
+        raise ValueError(f"{path} isn't a version {TABLE_VERSION} timer table")
+    columns = data['columns']
+    table = {}
+    for row in data['rows']:
+        entry = dict(zip(columns, row))
+        bpm = entry.pop('bpm')
+        table[int(bpm) if bpm == int(bpm) else bpm] = entry
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find the Timer0 prescaler, reload and tick count for precise tempos")
+    parser.add_argument('--bpms', type=parse_bpm_list,
+                        help="BPMs to search, e.g. 60-240 or 120,140 (default: the library list)")
+    parser.add_argument('--range', nargs=2, type=float, metavar=('FIRST', 'LAST'),
+                        help="search every BPM from FIRST to LAST in --step increments")
+    parser.add_argument('--step', type=float, default=0.1)
+    parser.add_argument('--tick-range', nargs=2, type=float, default=TICK_RANGE_MS,
+                        metavar=('MIN_MS', 'MAX_MS'),
+                        help=f"allowed Timer0 tick length (default: {TICK_RANGE_MS[0]} "
+                             f"to {TICK_RANGE_MS[1]} ms)")
+    parser.add_argument('--latency', nargs=2, type=int, default=RELOAD_LATENCY_CYCLES,
+                        metavar=('MIN', 'MAX'),
+                        help="range of cycles lost at each TMR0 reload (default: "
+                             f"{RELOAD_LATENCY_CYCLES[0]} to {RELOAD_LATENCY_CYCLES[1]})")
+    parser.add_argument('--prescale', type=int, action='append', choices=sorted(PRESCALERS),
+                        help="only try these prescale ratios (repeat for several)")
+    parser.add_argument('-o', '--output', help="write the lookup table as JSON")
+    parser.add_argument('--summary', action='store_true',
+                        help="only print the summary, not every row")
+    args = parser.parse_args()
+
+    if args.range:
+        first, last = args.range
+        bpms = np.round(np.arange(first, last + args.step / 2, args.step), 6)
+    else:
+        bpms = np.array(args.bpms or LIBRARY_BPMS, dtype=float)
+    prescalers = {p: PRESCALERS[p] for p in args.prescale} if args.prescale else PRESCALERS
+
+    try:
+        result = search(bpms, prescalers, tuple(args.tick_range), tuple(args.latency))
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if not args.summary:
+        print(f"{'BPM':>8} {'Prescale':>8} {'Reload':>6} {'Ticks':>5} {'Actual':>9} "
+              f"{'Error %':>8} {'Bound %':>8}")
+        for i in range(len(bpms)):
+            print(f"{result['bpm'][i]:8g} {'1:' + str(result['prescale'][i]):>8} "
+                  f"{result['reload'][i]:6d} {result['ticks'][i]:5d} "
+                  f"{result['actual_bpm'][i]:9.3f} {result['error_pct'][i]:+8.3f} "
+                  f"{result['bound_pct'][i]:8.3f}")
+        print()
+
+    # The stock settings over the same reload latency range
+    stock = [clock_table(bpms, tick_ms(reload_cycles=cycles)) for cycles in args.latency]
+    valid = stock[0]['valid']
+    stock_bound = np.maximum(*(np.abs(t['error_pct'][valid]) for t in stock))
+    print(f"{len(bpms)} BPMs searched")
+    print(f"Stock timer:    mean bound {stock_bound.mean():.3f}%, worst {stock_bound.max():.3f}%")
+    print(f"Searched timer: mean bound {result['bound_pct'].mean():.3f}%, "
+          f"worst {result['bound_pct'].max():.3f}%")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(table_json(result, tuple(args.latency)), f, separators=(',', ':'))
+        print(f"✓ Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Rebuild the firmware library and web page whenever the source changes
+
+Polls the C source, the project makefiles and bpm-builds/. Once a burst
+of changes has settled, only what they affect is redone:
+
+  source or makefiles  recompile, then re-embed the variants that changed
+  bpm-builds/ only     re-embed the changed .syx files
+
+By default two reference builds are compiled and every other BPM is
+patched from them (see bpmpatch.py), so a save turns into a refreshed
+synchole-complete.html in a few seconds. --builder xc8 compiles every
+variant instead, in parallel and through the build cache, skipping BPMs
+whose cache key hasn't changed since the last build.
+
+The encoded variants and the embedder's manifest stay in memory between
+rebuilds, and variants whose bytes didn't change aren't rewritten, so
+the page refresh only encodes what is new.
+
+    ./watchbuild.py
+    ./watchbuild.py --bpms 60-240 --compress
+    ./watchbuild.py --builder xc8 -j 8
+"""
+
+import argparse
+import importlib
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import hextosyx
+from bpmconfig import (BPM_BUILDS_DIR, LIBRARY_BPMS, PRODUCT_KEY, SCRIPT_DIR, SOURCE_FILE,
+                       clock_period_ms, parse_bpm_list, syx_name)
+from bpmpatch import PatchError, compile_reference, encode_variant, find_period_sites
+from buildcache import CACHE_DIR, LOCAL_MAKEFILE, MAKEFILE, BuildCache, cache_key
+from xc8build import BuildError, build_library
+
+embed_firmwares = importlib.import_module('embed-firmwares')
+
+POLL_INTERVAL = 0.5
+DEBOUNCE = 1.0
+REFERENCE_BPMS = (120, 60)
+
+# What each group of watched files triggers
+WATCHED = {
+    'source': [SCRIPT_DIR / SOURCE_FILE],
+    'config': [SCRIPT_DIR / "Makefile", SCRIPT_DIR / MAKEFILE, SCRIPT_DIR / LOCAL_MAKEFILE,
+               SCRIPT_DIR / "nbproject" / "configurations.xml"],
+}
+
+
+def snapshot():
+    """(size, mtime_ns) of every watched file, by group"""
+    groups = {name: list(paths) for name, paths in WATCHED.items()}
+    groups['library'] = sorted(BPM_BUILDS_DIR.glob("*.syx")) + [embed_firmwares.ORIGINAL_FIRMWARE]
+    state = {}
+    for name, paths in groups.items():
+        state[name] = {}
+        for path in paths:
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            state[name][str(path)] = (st.st_size, st.st_mtime_ns)
+    return state
+
+
+def wait_for_change(state, interval=POLL_INTERVAL, debounce=DEBOUNCE):
+    """Poll until the watched files differ from state and then stay put
+    for debounce seconds; return the new snapshot"""
+    while True:
+        time.sleep(interval)
+        new = snapshot()
+        if new != state:
+            break
+    settled = time.monotonic()
+    while time.monotonic() - settled < debounce:
+        time.sleep(min(interval, debounce))
+        latest = snapshot()
+        if latest != new:
+            new = latest
+            settled = time.monotonic()
+    return new
+
+
+class LibraryWatcher:
+    """Rebuild state kept warm between changes"""
+
+    def __init__(self, bpms, builder='patch', refs=REFERENCE_BPMS, jobs=None, cache=None,
+                 embed_args=None):
+        self.bpms = bpms
+        self.builder = builder
+        self.refs = refs
+        self.jobs = jobs
+        self.cache = cache
+        self.embed_args = embed_args
+        self.product = hextosyx.PRODUCTS[PRODUCT_KEY]
+        self.images = {}        # bpm -> .syx bytes last written (patch builder)
+        self.keys = {}          # bpm -> cache key last built (xc8 builder)
+        self.manifest = None
+        BPM_BUILDS_DIR.mkdir(parents=True, exist_ok=True)
+        for bpm in bpms:
+            path = BPM_BUILDS_DIR / syx_name(bpm)
+            if path.exists():
+                self.images[bpm] = path.read_bytes()
+
+    def build_patched(self):
+        """Compile the references, patch every BPM, return the BPMs whose .syx changed"""
+        with tempfile.TemporaryDirectory(prefix="synchole-watch-") as workdir:
+            with ThreadPoolExecutor(max_workers=len(self.refs)) as pool:
+                images = list(pool.map(lambda bpm: compile_reference(bpm, workdir), self.refs))
+        (image, bpm_a), (image_b, bpm_b) = zip(images, self.refs)
+        sites = find_period_sites(image, clock_period_ms(bpm_a),
+                                  image_b, clock_period_ms(bpm_b))
+        changed = []
+        for bpm in self.bpms:
+            data = encode_variant(image, sites, bpm, self.product)
+            if self.images.get(bpm) != data:
+                (BPM_BUILDS_DIR / syx_name(bpm)).write_bytes(data)
+                self.images[bpm] = data
+                changed.append(bpm)
+        return changed
+
+    def build_compiled(self):
+        """Compile the BPMs whose cache key changed, return the ones that built"""
+        keys = {bpm: cache_key(bpm) for bpm in self.bpms}
+        affected = [bpm for bpm in self.bpms if self.keys.get(bpm) != keys[bpm]]
+        if not affected:
+            return []
+        results = build_library(affected, BPM_BUILDS_DIR, jobs=self.jobs, cache=self.cache)
+        failed = [r for r in results if not r['ok']]
+        if failed:
+            raise BuildError(f"{len(failed)} of {len(results)} builds failed, "
+                             f"see {BPM_BUILDS_DIR / 'logs'}")
+        self.keys.update((r['bpm'], keys[r['bpm']]) for r in results)
+        return [r['bpm'] for r in results]
+
+    def rebuild(self):
+        """Bring bpm-builds/ up to date with the source"""
+        start = time.perf_counter()
+        if self.builder == 'patch':
+            changed = self.build_patched()
+        else:
+            changed = self.build_compiled()
+        elapsed = time.perf_counter() - start
+        listed = ", ".join(map(str, changed[:12])) + (" ..." if len(changed) > 12 else "")
+        print(f"✓ {len(changed)} of {len(self.bpms)} variants updated ({elapsed:.1f}s)"
+              + (f": {listed}" if changed else ""))
+
+    def refresh_page(self):
+        """Re-embed the library, encoding only new or changed payloads"""
+        if not embed_firmwares.scan_library():
+            print("⚠ No .syx files in bpm-builds/, page not written")
+            return
+        if self.manifest is not None:
+            self.manifest = self.manifest.next_run()
+        self.manifest = embed_firmwares.embed(self.embed_args, manifest=self.manifest)
+
+    def update(self, groups):
+        """Handle a settled set of changed groups, return False if the rebuild failed"""
+        ok = True
+        if groups & {'source', 'config'}:
+            try:
+                self.rebuild()
+            except (BuildError, PatchError, hextosyx.HexToSyxError) as e:
+                print(f"✗ Rebuild failed: {e}")
+                print("  Keeping the previous library")
+                ok = False
+                if 'library' not in groups:
+                    return ok
+        self.refresh_page()
+        return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Watch the firmware source and keep the library page up to date")
+    parser.add_argument('--bpms', type=parse_bpm_list,
+                        help="BPMs to build, e.g. 60-240 or 120,140 (default: the library list)")
+    parser.add_argument('--builder', choices=['patch', 'xc8'], default='patch',
+                        help="patch: compile two references and patch the rest; "
+                             "xc8: compile every changed variant")
+    parser.add_argument('--refs', nargs=2, type=int, default=REFERENCE_BPMS,
+                        metavar=('BPM_A', 'BPM_B'),
+                        help="reference BPMs for the patch builder (default: %(default)s)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="parallel builds for the xc8 builder (default: CPU count)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="don't use the build cache (xc8 builder)")
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL,
+                        help=f"seconds between polls (default: {POLL_INTERVAL})")
+    parser.add_argument('--debounce', type=float, default=DEBOUNCE,
+                        help=f"seconds without changes before rebuilding (default: {DEBOUNCE})")
+    parser.add_argument('--format', choices=['full', 'patch'], default='full',
+                        help="page format, as for embed-firmwares.py")
+    parser.add_argument('--compress', action='store_true',
+                        help="deflate the page payloads, as for embed-firmwares.py")
+    parser.add_argument('--chunk-size', type=int, metavar='N',
+                        help="load the page payloads from chunk files, as for embed-firmwares.py")
+    parser.add_argument('--once', action='store_true',
+                        help="bring the library and page up to date, then exit")
+    args = parser.parse_args()
+
+    if clock_period_ms(args.refs[0]) == clock_period_ms(args.refs[1]):
+        parser.error(f"--refs {args.refs[0]} and {args.refs[1]} have the same clock period")
+    embed_args = argparse.Namespace(format=args.format, compress=args.compress,
+                                    chunk_size=args.chunk_size, indent=None,
+                                    force=False, no_manifest=False)
+    cache = None if args.no_cache else BuildCache(CACHE_DIR)
+    watcher = LibraryWatcher(args.bpms or LIBRARY_BPMS, args.builder, tuple(args.refs),
+                             args.jobs, cache, embed_args)
+
+    print("=" * 50)
+    print("  SYNCHOLE Library Watcher")
+    print("=" * 50)
+    print()
+    print(f"Watching {SOURCE_FILE}, the makefiles and {BPM_BUILDS_DIR.name}/ "
+          f"({len(watcher.bpms)} BPMs, {args.builder} builder)")
+    print()
+
+    state = snapshot()
+    try:
+        watcher.update({'source', 'library'})
+        while not args.once:
+            # Our own writes to bpm-builds/ shouldn't trigger another round
+            state['library'] = snapshot()['library']
+            print()
+            print("Waiting for changes... (Ctrl+C to stop)")
+            new = wait_for_change(state, args.interval, args.debounce)
+            groups = {name for name in new if new[name] != state[name]}
+            state = new
+            start = time.perf_counter()
+            print()
+            print(f"Changed: {', '.join(sorted(groups))}")
+            if watcher.update(groups):
+                print(f"✓ Up to date {time.perf_counter() - start:.1f}s after the change settled")
+    except KeyboardInterrupt:
+        print()
+        print("Stopped")
+
+
+if __name__ == '__main__':
+    main()
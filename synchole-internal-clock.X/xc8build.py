@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Compile SYNCHOLE firmware variants with XC8 in scratch project copies
+
+The checked-in source is never modified: each build copies the project
+into its own directory, sets INTERNAL_CLOCK_PERIOD_MS there and runs the
+MPLAB X generated makefile.
+"""
+
+import argparse
+import contextlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import hextosyx
+import stagestats
+from buildcache import CACHE_DIR, CACHE_MAX_BYTES, BuildCache, cache_key
+from bpmconfig import (BPM_BUILDS_DIR, LIBRARY_BPMS, PRODUCT_KEY, SCRIPT_DIR,
+                       SOURCE_FILE, clock_period_ms, find_aliases,
+                       format_aliases, parse_bpm_list, set_clock_period,
+                       set_timer_params, syx_name)
+from stagestats import stage
+
+MAKEFILE = "nbproject/Makefile-default.mk"
+DIST_DIR = "dist/default/production"
+
+# Files the MPLAB X makefiles need to build the project
+PROJECT_FILES = ["Makefile", "nbproject"]
+
+
+class BuildError(Exception):
+    """Raised when a firmware variant fails to compile"""
+
+
+def timer_variant(timer):
+    """Cache key variant string for timer settings from timersearch.py"""
+    if not timer:
+        return None
+    return f"timer={timer['prescale']},{timer['reload']},{timer['ticks']}"
+
+
+def prepare_project(workdir, bpm, project_dir=SCRIPT_DIR, timer=None):
+    """Copy the project into workdir with the clock period set for a BPM
+
+    timer, an entry from a timersearch.py table, also sets the Timer0
+    prescaler and reload instead of the default 1 ms tick.
+    """
+    workdir = Path(workdir)
+    project_dir = Path(project_dir)
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    for name in PROJECT_FILES:
+        src = project_dir / name
+        if src.is_dir():
+            shutil.copytree(src, workdir / name, dirs_exist_ok=True)
+        else:
+            shutil.copy2(src, workdir / name)
+
+    source = (project_dir / SOURCE_FILE).read_text()
+    if timer:
+        source = set_timer_params(source, bpm, timer['prescale'], timer['reload'], timer['ticks'])
+    else:
+        source = set_clock_period(source, bpm)
+    (workdir / SOURCE_FILE).write_text(source)
+    return workdir
+
+
+def compile_variant(bpm, workdir, project_dir=SCRIPT_DIR, log=None, clean=False, timer=None):
+    """Build one BPM variant in workdir and return the path of its .hex
+
+    Compiler output goes to the open file log, or is discarded. Set clean
+    when workdir is reused between builds.
+    """
+    workdir = prepare_project(workdir, bpm, project_dir, timer)
+    output = log if log is not None else subprocess.DEVNULL
+
+    if clean:
+        subprocess.run(["make", "-f", MAKEFILE, "clean"], cwd=workdir,
+                       stdout=output, stderr=subprocess.STDOUT)
+
+    result = subprocess.run(["make", "-f", MAKEFILE], cwd=workdir,
+                            stdout=output, stderr=subprocess.STDOUT)
+    if result.returncode != 0:
+        raise BuildError(f"{bpm} BPM: make exited with status {result.returncode}")
+
+    hex_files = sorted((workdir / DIST_DIR).glob("*.hex"),
+                       key=lambda p: p.stat().st_mtime, reverse=True)
+    if not hex_files:
+        raise BuildError(f"{bpm} BPM: no .hex produced in {DIST_DIR}")
+    return hex_files[0]
+
+
+def convert_hex(hex_path, syx_path, product_key=PRODUCT_KEY, stats=None):
+    """Convert a .hex build to .syx in-process"""
+    try:
+        hextosyx.convert_file(hex_path, syx_path, product_key, stats)
+    except hextosyx.HexToSyxError as e:
+        raise BuildError(f"Can't convert {hex_path}: {e}") from None
+
+
+# Scratch project copy owned by the current pool worker
+_worker_dir = None
+
+
+def _init_worker(scratch_root):
+    global _worker_dir
+    _worker_dir = Path(scratch_root) / f"worker-{os.getpid()}"
+
+
+def build_job(bpm, output_dir, log_dir, cache=None, timer=None, with_stats=False):
+    """Pool job: build one BPM in this worker's project copy
+
+    Returns a result dict; failures are reported rather than raised so one
+    bad variant doesn't stop the rest of the library. With a BuildCache a
+    hit skips the compile entirely. with_stats adds a stagestats report
+    of the job as result['stats'].
+    """
+    start = time.perf_counter()
+    log_path = Path(log_dir) / f"synchole-{bpm}bpm.log"
+    syx_path = Path(output_dir) / syx_name(bpm)
+    hex_path = syx_path.with_suffix(".hex")
+    result = {'bpm': bpm, 'ok': False, 'error': None, 'log': str(log_path),
+              'syx': str(syx_path), 'hex': str(hex_path), 'cached': False}
+    stats = stagestats.StageStats('xc8build') if with_stats else None
+    with stats.file(syx_path) if stats else contextlib.nullcontext():
+        try:
+            key = cache_key(bpm, variant=timer_variant(timer)) if cache else None
+            with stage(stats, 'cache'):
+                hit = cache and cache.fetch(key, hex_path, syx_path)
+            if hit:
+                result['ok'] = result['cached'] = True
+            else:
+                with open(log_path, 'w') as log:
+                    if timer:
+                        log.write(f"{bpm} BPM, Timer0 1:{timer['prescale']} "
+                                  f"reload {timer['reload']}, {timer['ticks']} ticks\n")
+                    else:
+                        log.write(f"{bpm} BPM, period {clock_period_ms(bpm)}ms\n")
+                    log.flush()
+                    with stage(stats, 'xc8'):
+                        built = compile_variant(bpm, _worker_dir, log=log, clean=True,
+                                                timer=timer)
+                shutil.copy2(built, hex_path)
+                convert_hex(hex_path, syx_path, stats=stats)
+                if cache:
+                    with stage(stats, 'cache'):
+                        cache.store(key, hex_path, syx_path)
+                result['ok'] = True
+        except (BuildError, hextosyx.HexToSyxError, OSError, subprocess.SubprocessError,
+                ValueError) as e:
+            result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    if stats:
+        stats.count('cached' if result['cached'] else 'compiled' if result['ok'] else 'failed')
+        result['stats'] = stats.report()
+        stats.close()
+    return result
+
+
+def build_library(bpms, output_dir=BPM_BUILDS_DIR, log_dir=None, jobs=None, cache=None,
+                  timers=None, stats=None):
+    """Build BPM variants in parallel and return the job results
+
+    timers optionally maps BPMs to timersearch.py table entries. Each
+    job's stage times are added to stats, if given.
+    """
+    timers = timers or {}
+    output_dir = Path(output_dir)
+    log_dir = Path(log_dir) if log_dir else output_dir / "logs"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="synchole-build-") as scratch_root:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(scratch_root,)) as pool:
+            futures = [pool.submit(build_job, bpm, output_dir, log_dir, cache, timers.get(bpm),
+                                   stats is not None)
+                       for bpm in bpms]
+            for future in as_completed(futures):
+                result = future.result()
+                if stats:
+                    stats.merge(result.pop('stats'))
+                if result['cached']:
+                    print(f"  ✓ {result['bpm']} BPM (cached)")
+                elif result['ok']:
+                    print(f"  ✓ {result['bpm']} BPM ({result['seconds']:.1f}s)")
+                else:
+                    print(f"  ✗ {result['error']}")
+                results.append(result)
+    return sorted(results, key=lambda r: r['bpm'])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the SYNCHOLE BPM library with parallel XC8 builds")
+    parser.add_argument('--bpms', type=parse_bpm_list,
+                        help="BPMs to build, e.g. 60-240 or 120,140 "
+                             "(default: the library list)")
+    parser.add_argument('--unique-periods', action='store_true',
+                        help="skip BPMs whose clock period is already covered "
+                             "(keeps the one the clock plays closest to)")
+    parser.add_argument('--max-error', type=float, metavar='PCT',
+                        help="skip BPMs whose actual tempo is off by more than PCT%%")
+    parser.add_argument('--timer-table', type=Path, metavar='FILE',
+                        help="build with the Timer0 settings from a timersearch.py table")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="number of parallel builds (default: CPU count)")
+    parser.add_argument('--output-dir', type=Path, default=BPM_BUILDS_DIR)
+    parser.add_argument('--log-dir', type=Path,
+                        help="per-BPM compiler logs (default: OUTPUT_DIR/logs)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always compile, ignoring the build cache")
+    parser.add_argument('--cache-dir', type=Path, default=CACHE_DIR)
+    parser.add_argument('--cache-size', type=int, default=CACHE_MAX_BYTES // (1024 * 1024),
+                        help="build cache size limit in MB")
+    stagestats.add_arguments(parser)
+    args = parser.parse_args()
+
+    bpms = args.bpms or LIBRARY_BPMS
+    if args.unique_periods or args.max_error is not None:
+        from clocktable import pick_bpms
+        bpms = pick_bpms(bpms, args.max_error, args.unique_periods)
+    print("=" * 50)
+    print("  SYNCHOLE Parallel Library Builder")
+    print("=" * 50)
+    print()
+    print(f"Building {len(bpms)} firmware files with {args.jobs} workers...")
+    print()
+
+    timers = None
+    if args.timer_table:
+        from timersearch import load_table
+        try:
+            timers = load_table(args.timer_table)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        missing = [bpm for bpm in bpms if bpm not in timers]
+        if missing:
+            print(f"⚠ No timer settings for {', '.join(map(str, missing))} BPM, "
+                  f"using the default tick")
+            print()
+
+    cache = None if args.no_cache else BuildCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    start = time.perf_counter()
+    results = stagestats.run('xc8build', lambda stats: build_library(
+        bpms, args.output_dir, args.log_dir, args.jobs, cache, timers, stats), args)
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if not r['ok']]
+    cached = [r for r in results if r['cached']]
+    print()
+    print("Results:")
+    print(f"  ✓ Success: {len(results) - len(failed)} ({len(cached)} from cache)")
+    print(f"  ✗ Failed: {len(failed)}")
+    print(f"  Total: {len(results)} in {elapsed:.1f}s")
+    for r in failed:
+        print(f"    {r['bpm']} BPM - see {r['log']}")
+
+    images = {r['bpm']: Path(r['syx']).read_bytes() for r in results if r['ok']}
+    aliases = find_aliases(images)
+    if aliases:
+        print()
+        print("Identical firmware (same clock period):")
+        for line in format_aliases(aliases):
+            print(f"  {line}")
+    print()
+    print("Firmware files created in:")
+    print(f"  {args.output_dir}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()